@@ -0,0 +1,20 @@
+"""
+Active badges, cached per process and versioned through the Django cache
+(see wash/catalogue.py). Read by the gallery and by the threshold index of
+badges/signals.py; Badge saves and deletes invalidate the copy. In other
+processes the change shows after CATALOGUE_MAX_AGE_SECONDS unless the cache
+backend is shared.
+"""
+from wash.catalogue import VersionedCatalogue
+
+from .models import Badge
+
+badges = VersionedCatalogue(
+    "badges:catalogue:version",
+    lambda: Badge.objects.filter(is_active=True).order_by('rarity', 'condition_value', 'pk'),
+)
+
+
+def get_active_badges():
+    """Active badges, in gallery order."""
+    return badges.all()
@@ -1,61 +1,248 @@
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+"""
+=============================================================================
+BADGE UNLOCKING
+=============================================================================
+
+Active badges (the cached catalogue of badges/catalogue.py) are turned
+into a threshold index, once per process:
+
+    {condition_type: ([condition_value, ...] sorted, [badge_id, ...])}
+
+On a booking save, the handler knows each counter's value before and after
+the save. A bisect tells whether a threshold lies in (before, after]; if
+none does, no badge query is made at all. Otherwise every badge of that
+type up to the new value is inserted with one
+bulk_create(ignore_conflicts=True) (badges the user already holds are
+skipped by the unique (user, badge) constraint).
+
+Bulk status transitions (wash.pipeline.bulk_transition) do the same per
+user and insert the badges of every user with a single bulk_create.
+
+The index is rebuilt whenever the catalogue reloads its copy. A Badge
+save or delete drops both in the process that made it; other processes
+(web workers, run_scheduler, dispatchers) pick the change up when their
+catalogue copy reloads: at once with a shared cache backend, otherwise
+within CATALOGUE_MAX_AGE_SECONDS (see wash/catalogue.py). Until then they
+may skip a badge that was just added or lowered; users catch up on their
+next crossing of that threshold.
+
+=============================================================================
+"""
+
+from bisect import bisect_right
+from collections import defaultdict
+
 from django.db import ProgrammingError, OperationalError
-from django.db.models import Count, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
-from wash.models import Booking
+from loyalty.models import LoyaltyProfile
+from loyalty.signals import get_loyalty_profile, get_loyalty_profiles
+from wash.models import UserBookingStats
+from wash.pipeline import on_booking_change, on_bulk_status_change
+from wash.stats import user_counters_delta
+from .catalogue import badges as badge_catalogue, get_active_badges
 from .models import Badge, UserBadge
 
+# bronze = 1 ... platinum = 4 (badge condition_value for 'loyalty_tier')
+TIER_VALUES = {tier: rank for rank, (tier, _) in enumerate(LoyaltyProfile.TIER_CHOICES, 1)}
+
+# (catalogue list it was built from, BadgeThresholdIndex)
+_index = None
+
+
+# =============================================================================
+# THRESHOLD INDEX
+# =============================================================================
+
+class BadgeThresholdIndex:
+    """Active badge thresholds, grouped by condition_type."""
+
+    def __init__(self, badges):
+        grouped = defaultdict(list)
+        for condition_type, condition_value, badge_id in badges:
+            grouped[condition_type].append((condition_value, badge_id))
+
+        self._values = {}
+        self._ids = {}
+        for condition_type, items in grouped.items():
+            items.sort()
+            self._values[condition_type] = [value for value, _ in items]
+            self._ids[condition_type] = [badge_id for _, badge_id in items]
+
+    def earned(self, condition_type, before, after):
+        """
+        Badge ids earned at `after` if a threshold lies in (before, after],
+        else []. before=None checks every threshold up to `after`.
+        """
+        values = self._values.get(condition_type)
+        if not values:
+            return []
+
+        reached = bisect_right(values, after)
+        if before is not None and bisect_right(values, before) >= reached:
+            return []
+        # everything up to the new value: also catches badges added after
+        # the user went past their threshold
+        return self._ids[condition_type][:reached]
+
+
+def get_badge_index():
+    global _index
+    badges = get_active_badges()
+    if _index is None or _index[0] is not badges:
+        _index = (badges, BadgeThresholdIndex(
+            (badge.condition_type, badge.condition_value, badge.pk) for badge in badges
+        ))
+    return _index[1]
+
+
+@receiver(post_save, sender=Badge)
+@receiver(post_delete, sender=Badge)
+def invalidate_badge_index(sender, **kwargs):
+    global _index
+    _index = None
+    badge_catalogue.invalidate()
+
+
+# =============================================================================
+# UNLOCKING
+# =============================================================================
+
+def unlock_badges_for_users(progress_by_user):
+    """
+    progress_by_user: {user_id: {condition_type: (before, after)}}.
+    Grants every crossed badge, for all users, in one INSERT.
+    Returns the candidate UserBadge rows (empty when nothing was crossed).
+    """
+    if not any(progress_by_user.values()):
+        return []
+
+    index = get_badge_index()
+    rows = [
+        UserBadge(user_id=user_id, badge_id=badge_id)
+        for user_id, progress in progress_by_user.items()
+        for condition_type, (before, after) in progress.items()
+        for badge_id in index.earned(condition_type, before, after)
+    ]
+    if rows:
+        UserBadge.objects.bulk_create(rows, ignore_conflicts=True)
+    return rows
+
+
+def unlock_badges(user_id, progress):
+    """
+    progress: {condition_type: (before, after)}.
+    Grants the badges whose thresholds were crossed in one INSERT.
+    Returns the candidate badge ids (empty when nothing was crossed).
+    """
+    return [row.badge_id for row in unlock_badges_for_users({user_id: progress})]
+
+
+def counters_progress(totals, delta):
+    """
+    (before, after) of the booking counters, from the UserBookingStats values
+    after the change and the change's delta.
+    """
+    after = (
+        totals['total_bookings'],
+        totals['completed_bookings'],
+        totals['total_spent'] or 0,
+    )
+    before = [value - d for value, d in zip(after, delta)]
+    return {
+        'total_bookings': (before[0], after[0]),
+        'completed_bookings': (before[1], after[1]),
+        'total_spent': (int(before[2]), int(after[2])),
+    }
+
 
 def check_and_unlock_badge(user, condition_type, current_value):
     """Check if user should unlock any badges"""
     try:
-        badges = Badge.objects.filter(
-            is_active=True,
-            condition_type=condition_type,
-            condition_value__lte=current_value
-        )
-        
-        for badge in badges:
-            UserBadge.objects.get_or_create(user=user, badge=badge)
+        unlock_badges(user.pk, {condition_type: (None, current_value)})
     except (ProgrammingError, OperationalError):
         pass
 
 
-@receiver(post_save, sender=Booking)
-def check_booking_badges(sender, instance, created, **kwargs):
+def get_booking_totals(change):
+    """
+    Per-user booking counters (wash.UserBookingStats, already updated by the
+    wash handlers for this save), loaded once per booking save.
+    """
+    return change.cached(
+        "booking_totals",
+        lambda: UserBookingStats.objects.filter(user_id=change.booking.user_id).values(
+            'total_bookings', 'completed_bookings', 'total_spent'
+        ).first() or {'total_bookings': 0, 'completed_bookings': 0, 'total_spent': 0},
+    )
+
+
+@on_booking_change("status", "total_price")
+def check_booking_badges(change):
     """Check and unlock badges based on booking activity"""
     try:
-        user = instance.user
-        
-        # Count total bookings (excluding cancelled)
-        total_bookings = Booking.objects.filter(
-            user=user,
-            status__in=['pending', 'confirmed', 'done']
-        ).count()
-        
-        # Check booking count badges
-        check_and_unlock_badge(user, 'total_bookings', total_bookings)
-        
-        # Count completed bookings
-        completed_bookings = Booking.objects.filter(
-            user=user,
-            status='done'
-        ).count()
-        check_and_unlock_badge(user, 'completed_bookings', completed_bookings)
-        
-        # Calculate total spent
-        total_spent = Booking.objects.filter(
-            user=user,
-            status='done'
-        ).aggregate(total=Sum('total_price'))['total'] or 0
-        check_and_unlock_badge(user, 'total_spent', int(total_spent))
-        
-        # Check loyalty tier badge
-        if hasattr(user, 'loyalty'):
-            tier_values = {'bronze': 1, 'silver': 2, 'gold': 3, 'platinum': 4}
-            tier_value = tier_values.get(user.loyalty.tier, 0)
-            check_and_unlock_badge(user, 'loyalty_tier', tier_value)
-            
+        progress = {}
+
+        # Booking counters: values before this save = after - delta
+        delta = user_counters_delta(change.previous, change.current)
+        if any(delta):
+            progress.update(counters_progress(get_booking_totals(change), delta))
+
+        # Loyalty tier: only moves when the loyalty handler awarded points
+        # during this save (it records the tier it started from). On the
+        # user's first booking the starting tier counts as reached.
+        tier_before = change.cached("loyalty_tier_before", lambda: None)
+        first_booking = progress.get('total_bookings', (None, None))[0] == 0
+        if tier_before is not None or first_booking:
+            tier_after = get_loyalty_profile(change).tier
+            progress['loyalty_tier'] = (
+                None if first_booking else TIER_VALUES.get(tier_before, 0),
+                TIER_VALUES.get(tier_after, 0),
+            )
+
+        unlock_badges(change.booking.user_id, progress)
+
+    except (ProgrammingError, OperationalError):
+        pass
+
+
+@on_bulk_status_change
+def check_badges_in_bulk(batch):
+    """Badges for a bulk status transition: one pass per user, one INSERT"""
+    try:
+        deltas = {}
+        for user_id, changes in batch.by_user().items():
+            delta = [0, 0, 0]
+            for change in changes:
+                for i, d in enumerate(user_counters_delta(change.previous, change.current)):
+                    delta[i] += d
+            deltas[user_id] = delta
+
+        moved = [user_id for user_id, delta in deltas.items() if any(delta)]
+        totals = {
+            row['user_id']: row
+            for row in UserBookingStats.objects.filter(user_id__in=moved).values(
+                'user_id', 'total_bookings', 'completed_bookings', 'total_spent'
+            )
+        } if moved else {}
+
+        tiers_before = batch.cached("loyalty_tiers_before", dict)
+        profiles = get_loyalty_profiles(batch, tiers_before) if tiers_before else {}
+
+        progress_by_user = {}
+        for user_id, delta in deltas.items():
+            progress = {}
+            if user_id in totals:
+                progress.update(counters_progress(totals[user_id], delta))
+            if user_id in tiers_before:
+                progress['loyalty_tier'] = (
+                    TIER_VALUES.get(tiers_before[user_id], 0),
+                    TIER_VALUES.get(profiles[user_id].tier, 0),
+                )
+            progress_by_user[user_id] = progress
+
+        unlock_badges_for_users(progress_by_user)
+
     except (ProgrammingError, OperationalError):
         pass
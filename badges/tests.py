@@ -1,3 +1,163 @@
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from wash.models import Booking, Service
+from wash.testing import QueryBudgetMixin
+
+from . import signals
+from .models import Badge, UserBadge
+from .signals import BadgeThresholdIndex, get_badge_index, unlock_badges
+
+
+class BadgeThresholdIndexTests(TestCase):
+
+    def test_earned_only_when_a_threshold_is_crossed(self):
+        index = BadgeThresholdIndex([
+            ('total_bookings', 5, 2),
+            ('total_bookings', 1, 1),
+            ('total_bookings', 10, 3),
+        ])
+        self.assertEqual(index.earned('total_bookings', 1, 4), [])
+        self.assertEqual(index.earned('total_bookings', 4, 5), [1, 2])
+        self.assertEqual(index.earned('total_bookings', 0, 50), [1, 2, 3])
+        self.assertEqual(index.earned('total_bookings', None, 5), [1, 2])
+        self.assertEqual(index.earned('total_bookings', 5, 4), [])
+        self.assertEqual(index.earned('total_spent', 0, 1000), [])
+
+
+class BadgeUnlockTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("badges", "badges@example.com", "pwd")
+        cls.service = Service.objects.create(name="Lavage", price=50)
+        cls.first = Badge.objects.create(
+            name="Premier Pas", description="", condition_type='total_bookings', condition_value=1
+        )
+        cls.second = Badge.objects.create(
+            name="Habitué", description="", condition_type='total_bookings', condition_value=3
+        )
+
+    def setUp(self):
+        get_badge_index()
+
+    def tearDown(self):
+        # the badges are rolled back after the class: don't leak their ids
+        signals.invalidate_badge_index(sender=Badge)
+
+    def held(self):
+        return set(UserBadge.objects.filter(user=self.user).values_list('badge_id', flat=True))
+
+    def test_unlock_is_a_single_insert(self):
+        with self.assertNumQueries(1):
+            unlock_badges(self.user.pk, {'total_bookings': (0, 5)})
+        self.assertEqual(self.held(), {self.first.pk, self.second.pk})
+
+        # already held: conflicts ignored
+        unlock_badges(self.user.pk, {'total_bookings': (None, 5)})
+        self.assertEqual(UserBadge.objects.filter(user=self.user).count(), 2)
+
+    def test_no_query_when_nothing_is_crossed(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(unlock_badges(self.user.pk, {'total_bookings': (1, 2)}), [])
+
+    def test_booking_saves_unlock_badges(self):
+        for _ in range(3):
+            Booking.objects.create(user=self.user, service=self.service, total_price=50)
+        self.assertEqual(self.held(), {self.first.pk, self.second.pk})
+
+    def test_badge_save_invalidates_index(self):
+        Booking.objects.create(user=self.user, service=self.service, total_price=50)
+        self.assertEqual(self.held(), {self.first.pk})
+
+        self.second.condition_value = 1
+        self.second.save()
+        self.assertIsNone(signals._index)
+
+        unlock_badges(self.user.pk, {'total_bookings': (0, 1)})
+        self.assertEqual(self.held(), {self.first.pk, self.second.pk})
+
+    def test_index_rebuilt_after_catalogue_max_age(self):
+        # lowered by another process: no invalidation reaches this one
+        Badge.objects.filter(pk=self.second.pk).update(condition_value=1)
+        self.assertEqual(get_badge_index().earned('total_bookings', 0, 1), [self.first.pk])
+
+        later = time.monotonic() + 61
+        with mock.patch("wash.catalogue.time.monotonic", return_value=later):
+            self.assertEqual(
+                sorted(get_badge_index().earned('total_bookings', 0, 1)),
+                sorted([self.first.pk, self.second.pk]),
+            )
+
+
+class BadgePageQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("badges", "badges@example.com", "pwd")
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pwd")
+
+    def tearDown(self):
+        signals.invalidate_badge_index(sender=Badge)
+
+    def add_badges(self, count):
+        for _ in range(count):
+            badge = Badge.objects.create(
+                name=f"Badge {Badge.objects.count()}", description="",
+                condition_type='total_bookings', condition_value=1000,
+            )
+            user = User.objects.create_user(f"client{User.objects.count()}")
+            UserBadge.objects.create(user=user, badge=badge)
+            UserBadge.objects.create(user=self.user, badge=badge)
+
+    def test_gallery(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(reverse('badges-gallery'), self.add_badges)
+
+    def test_admin_changelist(self):
+        self.client.force_login(self.admin)
+        self.assertConstantQueries(reverse('admin:badges_userbadge_changelist'), self.add_badges)
+
+
+class BadgeGalleryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("collection", "collection@example.com", "pwd")
+        badges = Badge.objects.bulk_create([
+            Badge(name=f"Badge {i}", description="", condition_type='total_bookings', condition_value=10_000 + i)
+            for i in range(300)
+        ])
+        Badge.objects.create(name="Retiré", description="", condition_type='total_bookings',
+                             condition_value=1, is_active=False)
+        UserBadge.objects.bulk_create([
+            UserBadge(user=cls.user, badge=badge, is_new=i < 50) for i, badge in enumerate(badges[:200])
+        ])
+
+    def setUp(self):
+        signals.invalidate_badge_index(sender=Badge)
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        signals.invalidate_badge_index(sender=Badge)
+
+    def test_one_query_for_hundreds_of_badges(self):
+        self.client.get(reverse('badges-gallery'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('badges-gallery'))
+        page_queries = [
+            query["sql"] for query in ctx.captured_queries
+            if "django_session" not in query["sql"] and 'FROM "auth_user"' not in query["sql"]
+        ]
+        self.assertEqual(len(page_queries), 1, page_queries)
 
-# Create your tests here.
+        self.assertEqual(response.context['total_badges'], 300)
+        self.assertEqual(response.context['unlocked_count'], 200)
+        self.assertEqual(response.context['new_badges_count'], 50)
+        self.assertEqual(response.context['progress_percent'], 66)
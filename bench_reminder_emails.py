@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+"""
+=============================================================================
+BENCHMARK: REMINDER EMAIL DELIVERY (ONE CONNECTION PER MESSAGE vs POOLED)
+=============================================================================
+
+Sends N reminder emails to a fake SMTP server running in this process and
+reports messages per second for:
+
+- per-message: a new SMTP connection for every reminder (old behaviour)
+- pooled:      send_reminder_emails() reusing one connection per batch
+
+No database is needed: bookings are built in memory.
+
+USAGE:
+------
+python bench_reminder_emails.py
+python bench_reminder_emails.py --messages 500 --handshake-ms 150
+
+--handshake-ms simulates the TLS/login cost a real provider adds to every
+new connection (the fake server sleeps before its greeting).
+
+EXAMPLE OUTPUT:
+--------------
+per-message :  200 msgs in  10.41s ->   19.2 msg/s
+pooled      :  200 msgs in   0.48s ->  416.7 msg/s
+
+=============================================================================
+"""
+
+import argparse
+import os
+import socketserver
+import threading
+import time
+
+import django
+
+# Setup Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'carwash_project.settings')
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.mail import get_connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from wash.models import Booking, Service, Vehicle
+from wash.utils import send_reminder_emails
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for Django's backend: accepts and discards mail."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        time.sleep(self.server.handshake_delay)
+        self.reply("220 fake-smtp ready")
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-fake-smtp\r\n250 8BITMIME\r\n")
+            elif command.startswith("DATA"):
+                self.reply("354 end with <CRLF>.<CRLF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                self.server.received += 1
+                self.reply("250 OK queued")
+            elif command.startswith("QUIT"):
+                self.reply("221 bye")
+                return
+            else:
+                # HELO, MAIL FROM, RCPT TO, RSET, NOOP
+                self.reply("250 OK")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_delay):
+        super().__init__(("127.0.0.1", 0), FakeSMTPHandler)
+        self.handshake_delay = handshake_delay
+        self.received = 0
+
+
+def make_bookings(count):
+    """Unsaved bookings: enough for the templates and the .ics."""
+    user = User(username="bench", email="bench@example.com")
+    service = Service(name="Lavage complet", price=40, duration_minutes=45)
+    vehicle = Vehicle(owner=user, license_plate="123 TU 4567")
+    when = timezone.localtime() + timezone.timedelta(hours=3)
+
+    return [
+        Booking(
+            pk=i,
+            user=user,
+            service=service,
+            vehicle=vehicle,
+            scheduled_date=when.date(),
+            scheduled_time=when.time(),
+            scheduled_at=when,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def run(label, bookings, port, reconnect_every):
+    connection = get_connection(
+        "django.core.mail.backends.smtp.EmailBackend",
+        host="127.0.0.1",
+        port=port,
+        username="",
+        password="",
+        use_tls=False,
+        use_ssl=False,
+        fail_silently=False,
+    )
+
+    start = time.perf_counter()
+    try:
+        results = send_reminder_emails(
+            bookings, connection=connection, reconnect_every=reconnect_every
+        )
+    finally:
+        connection.close()
+    elapsed = time.perf_counter() - start
+
+    sent = sum(1 for _, ok, _ in results if ok)
+    print(f"{label:<12}: {sent:>4} msgs in {elapsed:>6.2f}s -> {sent / elapsed:>6.1f} msg/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--handshake-ms", type=float, default=50.0)
+    parser.add_argument("--batch", type=int, default=100,
+                        help="Messages per pooled connection")
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(args.handshake_ms / 1000)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    bookings = make_bookings(args.messages)
+
+    print(f'\n{"="*60}')
+    print(f"{args.messages} reminders, simulated handshake {args.handshake_ms:.0f} ms")
+    print(f'{"="*60}\n')
+
+    with override_settings(DEFAULT_FROM_EMAIL="bench@carwash.test"):
+        run("per-message", bookings, port, reconnect_every=1)
+        run("pooled", bookings, port, reconnect_every=args.batch)
+
+    server.shutdown()
+    print(f'\n{"="*60}\n')
+
+
+if __name__ == "__main__":
+    main()
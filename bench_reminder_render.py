@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+=============================================================================
+BENCHMARK: REMINDER EMAIL RENDERING (CPU PER MESSAGE)
+=============================================================================
+
+Renders the reminder bodies (emails/reminder.txt + emails/reminder.html)
+for N bookings and reports the CPU time per message for:
+
+- uncached:   render_to_string() with a non-caching loader (templates read
+              and compiled for every message)
+- per-message: render_to_string() with the cached loader (template lookup
+              and a new Context for every message)
+- batch:      the compiled templates fetched once and one Context reused,
+              as in wash.utils.iter_reminder_messages()
+- full batch: iter_reminder_messages() itself (bodies, headers, .ics)
+
+No database and no SMTP: bookings are built in memory.
+
+USAGE:
+------
+python bench_reminder_render.py
+python bench_reminder_render.py --messages 5000
+
+EXAMPLE OUTPUT:
+--------------
+uncached    : 1000 msgs,   675.0 us/msg CPU
+per-message : 1000 msgs,   199.3 us/msg CPU
+batch       : 1000 msgs,   182.9 us/msg CPU
+full batch  : 1000 msgs,   215.0 us/msg CPU
+
+=============================================================================
+"""
+
+import argparse
+import copy
+import os
+import time
+
+import django
+
+# Setup Django environment
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'carwash_project.settings')
+django.setup()
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.template import Context
+from django.template.loader import render_to_string
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from wash.models import Booking, Service, Vehicle
+from wash.utils import iter_reminder_messages, reminder_templates
+
+SITE = "http://127.0.0.1:8000"
+
+
+def make_bookings(count):
+    """Unsaved bookings: enough for the templates and the .ics."""
+    user = User(username="bench", first_name="Bench", email="bench@example.com")
+    service = Service(name="Lavage complet", price=40, duration_minutes=45)
+    vehicle = Vehicle(owner=user, license_plate="123 TU 4567")
+    when = timezone.localtime() + timezone.timedelta(hours=3)
+
+    return [
+        Booking(
+            pk=i,
+            user=user,
+            service=service,
+            vehicle=vehicle,
+            scheduled_date=when.date(),
+            scheduled_time=when.time(),
+            scheduled_at=when,
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def booking_context(booking):
+    return {
+        "user": booking.user,
+        "booking": booking,
+        "detail_url": f"{SITE}/bookings/{booking.pk}/",
+        "cancel_url": f"{SITE}/bookings/{booking.pk}/cancel/",
+        "support_email": "support@carwash.test",
+    }
+
+
+def render_per_message(bookings):
+    for booking in bookings:
+        ctx = booking_context(booking)
+        render_to_string("emails/reminder.txt", ctx)
+        render_to_string("emails/reminder.html", ctx)
+
+
+def render_batch(bookings):
+    text_template, html_template = reminder_templates()
+    context = Context({"support_email": "support@carwash.test"})
+    for booking in bookings:
+        with context.push(
+            user=booking.user,
+            booking=booking,
+            detail_url=f"{SITE}/bookings/{booking.pk}/",
+            cancel_url=f"{SITE}/bookings/{booking.pk}/cancel/",
+        ):
+            text_template.template.render(context)
+            html_template.template.render(context)
+
+
+def build_full_batch(bookings):
+    for _ in iter_reminder_messages(bookings):
+        pass
+
+
+def uncached_templates():
+    """settings.TEMPLATES with the loaders of the cached loader, uncached."""
+    templates = copy.deepcopy(settings.TEMPLATES)
+    options = templates[0]["OPTIONS"]
+    options["loaders"] = [
+        "django.template.loaders.filesystem.Loader",
+        "django.template.loaders.app_directories.Loader",
+    ]
+    return templates
+
+
+def run(label, func, bookings):
+    # warm-up outside the measure: compilation, imports
+    func(bookings[:10])
+
+    start = time.process_time()
+    func(bookings)
+    elapsed = time.process_time() - start
+
+    per_message = elapsed / len(bookings) * 1_000_000
+    print(f"{label:<12}: {len(bookings)} msgs, {per_message:>7.1f} us/msg CPU")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    bookings = make_bookings(args.messages)
+
+    print(f'\n{"="*60}')
+    print(f"{args.messages} reminders rendered (txt + html)")
+    print(f'{"="*60}\n')
+
+    with override_settings(TEMPLATES=uncached_templates()):
+        run("uncached", render_per_message, bookings)
+    run("per-message", render_per_message, bookings)
+    run("batch", render_batch, bookings)
+    with override_settings(DEFAULT_FROM_EMAIL="bench@carwash.test"):
+        run("full batch", build_full_batch, bookings)
+
+    print(f'\n{"="*60}\n')
+
+
+if __name__ == "__main__":
+    main()
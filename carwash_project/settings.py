@@ -73,7 +73,6 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
                 "django.template.context_processors.debug",
@@ -81,6 +80,15 @@ TEMPLATES = [
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
             ],
+            # Templates compilés gardés par process, DEBUG ou non (les emails
+            # de rappel sont rendus des milliers de fois par lot ; runserver
+            # vide ce cache quand un template change)
+            "loaders": [
+                ("django.template.loaders.cached.Loader", [
+                    "django.template.loaders.filesystem.Loader",
+                    "django.template.loaders.app_directories.Loader",
+                ]),
+            ],
         },
     },
 ]
@@ -171,6 +179,63 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 # How many hours before a booking to send the reminder email
 REMINDER_HOURS_BEFORE = int(os.environ.get("REMINDER_HOURS_BEFORE", 6))
 
+# The scheduler queues the reminders now due this often (wash/scheduler.py)
+REMINDER_SWEEP_INTERVAL_SECONDS = int(os.environ.get("REMINDER_SWEEP_INTERVAL_SECONDS", 60))
+
+# A reminder claimed by a sender that died is claimable again after this
+REMINDER_CLAIM_STALE_SECONDS = int(os.environ.get("REMINDER_CLAIM_STALE_SECONDS", 600))
+
+# Reminder batches reuse one SMTP connection, reopened after this many messages
+REMINDER_SMTP_MESSAGES_PER_CONNECTION = int(os.environ.get("REMINDER_SMTP_MESSAGES_PER_CONNECTION", 100))
+
+# Email outbox (wash/outbox.py): retries with exponential backoff
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get("OUTBOX_RETRY_BASE_SECONDS", 60))
+OUTBOX_STALE_SECONDS = int(os.environ.get("OUTBOX_STALE_SECONDS", 600))
+OUTBOX_DRAIN_INTERVAL_SECONDS = int(os.environ.get("OUTBOX_DRAIN_INTERVAL_SECONDS", 30))
+
+# ============================
+# WASH BAYS / OPENING HOURS (wash/capacity.py)
+# ============================
+# Number of bookings that can be washed at the same time
+WASH_BAYS = int(os.environ.get("WASH_BAYS", 3))
+
+# Weekday (0 = Monday) -> (opening, closing), local time; missing day = closed
+WASH_OPENING_HOURS = {
+    0: ("08:00", "19:00"),
+    1: ("08:00", "19:00"),
+    2: ("08:00", "19:00"),
+    3: ("08:00", "19:00"),
+    4: ("08:00", "19:00"),
+    5: ("08:00", "19:00"),
+}
+
+# Availability API (wash/availability.py): slot size and cache lifetime
+WASH_SLOT_MINUTES = int(os.environ.get("WASH_SLOT_MINUTES", 15))
+AVAILABILITY_CACHE_SECONDS = int(os.environ.get("AVAILABILITY_CACHE_SECONDS", 300))
+
+# ============================
+# CACHE
+# ============================
+# Local memory by default (per process; also what the tests use). Set
+# CACHE_BACKEND / CACHE_LOCATION to share the cache between workers, e.g.
+#   CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "carwash"),
+    }
+}
+
+# Service / reward / badge catalogues (wash/catalogue.py): each process
+# reloads its copy after this many seconds, so a change reaches the other
+# processes within that delay even when the cache is not shared
+CATALOGUE_MAX_AGE_SECONDS = int(os.environ.get("CATALOGUE_MAX_AGE_SECONDS", 60))
+
+# Customer home page context, cached per user (wash/dashboard.py)
+HOME_CACHE_SECONDS = int(os.environ.get("HOME_CACHE_SECONDS", 300))
+
 # Logging configuration for scheduler
 LOGGING = {
     'version': 1,
@@ -195,5 +260,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'wash.outbox': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
@@ -4,19 +4,20 @@
 CHECK SCHEDULED REMINDER JOBS
 =============================================================================
 
-This utility script displays all scheduled reminder email jobs.
+This utility script displays the scheduler's jobs (the periodic reminder
+sweep and outbox drain) and the reminders waiting in the outbox.
 
 WHAT IT DOES:
 -------------
 - Connects to the Django database
 - Queries the django_apscheduler_djangojob table
-- Shows all scheduled reminder jobs with timing information
-- Helps verify that emails are scheduled correctly
+- Shows the periodic jobs with timing information
+- Counts the reminders queued in the outbox
+- Helps verify that emails are sent correctly
 
 WHEN TO USE:
 ------------
-- After creating a booking to verify reminder was scheduled
-- To see when upcoming reminders will be sent
+- To see when the next sweep / outbox drain runs
 - To troubleshoot if emails aren't being sent
 - To monitor the automatic reminder system
 
@@ -32,13 +33,15 @@ Current time: 2026-01-04 13:30:00
 
 Scheduled Jobs: 2
 
-[PENDING] Job: booking_reminder_125
-  Next run: 14:00:00
-  In: 30.0 minutes
+[PENDING] Job: sweep_reminders
+  Next run: 2026-01-04 13:31:00
+  In: 1.0 minutes
 
-[PENDING] Job: booking_reminder_126
-  Next run: 08:00:00
-  In: 1110.0 minutes
+[PENDING] Job: drain_outbox
+  Next run: 2026-01-04 13:30:30
+  In: 0.5 minutes
+
+Reminders waiting in the outbox: 3
 
 ============================================================
 
@@ -52,16 +55,17 @@ UNDERSTANDING THE OUTPUT:
 TROUBLESHOOTING:
 ----------------
 No jobs found:
-- Bookings might all be less than 6 hours away (sent immediately)
-- Or no bookings have been created yet
+- The scheduler has not been started yet (python manage.py run_scheduler)
 
 Jobs showing [OVERDUE]:
-- Django was stopped when the job should have run
-- Restart Django and the job will run immediately
+- run_scheduler was stopped when the job should have run
+- Restart run_scheduler and the job will run immediately
 
-Job missing:
-- Check if reminder was already sent (booking.reminder_sent = True)
+Reminder missing:
+- Check if reminder was already sent (booking.reminder_state = 'sent')
 - Check if booking was cancelled
+- Reminders are queued only once the booking is less than
+  REMINDER_HOURS_BEFORE away
 
 =============================================================================
 """
@@ -76,6 +80,8 @@ django.setup()
 from django_apscheduler.models import DjangoJob
 from django.utils import timezone
 
+from wash.models import OutboundEmail
+
 # Get all scheduled jobs from database
 jobs = DjangoJob.objects.all()
 now = timezone.now()
@@ -88,10 +94,7 @@ print(f'{"="*60}\n')
 # Check if any jobs are scheduled
 if jobs.count() == 0:
     print('No scheduled jobs found.')
-    print('\nThis is normal if:')
-    print('- All bookings are less than 6 hours away (emails sent immediately)')
-    print('- No bookings have been created yet')
-    print('- All reminders have already been sent\n')
+    print('\nStart the scheduler once (python manage.py run_scheduler): it creates its periodic jobs.\n')
 else:
     print(f'Scheduled Jobs: {jobs.count()}\n')
 
@@ -120,6 +123,9 @@ else:
                 print(f'[OVERDUE] Job: {job_id}')
                 print(f'  Should have run at: {next_run.strftime("%Y-%m-%d %H:%M:%S")}')
                 print(f'  Overdue by: {abs(diff_minutes):.1f} minutes')
-                print(f'  (Will run when Django starts)\n')
+                print(f'  (Will run when run_scheduler starts)\n')
+
+waiting = OutboundEmail.objects.filter(kind='reminder', status__in=['pending', 'sending']).count()
+print(f'Reminders waiting in the outbox: {waiting}\n')
 
 print(f'{"="*60}\n')
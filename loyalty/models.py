@@ -1,6 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.lookups import GreaterThanOrEqual
 from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 
 class LoyaltyProfile(models.Model):
@@ -23,40 +26,90 @@ class LoyaltyProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # (tier, total_earned needed), highest first; below the last: bronze
+    TIER_THRESHOLDS = [
+        ('platinum', 1000),
+        ('gold', 500),
+        ('silver', 200),
+    ]
+    TIER_ICONS = {'bronze': '🥉', 'silver': '🥈', 'gold': '🥇', 'platinum': '💎'}
+
     def __str__(self):
         return f"{self.user.username} - {self.points} pts ({self.tier})"
 
+    @classmethod
+    def tier_table(cls):
+        """Every tier, lowest first: [{'tier', 'label', 'icon', 'threshold'}]."""
+        labels = dict(cls.TIER_CHOICES)
+        thresholds = [('bronze', 0)] + list(reversed(cls.TIER_THRESHOLDS))
+        return [
+            {'tier': tier, 'label': labels[tier], 'icon': cls.TIER_ICONS[tier], 'threshold': threshold}
+            for tier, threshold in thresholds
+        ]
+
+    @property
+    def tier_icon(self):
+        return self.TIER_ICONS.get(self.tier, '')
+
+    def next_tier(self):
+        """{'next': label, 'needed': points} towards the next tier; next is None at the top."""
+        for row in self.tier_table():
+            if self.total_earned < row['threshold']:
+                return {'next': row['label'], 'needed': row['threshold'] - self.total_earned}
+        return {'next': None, 'needed': 0}
+
+    @classmethod
+    def tier_expression(cls, total_earned):
+        """SQL CASE giving the tier for a total_earned expression."""
+        return models.Case(
+            *[
+                models.When(GreaterThanOrEqual(total_earned, threshold), then=models.Value(tier))
+                for tier, threshold in cls.TIER_THRESHOLDS
+            ],
+            default=models.Value('bronze'),
+            output_field=models.CharField(),
+        )
+
+    def _apply(self, updates, **filters):
+        """
+        Single UPDATE on this profile (optionally conditional), then reload
+        the changed fields. Returns False when no row matched.
+        """
+        updated = LoyaltyProfile.objects.filter(pk=self.pk, **filters).update(
+            updated_at=timezone.now(), **updates
+        )
+        if updated:
+            self.refresh_from_db(fields=[*updates, 'updated_at'])
+        return bool(updated)
+
     def update_tier(self):
         """Auto-update tier based on total earned points"""
-        if self.total_earned >= 1000:
-            self.tier = 'platinum'
-        elif self.total_earned >= 500:
-            self.tier = 'gold'
-        elif self.total_earned >= 200:
-            self.tier = 'silver'
-        else:
-            self.tier = 'bronze'
-        self.save(update_fields=['tier'])
+        self._apply({'tier': self.tier_expression(F('total_earned'))})
 
     def add_points(self, amount, reason=""):
-        """Add points and update tier"""
-        self.points += amount
-        self.total_earned += amount
-        self.save()
-        self.update_tier()
-
-        PointTransaction.objects.create(
-            profile=self,
-            amount=amount,
-            transaction_type='earn',
-            reason=reason
-        )
+        """Add points and update tier (one UPDATE + the ledger insert)"""
+        total_earned = F('total_earned') + amount
+        with transaction.atomic():
+            self._apply({
+                'points': F('points') + amount,
+                'total_earned': total_earned,
+                'tier': self.tier_expression(total_earned),
+            })
+            PointTransaction.objects.create(
+                profile=self,
+                amount=amount,
+                transaction_type='earn',
+                reason=reason
+            )
 
     def deduct_points(self, amount, reason=""):
-        """Deduct points (for redemptions)"""
-        if self.points >= amount:
-            self.points -= amount
-            self.save(update_fields=['points'])
+        """
+        Deduct points (for redemptions). The balance check is part of the
+        UPDATE, so concurrent redemptions cannot overspend.
+        """
+        with transaction.atomic():
+            if not self._apply({'points': F('points') - amount}, points__gte=amount):
+                return False
 
             PointTransaction.objects.create(
                 profile=self,
@@ -65,7 +118,6 @@ class LoyaltyProfile(models.Model):
                 reason=reason
             )
             return True
-        return False
 
 
 class Reward(models.Model):
@@ -0,0 +1,20 @@
+"""
+Active rewards, cached per process and versioned through the Django cache
+(see wash/catalogue.py). Reward saves and deletes invalidate the copy
+(loyalty/signals.py). The copy can lag behind the database (other
+processes), so it is for display: redeem_reward reads the Reward row itself.
+"""
+from wash.catalogue import VersionedCatalogue
+
+from .models import Reward
+
+rewards = VersionedCatalogue(
+    "loyalty:rewards:version",
+    lambda: Reward.objects.filter(is_active=True).order_by('points_cost', 'pk'),
+)
+
+
+def get_active_rewards():
+    """Active rewards, cheapest first."""
+    return rewards.all()
+
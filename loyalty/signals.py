@@ -1,10 +1,11 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.db import ProgrammingError, OperationalError
 
-from wash.models import Booking
-from .models import LoyaltyProfile
+from wash.pipeline import on_booking_change, on_bulk_status_change
+from .models import LoyaltyProfile, Reward
+from .rewards import rewards
 
 User = get_user_model()
 
@@ -19,17 +20,81 @@ def create_loyalty_profile(sender, instance, created, **kwargs):
         pass
 
 
-@receiver(post_save, sender=Booking)
-def award_points_for_booking(sender, instance, created, **kwargs):
+@receiver(post_save, sender=Reward)
+@receiver(post_delete, sender=Reward)
+def invalidate_reward_catalogue(sender, **kwargs):
+    rewards.invalidate()
+
+
+def get_loyalty_profile(change):
+    """Loyalty profile of the booking's user, loaded once per booking save."""
+    return change.cached(
+        "loyalty_profile",
+        lambda: LoyaltyProfile.objects.get_or_create(user_id=change.booking.user_id)[0],
+    )
+
+
+@on_booking_change("status")
+def award_points_for_booking(change):
     """Award points when booking is marked as done"""
-    if instance.status == 'done':
-        try:
-            profile, _ = LoyaltyProfile.objects.get_or_create(user=instance.user)
-            
-            if not hasattr(instance, '_points_awarded'):
-                points = int(instance.total_price / 10)
-                if points > 0:
-                    profile.add_points(points, f"Réservation #{instance.pk} terminée")
-                    instance._points_awarded = True
-        except (ProgrammingError, OperationalError):
-            pass
+    if not change.became('done'):
+        return
+
+    instance = change.booking
+    try:
+        points = int(instance.total_price / 10)
+        if points > 0:
+            profile = get_loyalty_profile(change)
+            # read by the badges handler to detect a tier change
+            change.cached("loyalty_tier_before", lambda: profile.tier)
+            profile.add_points(points, f"Réservation #{instance.pk} terminée")
+    except (ProgrammingError, OperationalError):
+        pass
+
+
+def get_loyalty_profiles(batch, user_ids):
+    """
+    Loyalty profiles of a bulk transition's users ({user_id: profile}),
+    loaded with one query and shared by the bulk handlers.
+    """
+    profiles = batch.cached("loyalty_profiles", dict)
+    missing = set(user_ids) - set(profiles)
+    if missing:
+        for profile in LoyaltyProfile.objects.filter(user_id__in=missing):
+            profiles[profile.user_id] = profile
+        for user_id in missing - set(profiles):
+            profiles[user_id] = LoyaltyProfile.objects.get_or_create(user_id=user_id)[0]
+    return profiles
+
+
+@on_bulk_status_change
+def award_points_in_bulk(batch):
+    """One award (and one ledger entry) per user for a bulk "done" transition"""
+    awards = {}
+    for user_id, changes in batch.by_user().items():
+        done = [change.booking for change in changes if change.became('done')]
+        points = sum(int(booking.total_price / 10) for booking in done)
+        if points > 0:
+            awards[user_id] = (points, done)
+    if not awards:
+        return
+
+    try:
+        profiles = get_loyalty_profiles(batch, awards)
+        # read by the badges bulk handler to detect tier changes
+        tiers_before = batch.cached("loyalty_tiers_before", dict)
+
+        for user_id, (points, done) in awards.items():
+            profile = profiles[user_id]
+            tiers_before[user_id] = profile.tier
+
+            refs = ", ".join(f"#{booking.pk}" for booking in done)
+            reason = (
+                f"Réservation {refs} terminée" if len(done) == 1
+                else f"Réservations {refs} terminées"
+            )
+            if len(reason) > 200:
+                reason = f"{len(done)} réservations terminées"
+            profile.add_points(points, reason)
+    except (ProgrammingError, OperationalError):
+        pass
@@ -1,3 +1,207 @@
-from django.test import TestCase
+import threading
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from django.test.utils import CaptureQueriesContext
+from wash.testing import QueryBudgetMixin
+
+from .models import LoyaltyProfile, PointTransaction, Redemption, Reward
+from .rewards import get_active_rewards
+from .signals import invalidate_reward_catalogue
+
+
+class LoyaltyPointsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("fidele", "fidele@example.com", "pwd")
+
+    def setUp(self):
+        self.profile = LoyaltyProfile.objects.get(user=self.user)
+
+    def test_add_points_updates_tier_in_one_update(self):
+        # SAVEPOINT + UPDATE + refresh + ledger INSERT + RELEASE
+        with self.assertNumQueries(5):
+            self.profile.add_points(250, "test")
+
+        self.assertEqual((self.profile.points, self.profile.total_earned), (250, 250))
+        self.assertEqual(self.profile.tier, 'silver')
+        self.assertEqual(LoyaltyProfile.objects.get(pk=self.profile.pk).tier, 'silver')
+
+    def test_tier_thresholds(self):
+        for total, tier in [(0, 'bronze'), (199, 'bronze'), (200, 'silver'),
+                            (500, 'gold'), (1000, 'platinum')]:
+            LoyaltyProfile.objects.filter(pk=self.profile.pk).update(total_earned=total)
+            self.profile.update_tier()
+            self.assertEqual(self.profile.tier, tier)
+
+    def test_next_tier(self):
+        for total, expected in [(0, {'next': 'Silver', 'needed': 200}),
+                                (450, {'next': 'Gold', 'needed': 50}),
+                                (1000, {'next': None, 'needed': 0})]:
+            self.profile.total_earned = total
+            self.assertEqual(self.profile.next_tier(), expected)
+        self.assertEqual(
+            [(row['tier'], row['threshold']) for row in LoyaltyProfile.tier_table()],
+            [('bronze', 0), ('silver', 200), ('gold', 500), ('platinum', 1000)],
+        )
+
+    def test_deduct_points_never_overspends(self):
+        self.profile.add_points(100)
+        stale = LoyaltyProfile.objects.get(pk=self.profile.pk)
+
+        self.assertTrue(self.profile.deduct_points(80, "reward"))
+        # the stale copy still believes it has 100 points
+        self.assertFalse(stale.deduct_points(80, "reward"))
+
+        self.assertEqual(LoyaltyProfile.objects.get(pk=self.profile.pk).points, 20)
+        self.assertEqual(PointTransaction.objects.filter(profile=self.profile).count(), 2)
+
+
+class LoyaltyConcurrencyTests(TransactionTestCase):
+    """Parallel awards and redemptions on one profile lose nothing."""
+
+    AWARDS = 40
+    AWARD = 5
+    REDEMPTIONS = 20
+    COST = 20
+
+    def test_parallel_awards_and_redemptions(self):
+        user = User.objects.create_user("stress", "stress@example.com", "pwd")
+        profile_id = LoyaltyProfile.objects.get(user=user).pk
+
+        jobs = ['earn'] * self.AWARDS + ['spend'] * self.REDEMPTIONS
+        barrier = threading.Barrier(len(jobs))
+        redeemed = []
+        errors = []
+
+        def worker(kind):
+            try:
+                # each thread works on its own (possibly stale) copy
+                profile = LoyaltyProfile.objects.get(pk=profile_id)
+                barrier.wait()
+                if kind == 'earn':
+                    profile.add_points(self.AWARD, "stress")
+                elif profile.deduct_points(self.COST, "stress"):
+                    redeemed.append(1)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(kind,)) for kind in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        profile = LoyaltyProfile.objects.get(pk=profile_id)
+        earned = self.AWARDS * self.AWARD
+
+        self.assertEqual(profile.total_earned, earned)
+        self.assertEqual(profile.points, earned - len(redeemed) * self.COST)
+        self.assertGreaterEqual(profile.points, 0)
+        self.assertEqual(profile.tier, 'silver')
+
+        ledger = PointTransaction.objects.filter(profile_id=profile_id)
+        self.assertEqual(sum(ledger.values_list('amount', flat=True)), profile.points)
+        self.assertEqual(ledger.filter(transaction_type='spend').count(), len(redeemed))
+
+
+class LoyaltyPageQueryBudgetTests(QueryBudgetMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("fidele", "fidele@example.com", "pwd")
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pwd")
+
+    def tearDown(self):
+        invalidate_reward_catalogue(sender=Reward)
+
+    def add_redemptions(self, count):
+        for _ in range(count):
+            user = User.objects.create_user(f"client{User.objects.count()}")
+            for owner in (user, self.user):
+                reward = Reward.objects.create(name=f"Reward {Reward.objects.count()}", points_cost=10)
+                LoyaltyProfile.objects.get(user=owner).add_points(10, "Bienvenue")
+                Redemption.objects.create(user=owner, reward=reward, points_spent=10)
+
+    def test_dashboard(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(reverse('loyalty-dashboard'), self.add_redemptions)
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        for name in ('loyaltyprofile', 'redemption', 'pointtransaction'):
+            with self.subTest(name):
+                self.assertConstantQueries(
+                    reverse(f'admin:loyalty_{name}_changelist'), self.add_redemptions
+                )
+
+
+class LoyaltyDashboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("fidele", "fidele@example.com", "pwd")
+        cls.wash = Reward.objects.create(name="Lavage offert", points_cost=100)
+        profile = LoyaltyProfile.objects.get(user=cls.user)
+        profile.add_points(450, "Bienvenue")
+        for _ in range(7):
+            Redemption.objects.create(user=cls.user, reward=cls.wash, points_spent=100)
+            profile.add_points(10, "Réservation")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        invalidate_reward_catalogue(sender=Reward)
+
+    def test_three_queries(self):
+        self.client.get(reverse('loyalty-dashboard'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('loyalty-dashboard'))
+        page_queries = [
+            query["sql"] for query in ctx.captured_queries
+            if "django_session" not in query["sql"] and 'FROM "auth_user"' not in query["sql"]
+        ]
+        self.assertLessEqual(len(page_queries), 3, page_queries)
+
+        self.assertEqual(len(response.context['recent_transactions']), 5)
+        self.assertEqual(len(response.context['my_redemptions']), 5)
+        self.assertEqual(response.context['tier_info'], {'next': 'Platinum', 'needed': 480})
+        self.assertContains(response, "Lavage offert")
+
+    def test_reward_changes_reload_the_catalogue(self):
+        self.assertEqual(get_active_rewards(), [self.wash])
+        with self.captureOnCommitCallbacks(execute=True):
+            polish = Reward.objects.create(name="Lustrage", points_cost=50)
+        self.assertEqual(get_active_rewards(), [polish, self.wash])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            polish.is_active = False
+            polish.save()
+        self.assertEqual(get_active_rewards(), [self.wash])
+
+    def test_redeem_unknown_reward(self):
+        response = self.client.post(reverse('redeem-reward', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_redeem_reads_the_current_reward(self):
+        # changed by another process: this process's catalogue is stale
+        self.assertEqual(get_active_rewards()[0].points_cost, 100)
+        Reward.objects.filter(pk=self.wash.pk).update(points_cost=150)
+        points = LoyaltyProfile.objects.get(user=self.user).points
+
+        self.client.post(reverse('redeem-reward', args=[self.wash.pk]))
+        self.assertEqual(LoyaltyProfile.objects.get(user=self.user).points, points - 150)
+        self.assertEqual(Redemption.objects.latest('pk').points_spent, 150)
+
+        Reward.objects.filter(pk=self.wash.pk).update(is_active=False)
+        response = self.client.post(reverse('redeem-reward', args=[self.wash.pk]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(LoyaltyProfile.objects.get(user=self.user).points, points - 150)
@@ -1,50 +1,78 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import LoyaltyProfile, Reward, Redemption
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404
+from .models import LoyaltyProfile, PointTransaction, Redemption, Reward
+from .rewards import get_active_rewards
 
 
 @login_required
 def loyalty_dashboard(request):
     """User loyalty dashboard"""
-    profile, created = LoyaltyProfile.objects.get_or_create(user=request.user)
-
-    tier_info = {
-        'bronze': {'next': 'Silver', 'needed': 200 - profile.total_earned if profile.total_earned < 200 else 0},
-        'silver': {'next': 'Gold', 'needed': 500 - profile.total_earned if profile.total_earned < 500 else 0},
-        'gold': {'next': 'Platinum', 'needed': 1000 - profile.total_earned if profile.total_earned < 1000 else 0},
-        'platinum': {'next': None, 'needed': 0},
-    }
-
-    available_rewards = Reward.objects.filter(is_active=True)
-    recent_transactions = profile.transactions.all()[:5]
-    my_redemptions = Redemption.objects.filter(user=request.user, used=False)[:5]
+    # profile + its 5 latest transactions + 5 pending redemptions: 3 queries;
+    # rewards come from the cached catalogue (loyalty/rewards.py)
+    profile = (
+        LoyaltyProfile.objects
+        .filter(user=request.user)
+        .select_related('user')
+        .prefetch_related(
+            Prefetch(
+                'transactions',
+                queryset=PointTransaction.objects.order_by('-created_at')[:5],
+                to_attr='recent_transactions',
+            ),
+            Prefetch(
+                'user__redemption_set',
+                queryset=Redemption.objects.filter(used=False).select_related('reward')[:5],
+                to_attr='pending_redemptions',
+            ),
+        )
+        .first()
+    )
+    if profile is None:
+        profile, created = LoyaltyProfile.objects.get_or_create(user=request.user)
+        profile.recent_transactions = []
+        profile.user.pending_redemptions = []
 
     return render(request, 'loyalty/dashboard.html', {
         'profile': profile,
-        'tier_info': tier_info.get(profile.tier, {}),
-        'available_rewards': available_rewards,
-        'recent_transactions': recent_transactions,
-        'my_redemptions': my_redemptions,
+        'tier_info': profile.next_tier(),
+        'tiers': LoyaltyProfile.tier_table(),
+        'available_rewards': get_active_rewards(),
+        'recent_transactions': profile.recent_transactions,
+        'my_redemptions': profile.user.pending_redemptions,
     })
 
 
 @login_required
 def redeem_reward(request, reward_id):
     """Redeem a reward"""
-    reward = get_object_or_404(Reward, pk=reward_id, is_active=True)
     profile, created = LoyaltyProfile.objects.get_or_create(user=request.user)
 
-    if profile.points >= reward.points_cost:
-        if profile.deduct_points(reward.points_cost, f"Échangé: {reward.name}"):
+    # the reward is read from the database, not from the catalogue: another
+    # process may have changed its cost or deactivated it since our copy was
+    # loaded. The row lock holds admin edits until the redemption commits;
+    # deduct_points re-checks the balance in its UPDATE.
+    with transaction.atomic():
+        reward = (
+            Reward.objects.select_for_update()
+            .filter(pk=reward_id, is_active=True)
+            .first()
+        )
+        if reward is None:
+            raise Http404("Récompense introuvable")
+        redeemed = profile.deduct_points(reward.points_cost, f"Échangé: {reward.name}")
+        if redeemed:
             Redemption.objects.create(
                 user=request.user,
                 reward=reward,
                 points_spent=reward.points_cost
             )
-            messages.success(request, f"Félicitations! Vous avez échangé {reward.name}")
-        else:
-            messages.error(request, "Erreur lors de l'échange")
+
+    if redeemed:
+        messages.success(request, f"Félicitations! Vous avez échangé {reward.name}")
     else:
         messages.error(request, "Points insuffisants pour cet échange")
 
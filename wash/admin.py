@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Service, Vehicle, Booking
+from .models import Service, Vehicle, Booking, OutboundEmail
 
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
@@ -7,4 +7,16 @@ class ServiceAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Vehicle)
-admin.site.register(Booking)
+
+
+@admin.register(Booking)
+class BookingAdmin(admin.ModelAdmin):
+    # Booking.__str__ lit user.username
+    list_select_related = ('user',)
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('booking', 'kind', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    readonly_fields = ('created_at', 'sent_at', 'locked_at')
@@ -4,13 +4,15 @@
 DJANGO APP CONFIGURATION FOR WASH APP
 =============================================================================
 
-This file configures the 'wash' Django app and initializes the automatic
-reminder email system when Django starts.
+This file configures the 'wash' Django app and registers its signals when
+Django starts.
 
 IMPORTANT: The ready() method is called automatically by Django when the
-app is loaded. This is where we:
-1. Register Django signals
-2. Start the APScheduler for reminder emails
+app is loaded, in every process: web workers, manage.py commands,
+check_jobs.py. It only registers Django signals. The APScheduler for
+reminder emails runs in its own process:
+
+    python manage.py run_scheduler
 
 =============================================================================
 """
@@ -42,34 +44,26 @@ class WashConfig(AppConfig):
            - This registers the post_save signal for Booking model
            - The signal will auto-schedule reminders for new bookings
 
-        2. Start the APScheduler
-           - Starts background scheduler that runs 24/7
-           - Scheduler executes reminder email jobs at scheduled times
-           - Jobs are stored in database and survive restarts
+        The APScheduler is NOT started here: with N web workers that
+        meant N schedulers polling the job store (and jobs firing more
+        than once), plus a scheduler thread in every manage.py command.
+        It is hosted by `python manage.py run_scheduler`, which holds a
+        PostgreSQL advisory lock so only one process runs it.
 
         EXECUTION ORDER:
         ----------------
-        1. Django starts (python manage.py runserver)
+        1. Django starts (python manage.py runserver, gunicorn, ...)
         2. Django loads installed apps
         3. WashConfig.ready() is called
         4. Signals are registered
-        5. Scheduler starts
-        6. App is ready to handle requests
-        7. When bookings are created, signals trigger automatically
-
-        IMPORTANT NOTES:
-        ----------------
-        - This method can be called multiple times in some Django
-          configurations (e.g., with --noreload flag)
-        - The scheduler.start() method handles this gracefully
-          (won't start twice)
-        - If Django is restarted, the scheduler resumes scheduled jobs
-          from the database
+        5. App is ready to handle requests
+        6. When bookings are created, signals trigger automatically
 
         TROUBLESHOOTING:
         ----------------
-        If you don't see "[OK] APScheduler started successfully" in console:
-        - Check for errors in this method
+        If reminder emails are not sent:
+        - Check that `python manage.py run_scheduler` is running and printed
+          "verrou acquis" (the others print "en attente")
         - Verify django-apscheduler is installed
         - Check INSTALLED_APPS includes 'django_apscheduler'
         """
@@ -82,15 +76,6 @@ class WashConfig(AppConfig):
         # in wash/signals.py with Django's signal system
         import wash.signals
 
-        # =======================================================================
-        # STEP 2: Start the APScheduler
-        # =======================================================================
-        # Import and call start_scheduler() from wash/scheduler.py
-        # This starts the background scheduler that runs reminder email jobs
-        from wash.scheduler import start_scheduler
-        start_scheduler()
-
         # At this point:
         # - Signals are active and will fire when bookings are saved
-        # - Scheduler is running and will execute scheduled jobs
-        # - System is ready for automatic reminder emails!
+        # - Reminder emails are queued/sent by the run_scheduler process
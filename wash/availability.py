@@ -0,0 +1,163 @@
+# wash/availability.py
+"""
+=============================================================================
+FREE SLOTS FOR THE BOOKING FORM
+=============================================================================
+
+Each open day is cut into WASH_SLOT_MINUTES slots from opening to closing.
+The day's occupancy is one byte per slot: how many active bookings overlap
+that slot. It is computed from the Booking table and cached:
+
+    cache key "wash:occupancy:<day>:<slot minutes>" -> bytes
+
+A service of duration D can start on a slot when the ceil(D / slot)
+consecutive slots from there all have fewer than WASH_BAYS bookings.
+
+COST:
+-----
+- a month view reads every day's occupancy with one cache.get_many(); the
+  days not cached are rebuilt with a single range query on
+  booking_occupancy_idx, then stored with set_many()
+- finding the free starts is one pass over each day's slots
+
+INVALIDATION:
+-------------
+wash.signals drops the cached occupancy of the day(s) a booking touches
+when it is created, moved, cancelled, switched to another service or
+deleted (after commit). AVAILABILITY_CACHE_SECONDS bounds how long another
+process's cache can stay stale.
+
+The answer is a guide for the form: slots are coarse (a booking at 10:05
+blocks the 10:00 slot), and wash.capacity.reserve() remains the exact check.
+
+=============================================================================
+"""
+
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from wash.capacity import bay_count, opening_interval
+from wash.models import Booking
+
+
+def slot_minutes():
+    return getattr(settings, "WASH_SLOT_MINUTES", 15)
+
+
+def cache_key(day):
+    return f"wash:occupancy:{day.isoformat()}:{slot_minutes()}"
+
+
+def day_grid(day):
+    """(opening, closing, number of slots) for `day`, or None if closed."""
+    hours = opening_interval(day)
+    if hours is None:
+        return None
+    opening, closing = hours
+    slots = int((closing - opening) / timezone.timedelta(minutes=slot_minutes()))
+    return opening, closing, slots
+
+
+def build_occupancy(opening, slots, intervals):
+    """Bookings overlapping each slot, as bytes (one per slot)."""
+    step = timezone.timedelta(minutes=slot_minutes())
+    counts = bytearray(slots)
+    for start, end in intervals:
+        first = max(math.floor((start - opening) / step), 0)
+        last = min(math.ceil((end - opening) / step), slots)
+        for i in range(first, last):
+            counts[i] = min(counts[i] + 1, 255)
+    return bytes(counts)
+
+
+def occupancy_for_days(days):
+    """
+    {day: (grid, occupancy)} for the open days among `days` (closed days are
+    left out). Cached days cost nothing; the others one query in total.
+    """
+    grids = {}
+    for day in days:
+        grid = day_grid(day)
+        if grid is not None:
+            grids[day] = grid
+    if not grids:
+        return {}
+
+    keys = {cache_key(day): day for day in grids}
+    cached = cache.get_many(list(keys))
+    result = {keys[key]: (grids[keys[key]], value) for key, value in cached.items()}
+
+    missing = [day for day in grids if day not in result]
+    if missing:
+        intervals = {day: [] for day in missing}
+        rows = (
+            Booking.objects
+            .filter(
+                scheduled_at__isnull=False,
+                scheduled_at__gte=min(grids[day][0] for day in missing),
+                scheduled_at__lt=max(grids[day][1] for day in missing),
+            )
+            .exclude(status="cancelled")
+            .values_list("scheduled_at", "scheduled_end")
+        )
+        for start, end in rows:
+            day = timezone.localdate(start)
+            if day in intervals:
+                intervals[day].append((start, end))
+
+        fresh = {}
+        for day in missing:
+            opening, _, slots = grids[day]
+            occupancy = build_occupancy(opening, slots, intervals[day])
+            result[day] = (grids[day], occupancy)
+            fresh[cache_key(day)] = occupancy
+        cache.set_many(fresh, getattr(settings, "AVAILABILITY_CACHE_SECONDS", 300))
+
+    return result
+
+
+def free_starts(grid, occupancy, duration_minutes, not_before=None):
+    """Start times (aware datetimes) where `duration_minutes` fits in a free bay."""
+    opening, _, _ = grid
+    step = timezone.timedelta(minutes=slot_minutes())
+    needed = max(math.ceil(duration_minutes / slot_minutes()), 1)
+    bays = bay_count()
+
+    starts = []
+    run = 0
+    for i, count in enumerate(occupancy):
+        run = run + 1 if count < bays else 0
+        if run >= needed:
+            start = opening + (i - needed + 1) * step
+            if not_before is None or start >= not_before:
+                starts.append(start)
+    return starts
+
+
+def free_slots(service, days):
+    """{day: ["HH:MM", ...]} of free start times for `service` on `days`."""
+    now = timezone.now()
+    occupancy = occupancy_for_days(days)
+
+    result = {}
+    for day in days:
+        if day not in occupancy:
+            result[day] = []
+            continue
+        grid, counts = occupancy[day]
+        result[day] = [
+            timezone.localtime(start).strftime("%H:%M")
+            for start in free_starts(grid, counts, service.duration_minutes, not_before=now)
+        ]
+    return result
+
+
+def invalidate_days(days):
+    """Drop the cached occupancy of `days` once the current transaction commits."""
+    keys = [cache_key(day) for day in days if day is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
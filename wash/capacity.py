@@ -0,0 +1,147 @@
+# wash/capacity.py
+"""
+=============================================================================
+WASH BAY CAPACITY
+=============================================================================
+
+A booking occupies one wash bay from scheduled_at to scheduled_end
+(scheduled_at + Service.duration_minutes). At no instant may more than
+WASH_BAYS bookings overlap, and every booking must fit in the opening hours
+of its day.
+
+    from wash.capacity import reserve
+
+    reserve(booking)   # checks the slot and saves, or raises ValidationError
+
+CONCURRENCY:
+------------
+reserve() takes a PostgreSQL transaction-level advisory lock for the
+booking's day before checking and saving. Two requests for the same day
+are serialized (for the few milliseconds of a check + INSERT), so they
+cannot both take the last bay; bookings on other days don't wait.
+
+The overlap query is a range scan on booking_occupancy_idx
+(scheduled_at INCLUDE scheduled_end, cancelled bookings left out).
+
+CONFIGURATION (settings.py):
+----------------------------
+    WASH_BAYS = 3
+    WASH_OPENING_HOURS = {0: ("08:00", "19:00"), ...}   # 0 = Monday
+
+=============================================================================
+"""
+
+from datetime import datetime, time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from wash.models import Booking
+
+# first key of pg_advisory_xact_lock(int, int): "wash bay" locks
+DAY_LOCK_NAMESPACE = 7301
+
+
+def bay_count():
+    return getattr(settings, "WASH_BAYS", 3)
+
+
+def opening_interval(day):
+    """(opening, closing) aware datetimes for `day`, or None if closed."""
+    hours = getattr(settings, "WASH_OPENING_HOURS", {}).get(day.weekday())
+    if not hours:
+        return None
+
+    tz = timezone.get_default_timezone()
+    opening, closing = (
+        timezone.make_aware(datetime.combine(day, time.fromisoformat(value)), tz)
+        for value in hours
+    )
+    return opening, closing
+
+
+def occupied_intervals(start, end, day_start, exclude_pk=None):
+    """
+    (scheduled_at, scheduled_end) of the active bookings overlapping
+    [start, end). Bookings start within opening hours, so `day_start`
+    bounds the index range scan.
+    """
+    qs = (
+        Booking.objects
+        .filter(
+            scheduled_at__isnull=False,
+            scheduled_at__gte=day_start,
+            scheduled_at__lt=end,
+            scheduled_end__gt=start,
+        )
+        .exclude(status="cancelled")
+    )
+    if exclude_pk is not None:
+        qs = qs.exclude(pk=exclude_pk)
+    return list(qs.values_list("scheduled_at", "scheduled_end"))
+
+
+def peak_occupancy(intervals, start, end):
+    """Highest number of `intervals` running at the same instant within [start, end)."""
+    events = []
+    for interval_start, interval_end in intervals:
+        events.append((max(interval_start, start), 1))
+        events.append((min(interval_end, end), -1))
+    # a booking ending at 10:00 frees its bay for one starting at 10:00
+    events.sort(key=lambda event: (event[0], event[1]))
+
+    peak = current = 0
+    for _, step in events:
+        current += step
+        peak = max(peak, current)
+    return peak
+
+
+def check_slot(booking):
+    """Raise ValidationError if the booking's slot can't be taken."""
+    start = booking.compute_scheduled_at()
+    if start is None:
+        # no date/time yet: nothing to occupy
+        return
+    end = booking.compute_scheduled_end()
+
+    hours = opening_interval(booking.scheduled_date)
+    if hours is None:
+        raise ValidationError("La station est fermée ce jour-là.", code="closed")
+
+    opening, closing = hours
+    if start < opening or end > closing:
+        raise ValidationError(
+            "Ce créneau dépasse les heures d'ouverture (%(opening)s – %(closing)s).",
+            code="outside_hours",
+            params={
+                "opening": timezone.localtime(opening).strftime("%H:%M"),
+                "closing": timezone.localtime(closing).strftime("%H:%M"),
+            },
+        )
+
+    intervals = occupied_intervals(start, end, opening, exclude_pk=booking.pk)
+    if peak_occupancy(intervals, start, end) >= bay_count():
+        raise ValidationError(
+            "Plus aucune baie de lavage n'est libre sur ce créneau.", code="full"
+        )
+
+
+def lock_day(day):
+    """Serialize reservations for `day` until the current transaction ends."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(%s, %s)", [DAY_LOCK_NAMESPACE, day.toordinal()]
+        )
+
+
+def reserve(booking):
+    """Check the booking's slot and save it, atomically per day."""
+    with transaction.atomic():
+        if booking.scheduled_date is not None:
+            lock_day(booking.scheduled_date)
+        check_slot(booking)
+        booking.save()
+    return booking
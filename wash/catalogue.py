@@ -0,0 +1,125 @@
+# wash/catalogue.py
+"""
+=============================================================================
+CATALOGUE CACHES (services, rewards)
+=============================================================================
+
+The services change a few times a year but are read on every booking form,
+on the services page, on the admin dashboard filter and for every reminder
+email. Each process keeps the catalogue (Service rows, by name) in memory:
+
+    from wash.catalogue import get_services, get_service
+
+    get_services()        # [Service, ...] ordered by name
+    get_service(pk)       # Service or None
+
+loyalty.rewards keeps the active Reward rows the same way.
+
+VERSIONING:
+-----------
+The in-process copy is tagged with a version stored in the Django cache
+(e.g. "wash:services:version"). Each read compares the two (one cache get,
+no database query) and reloads the catalogue when they differ. A save or
+delete bumps the version once the transaction commits (handlers in
+wash/signals.py, loyalty/signals.py).
+
+Only processes that share the cache backend see the bump. With the default
+local-memory cache each process has its own version key, so the bump
+reaches this process only: the web workers, run_scheduler and the
+dispatchers would keep their copy forever. Every copy is therefore also
+reloaded once it is CATALOGUE_MAX_AGE_SECONDS old (60 by default), which
+bounds how stale another process can be. Set CACHE_BACKEND to a shared
+cache (Redis, Memcached) for changes to reach every process at once.
+
+Code that must not act on a stale row (points_cost of a reward being
+redeemed, ...) reads it from the database instead.
+
+The copies are shared: callers must not modify the returned objects.
+
+=============================================================================
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from wash.models import Booking, Service
+
+
+class VersionedCatalogue:
+    """
+    In-process copy of a small table, reloaded when the shared version moves
+    or after CATALOGUE_MAX_AGE_SECONDS.
+    """
+
+    def __init__(self, version_key, load):
+        self.version_key = version_key
+        self.load = load
+        # (version, [obj, ...], {pk: obj}, loaded at (monotonic))
+        self._copy = None
+
+    def current_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def _current(self):
+        version = self.current_version()
+        now = time.monotonic()
+        if (
+            self._copy is None
+            or self._copy[0] != version
+            or now - self._copy[3] > settings.CATALOGUE_MAX_AGE_SECONDS
+        ):
+            objects = list(self.load())
+            self._copy = (version, objects, {obj.pk: obj for obj in objects}, now)
+        return self._copy
+
+    def all(self):
+        return self._current()[1]
+
+    def get(self, pk):
+        """The object with primary key `pk` (int or str), or None."""
+        try:
+            return self._current()[2].get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    def invalidate(self):
+        """Drop this process's copy now and bump the shared version on commit."""
+        self._copy = None
+        transaction.on_commit(self._bump)
+
+    def _bump(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, time.time_ns(), None)
+
+
+services = VersionedCatalogue(
+    "wash:services:version", lambda: Service.objects.order_by("name", "pk")
+)
+
+
+def get_services():
+    """Every service, ordered by name."""
+    return services.all()
+
+
+def get_service(pk):
+    """The service with primary key `pk` (int or str), or None."""
+    return services.get(pk)
+
+
+def attach_services(bookings):
+    """Fill booking.service from the catalogue instead of one query per booking."""
+    for booking in bookings:
+        if booking.service_id is not None and not Booking.service.is_cached(booking):
+            service = get_service(booking.service_id)
+            if service is not None:
+                booking.service = service
@@ -0,0 +1,122 @@
+# wash/dashboard.py
+"""
+=============================================================================
+CUSTOMER DASHBOARD CACHE (home page)
+=============================================================================
+
+The customer home page shows the user's counters, vehicle count, next
+booking and service usage. The computed context is cached per user:
+
+    "wash:home:version:<user_id>"          -> version number
+    "wash:home:<user_id>:<version>"        -> dashboard context
+
+A repeat visit reads the version then the context: two cache reads, no
+database query. Any Booking or Vehicle write for the user bumps the version
+once the transaction commits (handlers in wash/signals.py), so the next
+visit computes a fresh context under the new key; the old entry just
+expires.
+
+HOME_CACHE_SECONDS bounds the lifetime of an entry. An entry holding a next
+booking also expires when that booking starts, so the page never shows a
+booking already under way as "next".
+
+The cache is settings.CACHES["default"] (local memory unless CACHE_BACKEND
+points at a shared backend, see settings.py).
+
+=============================================================================
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from wash.models import Booking, UserBookingStats, Vehicle
+
+
+def version_key(user_id):
+    return f"wash:home:version:{user_id}"
+
+
+def context_key(user_id, version):
+    return f"wash:home:{user_id}:{version}"
+
+
+def current_version(user_id):
+    key = version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # starts from the clock: a version key evicted and recreated can't
+        # reuse the number of an older, still cached, context
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_versions(user_ids):
+    """Invalidate the cached dashboards of `user_ids` once the transaction commits."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if user_ids:
+        transaction.on_commit(lambda: _bump(user_ids))
+
+
+def _bump(user_ids):
+    for user_id in user_ids:
+        try:
+            cache.incr(version_key(user_id))
+        except ValueError:
+            # no version yet (or evicted): nothing cached under it
+            cache.set(version_key(user_id), time.time_ns(), None)
+
+
+def compute_context(user):
+    bookings = Booking.objects.filter(user=user)
+
+    # compteurs maintenus par wash.stats (pas de COUNT/SUM sur Booking)
+    stats = UserBookingStats.objects.filter(user=user).first()
+
+    next_booking = (
+        bookings
+        .exclude(status="cancelled")
+        .filter(scheduled_at__gte=timezone.now())
+        .select_related("service")
+        .order_by("scheduled_at")
+        .first()
+    )
+
+    service_usage = list(
+        bookings
+        .exclude(status="cancelled")
+        .values("service__name")
+        .annotate(count=Count("id"))
+        .order_by("-count")
+    )
+
+    return {
+        "bookings_count": stats.total_bookings if stats else 0,
+        "vehicles_count": Vehicle.objects.filter(owner=user).count(),
+        "total_spent": stats.total_spent if stats else 0,
+        "next_booking": next_booking,
+        "service_usage": service_usage,
+    }
+
+
+def home_context(user):
+    """The user's dashboard context, from the cache when it is current."""
+    key = context_key(user.pk, current_version(user.pk))
+    context = cache.get(key)
+    if context is not None:
+        return context
+
+    context = compute_context(user)
+
+    timeout = getattr(settings, "HOME_CACHE_SECONDS", 300)
+    next_booking = context["next_booking"]
+    if next_booking is not None:
+        starts_in = (next_booking.scheduled_at - timezone.now()).total_seconds()
+        timeout = max(min(timeout, int(starts_in)), 1)
+    cache.set(key, context, timeout)
+    return context
@@ -0,0 +1,192 @@
+# wash/dispatch.py
+"""
+=============================================================================
+ASYNC REMINDER DISPATCHER (morning bursts)
+=============================================================================
+
+At opening time thousands of reminders can be due within the same minute.
+drain_outbox sends them one SMTP call at a time per worker; the dispatcher
+keeps several SMTP connections busy from one process:
+
+    python manage.py dispatch_reminders --concurrency 8 --per-host-rate 5
+
+HOW IT WORKS:
+-------------
+1. The reminder sweep queues what is due (wash.outbox.enqueue_due_reminders)
+2. Outbox rows are claimed in batches, bookings included
+   (wash.outbox.claim_sendable): other workers can run at the same time
+3. Each email is sent on one of `concurrency` pooled SMTP connections.
+   Django's mail backends are blocking, so the sends run in a thread pool
+   driven by asyncio; at most `concurrency` are in flight
+4. Sends to the same recipient domain are spaced by 1 / per_host_rate
+   seconds (providers throttle a sender flooding their MX)
+5. Outcomes are stored per batch (wash.outbox.record_results): retries,
+   backoff and reminder_state as with drain_outbox
+
+Database work stays on one thread; the SMTP threads only render and send.
+
+At the end, DispatchStats reports throughput and the send latency
+histogram (time on the SMTP connection for each email).
+
+=============================================================================
+"""
+
+import asyncio
+import bisect
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import get_connection
+from django.db import connection as db_connection
+
+from wash.outbox import claim_sendable, enqueue_due_reminders, record_results
+from wash.utils import send_reminder_emails
+
+# upper bounds of the latency buckets, in milliseconds
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class HostRateLimiter:
+    """Spaces the sends to each host by 1 / rate seconds (rate 0: no limit)."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next_slot = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class DispatchStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = None
+        self.sent = 0
+        self.failed = 0
+        self.latencies = []
+
+    def record(self, seconds, ok):
+        self.latencies.append(seconds)
+        if ok:
+            self.sent += 1
+        else:
+            self.failed += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def percentile(self, p):
+        """p-th percentile of the latencies, in seconds (None if empty)."""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+    def histogram(self):
+        """[(label, count), ...] with one entry per latency bucket."""
+        counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for seconds in self.latencies:
+            counts[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        labels = [f"<= {bound} ms" for bound in LATENCY_BUCKETS_MS]
+        labels.append(f"> {LATENCY_BUCKETS_MS[-1]} ms")
+        return list(zip(labels, counts))
+
+    def report(self, width=40):
+        """Lines of text: totals, throughput, percentiles and histogram."""
+        elapsed = self.elapsed
+        total = self.sent + self.failed
+        rate = total / elapsed if elapsed else 0
+        lines = [
+            f"Envoyés : {self.sent} ; échecs : {self.failed} ; "
+            f"{total} en {elapsed:.2f}s -> {rate:.1f} msg/s",
+        ]
+        if not self.latencies:
+            return lines
+
+        lines.append(
+            "Latence : "
+            + " ; ".join(
+                f"p{p} {self.percentile(p) * 1000:.0f} ms" for p in (50, 95, 99)
+            )
+            + f" ; max {max(self.latencies) * 1000:.0f} ms"
+        )
+        histogram = self.histogram()
+        peak = max(count for _, count in histogram)
+        for label, count in histogram:
+            bar = "#" * round(width * count / peak) if peak else ""
+            lines.append(f"  {label:>12} | {bar:<{width}} | {count}")
+        return lines
+
+
+def recipient_host(booking):
+    email = getattr(booking.user, "email", "") or ""
+    return email.rpartition("@")[2].lower()
+
+
+def _send(booking, smtp):
+    # SMTP pool thread: if rendering touched the database (profile,
+    # catalogue reload), close this thread's connection right away
+    try:
+        return send_reminder_emails([booking], connection=smtp, reconnect_every=0)[0]
+    finally:
+        db_connection.close()
+
+
+def _close_db():
+    db_connection.close()
+
+
+async def dispatch(batch_size=100, concurrency=8, per_host_rate=0, sweep=True, stats=None):
+    """
+    Queue the due reminders, then send the outbox until it is empty.
+    Returns the DispatchStats.
+    """
+    stats = stats or DispatchStats()
+    loop = asyncio.get_running_loop()
+    limiter = HostRateLimiter(per_host_rate)
+
+    db_pool = ThreadPoolExecutor(max_workers=1)
+    smtp_pool = ThreadPoolExecutor(max_workers=concurrency)
+    connections = asyncio.Queue()
+    for _ in range(concurrency):
+        connections.put_nowait(get_connection(fail_silently=False))
+
+    async def send(email):
+        await limiter.wait(recipient_host(email.booking))
+        smtp = await connections.get()
+        try:
+            started = time.perf_counter()
+            result = await loop.run_in_executor(smtp_pool, _send, email.booking, smtp)
+            stats.record(time.perf_counter() - started, result[1])
+            return result
+        finally:
+            connections.put_nowait(smtp)
+
+    try:
+        if sweep:
+            await loop.run_in_executor(db_pool, enqueue_due_reminders)
+        while True:
+            processed, to_send = await loop.run_in_executor(db_pool, claim_sendable, batch_size)
+            if not processed:
+                break
+            results = await asyncio.gather(*(send(email) for email in to_send))
+            await loop.run_in_executor(db_pool, record_results, to_send, results)
+    finally:
+        while not connections.empty():
+            connections.get_nowait().close()
+        await loop.run_in_executor(db_pool, _close_db)
+        db_pool.shutdown()
+        smtp_pool.shutdown()
+        stats.stop()
+
+    return stats
@@ -1,4 +1,5 @@
 from django import forms
+from .catalogue import get_service, get_services
 from .models import Booking, Service, Vehicle
 
 
@@ -9,10 +10,34 @@ class VehicleForm(forms.ModelForm):
 
 
 class ServiceModelChoiceField(forms.ModelChoiceField):
-    """Affiche le nom du service + prix dans les radios."""
+    """
+    Affiche le nom du service + prix dans les radios.
+    Choix et validation lus dans le catalogue en cache (wash/catalogue.py) :
+    pas de requête sur la table des services.
+    """
     def label_from_instance(self, obj):
         return f"{obj.name} ({obj.price} TND)"
 
+    def _get_choices(self):
+        choices = [(service.pk, self.label_from_instance(service)) for service in get_services()]
+        if self.empty_label is not None:
+            choices.insert(0, ("", self.empty_label))
+        return choices
+
+    choices = property(_get_choices, forms.ChoiceField.choices.fset)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        service = get_service(value)
+        if service is None:
+            raise forms.ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+        return service
+
 
 class BookingForm(forms.ModelForm):
 
@@ -41,7 +66,7 @@ class BookingForm(forms.ModelForm):
         #  SERVICE FIELD (radio)
         # --------------------------
         self.fields["service"] = ServiceModelChoiceField(
-            queryset=Service.objects.all().order_by("name"),
+            queryset=Service.objects.order_by("name"),
             widget=forms.RadioSelect(),
             empty_label=None
         )
@@ -0,0 +1,111 @@
+# wash/ics.py
+"""
+iCalendar (RFC 5545) des réservations : l'événement joint aux emails de
+rappel (wash.utils._build_ics) et les flux d'abonnement
+(wash/views_calendar.py).
+
+- lignes terminées par CRLF et pliées à 75 octets, sans couper un
+  caractère UTF-8 (la suite repart sur une ligne qui commence par une espace)
+- valeurs TEXT échappées : \\ ; , et retours à la ligne
+
+    ics.calendar_start("Mes lavages") + ics.event(booking, ...) + ics.CALENDAR_END
+"""
+from datetime import timedelta, timezone
+
+from django.conf import settings
+
+DATE_FORMAT = "%Y%m%dT%H%M%SZ"
+
+# octets par ligne, CRLF non compris
+LINE_LIMIT = 75
+
+EVENT_STATUS = {
+    "pending": "TENTATIVE",
+    "confirmed": "CONFIRMED",
+    "done": "CONFIRMED",
+    "cancelled": "CANCELLED",
+}
+
+
+def escape_text(value):
+    """Valeur TEXT échappée (RFC 5545, 3.3.11)."""
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\r\n", "\\n")
+        .replace("\n", "\\n")
+        .replace("\r", "\\n")
+    )
+
+
+def fold(line):
+    """`line` en UTF-8, pliée à LINE_LIMIT octets, terminée par CRLF."""
+    data = line.encode("utf-8")
+    parts = []
+    limit = LINE_LIMIT
+    while len(data) > limit:
+        cut = limit
+        # pas de coupure avant un octet de continuation (10xxxxxx)
+        while data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        parts.append(data[:cut])
+        data = data[cut:]
+        # les lignes suivantes commencent par l'espace de pliage
+        limit = LINE_LIMIT - 1
+    parts.append(data)
+    return b"\r\n ".join(parts) + b"\r\n"
+
+
+def uid_domain():
+    """Domaine des UID d'événements : celui de DEFAULT_FROM_EMAIL."""
+    default_from = getattr(settings, "DEFAULT_FROM_EMAIL", None) or "no-reply@carwash.test"
+    return default_from.split("@")[-1]
+
+
+def format_utc(value):
+    return value.astimezone(timezone.utc).strftime(DATE_FORMAT)
+
+
+def calendar_start(name=None):
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Carwash//EN"]
+    if name:
+        lines += ["METHOD:PUBLISH", f"X-WR-CALNAME:{escape_text(name)}"]
+    return b"".join(fold(line) for line in lines)
+
+
+CALENDAR_END = fold("END:VCALENDAR")
+
+
+def event(booking, domain, stamp, summary=None, url=None, last_modified=None):
+    """
+    Le VEVENT (bytes) de `booking`, dont scheduled_at est renseigné ;
+    service et véhicule déjà chargés de préférence.
+    """
+    start = booking.scheduled_at
+    end = booking.scheduled_end or start + timedelta(
+        minutes=getattr(booking.service, "duration_minutes", 30)
+    )
+    service = booking.service.name if booking.service else ""
+    plate = getattr(booking.vehicle, "license_plate", "")
+    if summary is None:
+        summary = f"Carwash - {service or 'Réservation'}"
+
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:booking-{booking.pk}@{domain}",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{format_utc(start)}",
+        f"DTEND:{format_utc(end)}",
+        f"SUMMARY:{escape_text(summary)}",
+        f"DESCRIPTION:{escape_text(f'{service} — Véhicule: {plate}')}",
+        f"STATUS:{EVENT_STATUS.get(booking.status, 'CONFIRMED')}",
+    ]
+    if last_modified is not None:
+        lines.append(f"LAST-MODIFIED:{format_utc(last_modified)}")
+    if url:
+        # valeur URI : pas d'échappement TEXT
+        lines.append(f"URL:{url}")
+    lines.append("END:VEVENT")
+    return b"".join(fold(line) for line in lines)
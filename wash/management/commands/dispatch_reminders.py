@@ -0,0 +1,50 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from wash.dispatch import dispatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Envoie les rappels dus en parallèle (asyncio + connexions SMTP "
+        "poolées) et affiche débit et latences."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=8,
+            help="Connexions SMTP / envois simultanés (défaut : 8).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Emails réclamés dans l'outbox à chaque passage (défaut : 100).",
+        )
+        parser.add_argument(
+            "--per-host-rate",
+            type=float,
+            default=0,
+            help="Emails par seconde au plus par domaine destinataire (défaut : 0, sans limite).",
+        )
+        parser.add_argument(
+            "--no-sweep",
+            action="store_true",
+            default=False,
+            help="N'envoie que l'outbox, sans y ajouter d'abord les rappels dus.",
+        )
+
+    def handle(self, *args, **options):
+        stats = asyncio.run(
+            dispatch(
+                batch_size=options["batch_size"],
+                concurrency=max(options["concurrency"], 1),
+                per_host_rate=options["per_host_rate"],
+                sweep=not options["no_sweep"],
+            )
+        )
+        for line in stats.report():
+            self.stdout.write(line)
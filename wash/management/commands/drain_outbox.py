@@ -0,0 +1,66 @@
+# wash/management/commands/drain_outbox.py
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from wash.outbox import drain_outbox
+
+
+def _worker(batch_size):
+    # chaque thread a sa propre connexion DB : on la ferme en sortant
+    try:
+        return drain_outbox(batch_size)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Envoie les emails en attente dans l'outbox (retries + backoff)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Nombre de workers en parallèle (défaut : 4).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Emails réclamés par worker à chaque passage (défaut : 50).",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            default=False,
+            help="Tourne en continu au lieu de s'arrêter quand l'outbox est vide.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Secondes d'attente entre deux passages avec --loop (défaut : 5).",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        batch_size = options["batch_size"]
+        loop = options["loop"]
+        interval = options["interval"]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                if workers > 1:
+                    processed = sum(pool.map(_worker, [batch_size] * workers))
+                else:
+                    processed = drain_outbox(batch_size)
+
+                if processed or not loop:
+                    self.stdout.write(f"Outbox : {processed} email(s) traité(s)")
+                if not loop:
+                    return
+                if not processed:
+                    time.sleep(interval)
@@ -0,0 +1,15 @@
+# wash/management/commands/rebuild_booking_stats.py
+from django.core.management.base import BaseCommand
+
+from wash.stats import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule entièrement la table BookingDailyStats (dashboard admin) "
+        "à partir des réservations."
+    )
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_stats()
+        self.stdout.write(self.style.SUCCESS(f"BookingDailyStats reconstruit : {rows} lignes."))
@@ -0,0 +1,15 @@
+# wash/management/commands/reconcile_booking_stats.py
+from django.core.management.base import BaseCommand
+
+from wash.stats import reconcile_user_booking_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcule les compteurs par utilisateur (UserBookingStats) "
+        "à partir des réservations."
+    )
+
+    def handle(self, *args, **options):
+        users = reconcile_user_booking_stats()
+        self.stdout.write(self.style.SUCCESS(f"UserBookingStats recalculé : {users} utilisateurs."))
@@ -0,0 +1,77 @@
+import logging
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from wash.scheduler import (
+    acquire_leadership,
+    release_leadership,
+    start_scheduler,
+    still_leader,
+    stop_scheduler,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        "Héberge l'APScheduler (balayage des rappels, vidage de l'outbox). "
+        "Un seul processus l'exécute : les autres attendent le verrou."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--standby-interval",
+            type=float,
+            default=15,
+            help="Secondes entre deux tentatives de prise du verrou (défaut : 15).",
+        )
+        parser.add_argument(
+            "--check-interval",
+            type=float,
+            default=30,
+            help="Secondes entre deux vérifications du verrou par le leader (défaut : 30).",
+        )
+        parser.add_argument(
+            "--no-wait",
+            action="store_true",
+            default=False,
+            help="S'arrête au lieu d'attendre si un autre processus a le verrou.",
+        )
+
+    def handle(self, *args, **options):
+        stopping = threading.Event()
+
+        def _stop(signum, frame):
+            stopping.set()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        # attente du verrou : un seul hôte du scheduler à la fois
+        while not acquire_leadership():
+            if options["no_wait"]:
+                raise CommandError("Un autre run_scheduler a déjà le verrou.")
+            self.stdout.write("Scheduler : verrou pris ailleurs, en attente...")
+            if stopping.wait(options["standby_interval"]):
+                return
+
+        self.stdout.write(self.style.SUCCESS("Scheduler : verrou acquis, démarrage"))
+        start_scheduler()
+        try:
+            while not stopping.wait(options["check_interval"]):
+                if not still_leader():
+                    # connexion perdue = verrou perdu : un autre processus
+                    # peut déjà avoir pris le relais, on s'arrête
+                    raise CommandError("Scheduler : verrou perdu, arrêt.")
+        finally:
+            stop_scheduler()
+            try:
+                release_leadership()
+            except Exception as e:
+                logger.warning(f"Scheduler lock release failed: {str(e)}")
+            connection.close()
+        self.stdout.write("Scheduler arrêté")
@@ -1,9 +1,31 @@
 # wash/management/commands/send_reminders.py
+from itertools import islice
+
+from django.core.mail import get_connection
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 from django.utils import timezone
 
 from wash.models import Booking
-from wash.utils import send_reminder_email
+from wash.outbox import claim_reminders, finish_reminders, reminder_claimable_q
+from wash.utils import send_reminder_emails
+
+
+def reminder_window_q(start, end):
+    """
+    Q() sélectionnant les réservations programmées dans [start, end].
+    Range scan sur l'index booking_pending_reminder_idx (scheduled_at).
+    """
+    return Q(scheduled_at__range=(start, end))
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 
 class Command(BaseCommand):
@@ -13,11 +35,25 @@ class Command(BaseCommand):
         parser.add_argument("--minutes", type=int, default=None)
         parser.add_argument("--hours", type=int, default=None)
         parser.add_argument("--dry-run", action="store_true", default=False)
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Réservations lues et marquées par lot (défaut : 500).",
+        )
+        parser.add_argument(
+            "--verbose",
+            action="store_true",
+            default=False,
+            help="Affiche une ligne par réservation traitée.",
+        )
 
     def handle(self, *args, **options):
         minutes = options["minutes"]
         hours = options["hours"]
         dry_run = options["dry_run"]
+        chunk_size = options["chunk_size"]
+        verbose = options["verbose"]
 
         if minutes is None and hours is None:
             self.stderr.write("Specify --minutes or --hours")
@@ -40,58 +76,63 @@ class Command(BaseCommand):
             f"(window_seconds={window_seconds})"
         )
 
+        # Fenêtre, état du rappel et statut filtrés en SQL
         qs = (
             Booking.objects
             .select_related("user", "service", "vehicle")
-            .filter(scheduled_date__isnull=False, scheduled_time__isnull=False)
-            .order_by("scheduled_date", "scheduled_time")
+            .filter(reminder_claimable_q(now))
+            .exclude(status="cancelled")
+            .filter(reminder_window_q(now, window_to))
+            .order_by("scheduled_at")
         )
 
         checked = 0
         sent = 0
+        claimed_elsewhere = 0
+
+        # Une seule connexion SMTP pour tout le run (réouverte périodiquement
+        # par send_reminder_emails)
+        connection = None if dry_run else get_connection(fail_silently=False)
+
+        try:
+            for chunk in chunked(qs.iterator(chunk_size=chunk_size), chunk_size):
+                checked += len(chunk)
+                sent_ids = []
+                failed_ids = []
+
+                # On ne part que des réservations réclamées par ce run :
+                # l'outbox ou un autre send_reminders a pu les prendre
+                if not dry_run:
+                    claimed = claim_reminders([booking.pk for booking in chunk])
+                    claimed_elsewhere += len(chunk) - len(claimed)
+                    chunk = [booking for booking in chunk if booking.pk in claimed]
+
+                results = send_reminder_emails(chunk, dry_run=dry_run, connection=connection)
+                for booking, ok, error in results:
+                    if ok:
+                        sent_ids.append(booking.pk)
+                        if verbose:
+                            self.stdout.write(
+                                self.style.SUCCESS(
+                                    f"Sent reminder for booking {booking.pk} -> {booking.user.email}"
+                                )
+                            )
+                    else:
+                        failed_ids.append(booking.pk)
+                        self.stderr.write(
+                            f"Error sending booking {booking.pk}: {error or 'unknown'}"
+                        )
+
+                # Un UPDATE par lot et par issue ; les échecs redeviennent
+                # réclamables
+                if not dry_run:
+                    finish_reminders(sent_ids, failed_ids)
+                sent += len(sent_ids)
+        finally:
+            if connection is not None:
+                connection.close()
 
-        for booking in qs:
-            checked += 1
-
-            # reconstruire un datetime local à partir de la date+heure
-            scheduled_naive = timezone.datetime.combine(
-                booking.scheduled_date, booking.scheduled_time
-            )
-            scheduled_local = timezone.make_aware(scheduled_naive, tz)
-
-            if getattr(booking, "reminder_sent", False):
-                self.stdout.write(
-                    f"Booking {booking.pk} reminder_sent already (skipped)"
-                )
-                continue
-
-            if scheduled_local < now:
-                self.stdout.write(
-                    f"Booking {booking.pk} scheduled_local={scheduled_local.isoformat()} "
-                    f"now={now.isoformat()} -> already in past (skipped)"
-                )
-                continue
-
-            if scheduled_local > window_to:
-                self.stdout.write(
-                    f"Booking {booking.pk} scheduled_local={scheduled_local.isoformat()} "
-                    f"now={now.isoformat()} -> outside window (skipped)"
-                )
-                continue
-
-            ok, error = send_reminder_email(booking, dry_run=dry_run)
-            if ok:
-                if not dry_run and hasattr(booking, "reminder_sent"):
-                    Booking.objects.filter(pk=booking.pk).update(reminder_sent=True)
-                sent += 1
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"Sent reminder for booking {booking.pk} -> {booking.user.email}"
-                    )
-                )
-            else:
-                self.stderr.write(
-                    f"Error sending booking {booking.pk}: {error or 'unknown'}"
-                )
-
-        self.stdout.write(f"Checked: {checked}; Rappels envoyés : {sent}")
+        self.stdout.write(
+            f"Checked: {checked}; Rappels envoyés : {sent}; "
+            f"déjà pris ailleurs : {claimed_elsewhere}"
+        )
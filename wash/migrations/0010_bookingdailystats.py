@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:59
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """Initial fill; later runs go through `manage.py rebuild_booking_stats`."""
+    Booking = apps.get_model('wash', 'Booking')
+    BookingDailyStats = apps.get_model('wash', 'BookingDailyStats')
+
+    rows = defaultdict(lambda: {'created_count': 0, 'scheduled_count': 0, 'revenue': Decimal('0')})
+
+    created = (
+        Booking.objects
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'service_id', 'status')
+        .annotate(count=Count('id'), revenue=Sum('total_price'))
+        .order_by()
+    )
+    for item in created:
+        row = rows[(item['day'], item['service_id'], item['status'])]
+        row['created_count'] += item['count']
+        row['revenue'] += item['revenue'] or 0
+
+    scheduled = (
+        Booking.objects
+        .filter(scheduled_date__isnull=False)
+        .values('scheduled_date', 'service_id', 'status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for item in scheduled:
+        rows[(item['scheduled_date'], item['service_id'], item['status'])]['scheduled_count'] += item['count']
+
+    BookingDailyStats.objects.bulk_create(
+        [
+            BookingDailyStats(day=day, service_id=service_id, status=status, **values)
+            for (day, service_id, status), values in rows.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0009_alter_booking_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('cancelled', 'Cancelled'), ('done', 'Done')], max_length=20)),
+                ('created_count', models.IntegerField(default=0)),
+                ('scheduled_count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('service', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='wash.service')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'status'], name='booking_daily_stats_day')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('service__isnull', False)), fields=('day', 'service', 'status'), name='booking_daily_stats_unique'), models.UniqueConstraint(condition=models.Q(('service__isnull', True)), fields=('day', 'status'), name='booking_daily_stats_unique_no_service')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
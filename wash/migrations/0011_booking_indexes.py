@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:00
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # wash_booking is the hot table: build the indexes without locking writes
+    atomic = False
+
+    dependencies = [
+        ('wash', '0010_bookingdailystats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(fields=['user', 'status'], include=('total_price',), name='booking_user_status_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(fields=['scheduled_date', 'scheduled_time'], name='booking_schedule_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(fields=['status', '-created_at'], name='booking_status_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'cancelled'), _negated=True), fields=['-created_at'], name='booking_active_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('reminder_sent', False), models.Q(('status', 'cancelled'), _negated=True)), fields=['scheduled_date', 'scheduled_time'], name='booking_pending_reminder_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_user_booking_stats(apps, schema_editor):
+    """Initial fill; later runs go through `manage.py reconcile_booking_stats`."""
+    Booking = apps.get_model('wash', 'Booking')
+    UserBookingStats = apps.get_model('wash', 'UserBookingStats')
+
+    totals = (
+        Booking.objects
+        .values('user_id')
+        .annotate(
+            total_bookings=Count('id', filter=~Q(status='cancelled')),
+            completed_bookings=Count('id', filter=Q(status='done')),
+            total_spent=Sum('total_price', filter=Q(status='done')),
+        )
+        .order_by()
+    )
+
+    UserBookingStats.objects.bulk_create(
+        [
+            UserBookingStats(
+                user_id=item['user_id'],
+                total_bookings=item['total_bookings'],
+                completed_bookings=item['completed_bookings'],
+                total_spent=item['total_spent'] or 0,
+            )
+            for item in totals
+        ],
+        batch_size=1000,
+    )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('wash', '0012_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBookingStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='booking_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_bookings', models.IntegerField(default=0)),
+                ('completed_bookings', models.IntegerField(default=0)),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-total_bookings'], name='user_stats_top_clients_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_user_booking_stats, migrations.RunPython.noop),
+    ]
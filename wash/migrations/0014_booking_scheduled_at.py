@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:13
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_scheduled_at(apps, schema_editor):
+    """Same computation as Booking.compute_scheduled_at(), in batches."""
+    Booking = apps.get_model('wash', 'Booking')
+    tz = timezone.get_default_timezone()
+
+    bookings = (
+        Booking.objects
+        .filter(scheduled_date__isnull=False, scheduled_time__isnull=False)
+        .only('id', 'scheduled_date', 'scheduled_time')
+        .order_by('id')
+    )
+    batch = []
+    for booking in bookings.iterator(chunk_size=1000):
+        booking.scheduled_at = timezone.make_aware(
+            datetime.combine(booking.scheduled_date, booking.scheduled_time), tz
+        )
+        batch.append(booking)
+        if len(batch) == 1000:
+            Booking.objects.bulk_update(batch, ['scheduled_at'])
+            batch = []
+    if batch:
+        Booking.objects.bulk_update(batch, ['scheduled_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0013_userbookingstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_scheduled_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:13
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # wash_booking is the hot table: build the indexes without locking writes
+    atomic = False
+
+    dependencies = [
+        ('wash', '0014_booking_scheduled_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='booking',
+            name='booking_pending_reminder_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('reminder_sent', False), models.Q(('status', 'cancelled'), _negated=True)), fields=['scheduled_at'], name='booking_pending_reminder_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(fields=['user', 'scheduled_at'], name='booking_user_scheduled_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(fields=['scheduled_at'], name='booking_scheduled_at_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:14
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_scheduled_end(apps, schema_editor):
+    """scheduled_at + service duration (30 min without service), in batches."""
+    Booking = apps.get_model('wash', 'Booking')
+
+    bookings = (
+        Booking.objects
+        .filter(scheduled_at__isnull=False)
+        .select_related('service')
+        .only('id', 'scheduled_at', 'service__duration_minutes')
+        .order_by('id')
+    )
+    batch = []
+    for booking in bookings.iterator(chunk_size=1000):
+        duration = booking.service.duration_minutes if booking.service_id else 30
+        booking.scheduled_end = booking.scheduled_at + timedelta(minutes=duration)
+        batch.append(booking)
+        if len(batch) == 1000:
+            Booking.objects.bulk_update(batch, ['scheduled_end'])
+            batch = []
+    if batch:
+        Booking.objects.bulk_update(batch, ['scheduled_end'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0015_booking_scheduled_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='scheduled_end',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_scheduled_end, migrations.RunPython.noop),
+    ]
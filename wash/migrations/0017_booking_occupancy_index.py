@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:14
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # wash_booking is the hot table: build the index without locking writes
+    atomic = False
+
+    dependencies = [
+        ('wash', '0016_booking_scheduled_end'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('scheduled_at__isnull', False), models.Q(('status', 'cancelled'), _negated=True)), fields=['scheduled_at'], include=('scheduled_end',), name='booking_occupancy_idx'),
+        ),
+    ]
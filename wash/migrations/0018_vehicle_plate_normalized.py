@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:20
+
+import re
+
+from django.db import migrations, models
+
+
+def backfill_plate_normalized(apps, schema_editor):
+    """Same normalization as wash.models.normalize_plate(), in batches."""
+    Vehicle = apps.get_model('wash', 'Vehicle')
+
+    batch = []
+    for vehicle in Vehicle.objects.only('id', 'license_plate').order_by('id').iterator(chunk_size=1000):
+        vehicle.plate_normalized = re.sub(r"[\W_]+", "", vehicle.license_plate or "").upper()
+        batch.append(vehicle)
+        if len(batch) == 1000:
+            Vehicle.objects.bulk_update(batch, ['plate_normalized'])
+            batch = []
+    if batch:
+        Vehicle.objects.bulk_update(batch, ['plate_normalized'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0017_booking_occupancy_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='plate_normalized',
+            field=models.CharField(blank=True, default='', editable=False, max_length=50),
+        ),
+        migrations.RunPython(backfill_plate_normalized, migrations.RunPython.noop),
+    ]
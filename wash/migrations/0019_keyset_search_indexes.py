@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:20
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # wash_booking is the hot table: build the indexes without locking writes
+    atomic = False
+
+    dependencies = [
+        ('wash', '0018_vehicle_plate_normalized'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='booking',
+            name='booking_active_created_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'cancelled'), _negated=True), fields=['-created_at', '-id'], name='booking_active_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='booking_user_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='vehicle',
+            index=models.Index(fields=['plate_normalized'], name='vehicle_plate_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:40
+
+from django.db import migrations
+
+
+def remove_booking_reminder_jobs(apps, schema_editor):
+    """
+    One-off reminder jobs ("booking_reminder_<id>") are replaced by the
+    periodic reminder sweep; their bookings are picked up by it.
+    """
+    DjangoJob = apps.get_model('django_apscheduler', 'DjangoJob')
+    DjangoJob.objects.filter(id__startswith='booking_reminder_').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0019_keyset_search_indexes'),
+        ('django_apscheduler', '0009_djangojobexecution_unique_job_executions'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_booking_reminder_jobs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_reminder_sent(apps, schema_editor):
+    Booking = apps.get_model('wash', 'Booking')
+    Booking.objects.filter(reminder_sent=True).update(reminder_state='sent')
+
+
+def copy_reminder_state(apps, schema_editor):
+    Booking = apps.get_model('wash', 'Booking')
+    Booking.objects.filter(reminder_state='sent').update(reminder_sent=True)
+
+
+class Migration(migrations.Migration):
+    # the partial index on reminder_state is swapped and reminder_sent
+    # dropped in 0024, outside the transaction (CREATE INDEX CONCURRENTLY)
+
+    dependencies = [
+        ('wash', '0020_remove_booking_reminder_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='reminder_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='reminder_state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent')], default='pending', max_length=10),
+        ),
+        migrations.RunPython(copy_reminder_sent, copy_reminder_state),
+    ]
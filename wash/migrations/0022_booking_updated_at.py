@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:42
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    """No change history: the creation date is the best known value."""
+    Booking = apps.get_model('wash', 'Booking')
+    Booking.objects.update(updated_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0021_booking_reminder_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# wash/migrations/0023_user_username_upper_idx.py
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # auth_user is not ours: the index is plain SQL. Case-insensitive
+    # prefix search (username__istartswith, i.e. UPPER(username) LIKE
+    # UPPER('...%')) in wash.views.booking_search_q; built without
+    # locking writes.
+    atomic = False
+
+    dependencies = [
+        ('wash', '0022_booking_updated_at'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS auth_user_username_upper_idx
+                ON auth_user (UPPER(username::text) text_pattern_ops);
+            """,
+            reverse_sql="""
+                DROP INDEX CONCURRENTLY IF EXISTS auth_user_username_upper_idx;
+            """,
+        ),
+    ]
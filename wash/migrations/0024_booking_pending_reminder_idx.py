@@ -0,0 +1,28 @@
+# wash/migrations/0024_booking_pending_reminder_idx.py
+from django.contrib.postgres.operations import AddIndexConcurrently, RemoveIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # wash_booking is the hot table: rebuild the reminder index on
+    # reminder_state without locking writes, then drop reminder_sent
+    atomic = False
+
+    dependencies = [
+        ('wash', '0023_user_username_upper_idx'),
+    ]
+
+    operations = [
+        RemoveIndexConcurrently(
+            model_name='booking',
+            name='booking_pending_reminder_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='booking',
+            index=models.Index(condition=models.Q(models.Q(('reminder_state', 'sent'), _negated=True), models.Q(('status', 'cancelled'), _negated=True)), fields=['scheduled_at'], name='booking_pending_reminder_idx'),
+        ),
+        migrations.RemoveField(
+            model_name='booking',
+            name='reminder_sent',
+        ),
+    ]
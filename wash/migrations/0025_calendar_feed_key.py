@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:25
+
+import django.db.models.deletion
+import wash.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('wash', '0024_booking_pending_reminder_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarFeedKey',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='calendar_feed_key', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('key', models.CharField(default=wash.models.new_feed_key, max_length=32)),
+                ('rotated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,4 +1,6 @@
 # wash/models.py
+import re
+import secrets
 from datetime import datetime
 from django.db import models
 from django.conf import settings
@@ -7,6 +9,9 @@ from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL   # string like "auth.User" or custom user model
 
+# durée d'un créneau quand la réservation n'a pas (ou plus) de service
+DEFAULT_DURATION_MINUTES = 30
+
 class Service(models.Model):
     name = models.CharField(max_length=200)
     price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
@@ -15,15 +20,38 @@ class Service(models.Model):
     def __str__(self):
         return self.name
 
+def normalize_plate(plate):
+    """Plaque sans espaces ni ponctuation, en majuscules ("123 tu-4567" -> "123TU4567")."""
+    return re.sub(r"[\W_]+", "", plate or "").upper()
+
+
 class Vehicle(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     license_plate = models.CharField(max_length=50)
+    # recherche dashboard : égalité / préfixe indexés
+    plate_normalized = models.CharField(max_length=50, blank=True, default="", editable=False)
     make = models.CharField(max_length=100, blank=True)
     model = models.CharField(max_length=100, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["plate_normalized"],
+                opclasses=["varchar_pattern_ops"],
+                name="vehicle_plate_prefix_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.license_plate
 
+    def save(self, *args, **kwargs):
+        self.plate_normalized = normalize_plate(self.license_plate)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "license_plate" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "plate_normalized"}
+        super().save(*args, **kwargs)
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -38,8 +66,17 @@ class Booking(models.Model):
 
     scheduled_date = models.DateField(null=True, blank=True)
     scheduled_time = models.TimeField(null=True, blank=True)
+    # scheduled_date + scheduled_time (heure locale) en datetime aware,
+    # recalculé à chaque save() : filtrable / triable en SQL
+    scheduled_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # fin du créneau : scheduled_at + service.duration_minutes (occupation
+    # d'une baie, voir wash/capacity.py)
+    scheduled_end = models.DateTimeField(null=True, blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # dernier changement visible dans les calendriers (.ics, ETag/Last-Modified
+    # des flux, voir wash/views_calendar.py)
+    updated_at = models.DateTimeField(auto_now=True)
 
     status = models.CharField(
         max_length=20,
@@ -54,18 +91,109 @@ class Booking(models.Model):
         default=0
     )
 
-    reminder_sent = models.BooleanField(default=False)
+    # pending --claim--> sending --ok--> sent
+    #                            --error--> pending
+    # Un envoyeur ne part que d'une réservation qu'il a réclamée
+    # (wash.outbox.claim_reminders) : jamais deux rappels pour la même.
+    REMINDER_STATE_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+    ]
+    reminder_state = models.CharField(
+        max_length=10, choices=REMINDER_STATE_CHOICES, default="pending"
+    )
+    reminder_claimed_at = models.DateTimeField(null=True, blank=True)
     ia_message = models.TextField(blank=True, default="")
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # home(), badges: per-user counts / SUM(total_price) by status
+            models.Index(
+                fields=["user", "status"],
+                include=["total_price"],
+                name="booking_user_status_idx",
+            ),
+            # agenda / date filters: scheduled_date [+ scheduled_time]
+            models.Index(
+                fields=["scheduled_date", "scheduled_time"],
+                name="booking_schedule_idx",
+            ),
+            # status filters ordered by creation date
+            models.Index(
+                fields=["status", "-created_at"],
+                name="booking_status_created_idx",
+            ),
+            # admin dashboard: latest non-cancelled bookings, keyset pages
+            # on (created_at, id)
+            models.Index(
+                fields=["-created_at", "-id"],
+                condition=~models.Q(status="cancelled"),
+                name="booking_active_created_idx",
+            ),
+            # a user's bookings, keyset pages on (created_at, id)
+            models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="booking_user_created_idx",
+            ),
+            # send_reminders / scheduler: reminders still to send
+            models.Index(
+                fields=["scheduled_at"],
+                condition=~models.Q(reminder_state="sent") & ~models.Q(status="cancelled"),
+                name="booking_pending_reminder_idx",
+            ),
+            # home(): next booking of a user; calendar ranges per user
+            models.Index(
+                fields=["user", "scheduled_at"],
+                name="booking_user_scheduled_idx",
+            ),
+            # staff agenda: bookings between two instants
+            models.Index(
+                fields=["scheduled_at"],
+                name="booking_scheduled_at_idx",
+            ),
+            # capacity: bays occupied around an instant (index-only scan)
+            models.Index(
+                fields=["scheduled_at"],
+                include=["scheduled_end"],
+                condition=models.Q(scheduled_at__isnull=False) & ~models.Q(status="cancelled"),
+                name="booking_occupancy_idx",
+            ),
+        ]
+
+    # Fields whose previous values are remembered when a booking is loaded,
+    # so signal handlers can tell what actually changed on save.
+    TRACKED_FIELDS = (
+        "status", "service_id", "scheduled_date", "scheduled_time", "total_price",
+        "user_id",
+    )
 
     def __str__(self):
         return f"Booking #{self.id} - {self.user.username}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_tracked_fields()
+        return instance
+
+    def snapshot_tracked_fields(self, values=None):
+        """
+        Mémorise l'état des champs suivis (voir TRACKED_FIELDS) tel qu'en
+        base : `values` si fourni, sinon les valeurs courantes de l'instance.
+        """
+        if values is None:
+            values = {name: self.__dict__.get(name) for name in self.TRACKED_FIELDS}
+        self._loaded_values = dict(values)
+
+    @property
+    def loaded_values(self):
+        """Valeurs des champs suivis au dernier chargement/save, ou None."""
+        return getattr(self, "_loaded_values", None)
     
     
-    @property
-    def scheduled_at(self):
+    def compute_scheduled_at(self):
         """
         Retourne un datetime timezone-aware représentant la date+heure programmée,
         ou None si date/time manquants.
@@ -79,3 +207,181 @@ class Booking(models.Model):
             dt = timezone.make_aware(dt, timezone.get_default_timezone())
 
         return dt
+
+    def compute_scheduled_end(self):
+        """Fin du créneau (scheduled_at + durée du service), ou None."""
+        start = self.compute_scheduled_at()
+        if start is None:
+            return None
+        duration = self.service.duration_minutes if self.service_id else DEFAULT_DURATION_MINUTES
+        return start + timezone.timedelta(minutes=duration)
+
+    def save(self, *args, **kwargs):
+        # scheduled_at / scheduled_end suivent toujours date, heure et service
+        self.scheduled_at = self.compute_scheduled_at()
+
+        previous = self.loaded_values
+        if previous is None or any(
+            previous[name] != getattr(self, name)
+            for name in ("service_id", "scheduled_date", "scheduled_time")
+        ):
+            # ne charge le service que si le créneau a pu changer
+            self.scheduled_end = self.compute_scheduled_end()
+
+        update_fields = kwargs.get("update_fields")
+        slot_fields = {"scheduled_date", "scheduled_time", "service", "service_id"}
+        if update_fields is not None and slot_fields & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "scheduled_at", "scheduled_end"}
+        calendar_fields = slot_fields | {"status", "vehicle", "vehicle_id"}
+        if update_fields is not None and calendar_fields & set(update_fields):
+            kwargs["update_fields"] = {*kwargs["update_fields"], "updated_at"}
+
+        super().save(*args, **kwargs)
+
+
+class BookingDailyStats(models.Model):
+    """
+    Rollup jour × service × statut alimentant le dashboard admin.
+
+    - created_count / revenue : réservations créées ce jour-là
+    - scheduled_count : réservations programmées ce jour-là
+
+    Maintenu incrémentalement par wash.signals, reconstruit par
+    `python manage.py rebuild_booking_stats`.
+    """
+    day = models.DateField()
+    service = models.ForeignKey("Service", null=True, blank=True, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=Booking.STATUS_CHOICES)
+
+    created_count = models.IntegerField(default=0)
+    scheduled_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "service", "status"],
+                condition=models.Q(service__isnull=False),
+                name="booking_daily_stats_unique",
+            ),
+            models.UniqueConstraint(
+                fields=["day", "status"],
+                condition=models.Q(service__isnull=True),
+                name="booking_daily_stats_unique_no_service",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["day", "status"], name="booking_daily_stats_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.service_id} {self.status}: {self.created_count}"
+
+
+class OutboundEmail(models.Model):
+    """
+    Outbox des emails à envoyer hors de la requête HTTP.
+
+    Les lignes sont créées par wash.signals (via transaction.on_commit) et
+    vidées par `python manage.py drain_outbox` / le job du scheduler,
+    avec retries et backoff exponentiel (voir wash/outbox.py).
+    """
+    KIND_CHOICES = [
+        ('reminder', 'Reminder'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('skipped', 'Skipped'),
+    ]
+
+    booking = models.ForeignKey("Booking", on_delete=models.CASCADE, related_name="outbound_emails")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default="reminder")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["next_attempt_at"]
+        constraints = [
+            # Un seul email en attente par réservation et par type
+            models.UniqueConstraint(
+                fields=["booking", "kind"],
+                condition=models.Q(status__in=["pending", "sending"]),
+                name="outbound_email_one_pending",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=models.Q(status="pending"),
+                name="outbound_email_due_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for booking #{self.booking_id} ({self.status})"
+
+
+class UserBookingStats(models.Model):
+    """
+    Compteurs de réservations par utilisateur, tenus à jour avec des F() à
+    chaque changement de statut/prix (voir wash/stats.py) au lieu de
+    recompter les réservations. `python manage.py reconcile_booking_stats`
+    les recalcule depuis la table Booking.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="booking_stats",
+    )
+    # réservations non annulées
+    total_bookings = models.IntegerField(default=0)
+    # réservations terminées (status="done") et montant correspondant
+    completed_bookings = models.IntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # admin dashboard: top clients
+            models.Index(fields=["-total_bookings"], name="user_stats_top_clients_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.total_bookings} bookings, {self.total_spent} spent"
+
+
+def new_feed_key():
+    return secrets.token_urlsafe(12)
+
+
+class CalendarFeedKey(models.Model):
+    """
+    Clé secrète des liens d'abonnement calendrier d'un utilisateur, signée
+    dans le jeton de l'URL (voir wash/views_calendar.py). rotate() la
+    remplace : tous les liens déjà distribués répondent alors 404.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="calendar_feed_key",
+    )
+    key = models.CharField(max_length=32, default=new_feed_key)
+    rotated_at = models.DateTimeField(auto_now=True)
+
+    def rotate(self):
+        self.key = new_feed_key()
+        self.save(update_fields=["key", "rotated_at"])
+
+    def __str__(self):
+        return f"calendar key of {self.user_id}"
@@ -0,0 +1,297 @@
+# wash/outbox.py
+"""
+=============================================================================
+EMAIL OUTBOX
+=============================================================================
+
+Emails that used to be sent inside the request (the "send NOW" reminder of
+wash.signals) are written to the OutboundEmail table instead, and delivered
+later by a worker:
+
+    python manage.py drain_outbox --workers 4 --loop
+
+The scheduler also drains the outbox periodically (see wash/scheduler.py).
+For large bursts, `python manage.py dispatch_reminders` sends it over
+several SMTP connections at once (see wash/dispatch.py).
+
+REMINDER SWEEP:
+---------------
+Reminders are not scheduled one job per booking. The scheduler's sweeper
+job calls enqueue_due_reminders() every REMINDER_SWEEP_INTERVAL_SECONDS:
+it reads, in batches, the bookings starting within REMINDER_HOURS_BEFORE
+that have no reminder yet (range scan on booking_pending_reminder_idx)
+and queues one OutboundEmail row each. Moving a booking is only a field
+update: the sweep picks it up when its new time enters the window.
+
+LIFECYCLE:
+----------
+pending --claim--> sending --ok--> sent
+                          --error--> pending (retry with backoff) ... failed
+                          --booking cancelled / already reminded--> skipped
+
+Claiming uses SELECT ... FOR UPDATE SKIP LOCKED, so several workers can
+drain in parallel without sending the same row twice. A row left in
+"sending" by a crashed worker is claimed again after
+OUTBOX_STALE_SECONDS.
+
+ONE REMINDER PER BOOKING:
+-------------------------
+Claiming an outbox row is not enough: the send_reminders command sends
+without the outbox, and a stale row can be reclaimed while its first
+worker is still sending. Every sender therefore also claims the booking
+itself before sending (claim_reminders):
+
+    Booking.reminder_state: pending --claim--> sending --ok--> sent
+                                                      --error--> pending
+
+The claim moves the rows with one locked SELECT + UPDATE, so of several
+concurrent senders exactly one gets each booking; the others leave it
+alone (an outbox row whose booking is claimed elsewhere is "skipped").
+A booking left in "sending" by a dead sender is claimable again after
+REMINDER_CLAIM_STALE_SECONDS.
+
+CONFIGURATION (settings.py):
+----------------------------
+    OUTBOX_MAX_ATTEMPTS = 5         # then the row is marked "failed"
+    OUTBOX_RETRY_BASE_SECONDS = 60  # 60s, 120s, 240s, ...
+    OUTBOX_STALE_SECONDS = 600
+
+=============================================================================
+"""
+
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from wash.models import Booking, OutboundEmail
+from wash.utils import send_reminder_emails
+
+logger = logging.getLogger(__name__)
+
+
+def reminder_claimable_q(now):
+    """Bookings whose reminder is not sent and not being sent."""
+    stale_before = now - timezone.timedelta(
+        seconds=getattr(settings, "REMINDER_CLAIM_STALE_SECONDS", 600)
+    )
+    return Q(reminder_state="pending") | Q(
+        reminder_state="sending", reminder_claimed_at__lt=stale_before
+    )
+
+
+def claim_reminders(booking_ids):
+    """
+    Atomically move the claimable bookings among booking_ids to "sending"
+    and return the set of ids claimed: only this caller may send them.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = set(
+            Booking.objects
+            .select_for_update(skip_locked=True)
+            .filter(reminder_claimable_q(now), pk__in=booking_ids)
+            .values_list("id", flat=True)
+        )
+        if ids:
+            Booking.objects.filter(id__in=ids).update(
+                reminder_state="sending", reminder_claimed_at=now
+            )
+    return ids
+
+
+def finish_reminders(sent_ids, failed_ids=()):
+    """Record the outcome of claimed reminders: sent, or claimable again."""
+    if sent_ids:
+        Booking.objects.filter(pk__in=sent_ids).update(
+            reminder_state="sent", reminder_claimed_at=None
+        )
+    if failed_ids:
+        Booking.objects.filter(pk__in=failed_ids, reminder_state="sending").update(
+            reminder_state="pending", reminder_claimed_at=None
+        )
+
+
+def enqueue_reminder(booking):
+    """
+    Queue the booking's reminder once the current transaction commits.
+    Costs a single INSERT; a reminder already waiting is left alone.
+    """
+    booking_id = booking.pk
+
+    def insert():
+        OutboundEmail.objects.bulk_create(
+            [OutboundEmail(booking_id=booking_id, kind="reminder")],
+            ignore_conflicts=True,
+        )
+
+    transaction.on_commit(insert)
+
+
+def due_reminders(now, batch_size):
+    """
+    Ids of up to batch_size bookings starting within REMINDER_HOURS_BEFORE
+    of `now`, not cancelled, not reminded (nor being reminded), and not in
+    the outbox yet. A "skipped" row doesn't count: a booking skipped while
+    cancelled or claimed elsewhere is queued again if it still needs one.
+    """
+    window_end = now + timezone.timedelta(hours=getattr(settings, "REMINDER_HOURS_BEFORE", 6))
+    queued = (
+        OutboundEmail.objects
+        .filter(booking=OuterRef("pk"), kind="reminder")
+        .exclude(status="skipped")
+    )
+    return list(
+        Booking.objects
+        .filter(reminder_claimable_q(now), scheduled_at__gt=now, scheduled_at__lte=window_end)
+        .exclude(status="cancelled")
+        .filter(~Exists(queued))
+        .order_by("scheduled_at")
+        .values_list("id", flat=True)[:batch_size]
+    )
+
+
+def enqueue_due_reminders(now=None, batch_size=500):
+    """
+    Queue the reminder of every booking now within the reminder window, one
+    INSERT per batch. Returns the number of reminders queued.
+    """
+    now = now or timezone.now()
+    total = 0
+    while True:
+        ids = due_reminders(now, batch_size)
+        if not ids:
+            return total
+        OutboundEmail.objects.bulk_create(
+            [OutboundEmail(booking_id=booking_id, kind="reminder") for booking_id in ids],
+            ignore_conflicts=True,
+        )
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2*base, 4*base, ..."""
+    base = getattr(settings, "OUTBOX_RETRY_BASE_SECONDS", 60)
+    return timezone.timedelta(seconds=base * 2 ** max(attempts - 1, 0))
+
+
+def claim_batch(batch_size=50):
+    """Atomically move up to batch_size due rows to "sending" and return them."""
+    now = timezone.now()
+    stale_before = now - timezone.timedelta(
+        seconds=getattr(settings, "OUTBOX_STALE_SECONDS", 600)
+    )
+
+    with transaction.atomic():
+        ids = list(
+            OutboundEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(
+                Q(status="pending", next_attempt_at__lte=now)
+                | Q(status="sending", locked_at__lt=stale_before)
+            )
+            .order_by("next_attempt_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+
+        OutboundEmail.objects.filter(id__in=ids).update(
+            status="sending",
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+
+    return list(
+        OutboundEmail.objects
+        .filter(id__in=ids)
+        .select_related("booking__user", "booking__service", "booking__vehicle")
+    )
+
+
+def claim_sendable(batch_size=50):
+    """
+    Claim one batch and the bookings behind it. Returns (rows processed,
+    rows to send): rows whose booking is cancelled, reminded or claimed
+    elsewhere are marked "skipped" here.
+    """
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, []
+
+    active = [email for email in emails if email.booking.status != "cancelled"]
+    # sent already, or being sent by another worker: not ours to send
+    claimed = claim_reminders([email.booking_id for email in active])
+    to_send = [email for email in active if email.booking_id in claimed]
+    skipped = [email.pk for email in emails if email.booking_id not in claimed]
+
+    if skipped:
+        OutboundEmail.objects.filter(pk__in=skipped).update(status="skipped", locked_at=None)
+
+    return len(emails), to_send
+
+
+def record_results(to_send, results):
+    """
+    Store the outcome of sending the rows `to_send`: `results` is the
+    [(booking, ok, error), ...] of send_reminder_emails(), in the same order.
+    """
+    now = timezone.now()
+    max_attempts = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 5)
+    sent = []
+    failed = []
+
+    for email, (booking, ok, error) in zip(to_send, results):
+        if ok:
+            sent.append(email)
+            continue
+        failed.append(email.booking_id)
+
+        # "no-email" will not fix itself by retrying
+        if error == "no-email" or email.attempts >= max_attempts:
+            status, next_attempt_at = "failed", email.next_attempt_at
+            logger.error(f"[OUTBOX] Giving up on {email}: {error}")
+        else:
+            status, next_attempt_at = "pending", now + retry_delay(email.attempts)
+            logger.warning(f"[OUTBOX] {email} failed (attempt {email.attempts}): {error}")
+
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            status=status,
+            next_attempt_at=next_attempt_at,
+            locked_at=None,
+            last_error=error or "unknown",
+        )
+
+    finish_reminders([e.booking_id for e in sent], failed)
+
+    if sent:
+        OutboundEmail.objects.filter(pk__in=[e.pk for e in sent]).update(
+            status="sent", sent_at=now, locked_at=None, last_error=""
+        )
+        logger.info(f"[OUTBOX] Sent {len(sent)} email(s)")
+
+
+def drain_once(batch_size=50, connection=None):
+    """
+    Claim and deliver one batch. Returns the number of rows processed
+    (0 when nothing is due).
+    """
+    processed, to_send = claim_sendable(batch_size)
+    if to_send:
+        results = send_reminder_emails([email.booking for email in to_send], connection=connection)
+        record_results(to_send, results)
+    return processed
+
+
+def drain_outbox(batch_size=50, connection=None):
+    """Deliver every due row; returns the number of rows processed."""
+    total = 0
+    while True:
+        processed = drain_once(batch_size, connection=connection)
+        if not processed:
+            return total
+        total += processed
@@ -0,0 +1,77 @@
+# wash/pagination.py
+"""
+Pagination « keyset » (par curseur) des listes de réservations, de la plus
+récente à la plus ancienne, sur (created_at, id).
+
+Une page suivante ne fait pas d'OFFSET : elle reprend après la dernière
+réservation affichée (created_at <= t, hors (t, id >= n)). Avec les index
+(…, -created_at, -id), la page 500 coûte autant que la page 1.
+
+    page = keyset_paginate(queryset, request.GET.get("cursor"))
+    page.object_list, page.has_next, page.next_cursor
+"""
+import base64
+from datetime import datetime
+
+PAGE_SIZE = 20
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, is_first):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.is_first = is_first
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(obj):
+    raw = f"{obj.created_at.isoformat()}|{obj.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(created_at, id) ou None si le curseur est absent ou invalide."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_paginate(queryset, cursor=None, per_page=PAGE_SIZE):
+    """Une page de `queryset` triée par (-created_at, -id), après `cursor`."""
+    queryset = queryset.order_by("-created_at", "-id")
+
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, pk = position
+        queryset = (
+            queryset
+            .filter(created_at__lte=created_at)
+            .exclude(created_at=created_at, id__gte=pk)
+        )
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    return KeysetPage(rows[:per_page], next_cursor, is_first=position is None)
+
+
+def page_query(request, cursor):
+    """Query string de la requête courante avec `cursor` remplacé (None : 1re page)."""
+    params = request.GET.copy()
+    params.pop("cursor", None)
+    if cursor:
+        params["cursor"] = cursor
+    return params.urlencode()
@@ -0,0 +1,213 @@
+# wash/pipeline.py
+"""
+=============================================================================
+BOOKING SAVE PIPELINE
+=============================================================================
+
+One post_save receiver for Booking instead of one per app.
+
+Apps register handlers with the booking fields they depend on:
+
+    from wash.pipeline import on_booking_change
+
+    @on_booking_change("status", "total_price")
+    def my_handler(change):
+        ...
+
+For every save the dispatcher builds a BookingChange (what was saved, what
+actually changed, status transition) and only runs the handlers whose
+fields changed. A save such as save(update_fields=['reminder_state']) runs
+no handler at all.
+
+Handlers run in registration order, i.e. INSTALLED_APPS order
+(wash, loyalty, badges), and share change.cached() so a value (loyalty
+profile, per-user totals, ...) is loaded once per save.
+
+BULK STATUS TRANSITIONS
+-----------------------
+bulk_transition() moves many bookings to one status with a single UPDATE
+(no post_save). Apps register a second handler for that case, which gets
+every BookingChange at once and can work per user instead of per booking:
+
+    from wash.pipeline import on_bulk_status_change
+
+    @on_bulk_status_change
+    def my_bulk_handler(batch):
+        for user_id, changes in batch.by_user().items():
+            ...
+
+=============================================================================
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from wash.models import Booking
+
+_handlers = []
+_bulk_handlers = []
+
+
+def on_booking_change(*fields):
+    """
+    Register a handler run on Booking saves that create the booking or change
+    one of `fields` (attribute names from Booking.TRACKED_FIELDS).
+    """
+    unknown = set(fields) - set(Booking.TRACKED_FIELDS)
+    if unknown:
+        raise ValueError(f"Booking fields not tracked: {', '.join(sorted(unknown))}")
+
+    def register(handler):
+        _handlers.append((handler, frozenset(fields)))
+        return handler
+
+    return register
+
+
+class BookingChange:
+    """What a single Booking.save() changed, plus a per-save cache."""
+
+    def __init__(self, booking, created, update_fields=None):
+        self.booking = booking
+        self.created = created
+
+        values = {name: getattr(booking, name) for name in Booking.TRACKED_FIELDS}
+        self.saved_fields = _saved_fields(update_fields)
+        self.previous = None if created else booking.loaded_values
+
+        if self.previous is None:
+            # created, or previous values unknown: assume saved fields changed
+            self.current = values
+            self.changed = self.saved_fields
+        else:
+            # fields left out of update_fields still hold their old value
+            self.current = {
+                name: values[name] if name in self.saved_fields else self.previous[name]
+                for name in Booking.TRACKED_FIELDS
+            }
+            self.changed = frozenset(
+                name for name in self.saved_fields
+                if self.current[name] != self.previous[name]
+            )
+
+        self._cache = {}
+
+    @property
+    def old_status(self):
+        return None if self.previous is None else self.previous["status"]
+
+    @property
+    def new_status(self):
+        return self.current["status"]
+
+    def became(self, status):
+        """True if this save moved the booking into `status`."""
+        return self.new_status == status and (self.created or self.old_status != status)
+
+    def left(self, status):
+        """True if this save moved the booking out of `status`."""
+        return self.old_status == status and self.new_status != status
+
+    def touches(self, fields):
+        return self.created or bool(self.changed & fields)
+
+    def cached(self, key, factory):
+        """Value shared by all handlers of this save, computed on first use."""
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+
+def _saved_fields(update_fields):
+    if update_fields is None:
+        return frozenset(Booking.TRACKED_FIELDS)
+    attnames = {Booking._meta.get_field(name).attname for name in update_fields}
+    return frozenset(name for name in Booking.TRACKED_FIELDS if name in attnames)
+
+
+@receiver(post_save, sender=Booking)
+def dispatch_booking_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """The only post_save receiver for Booking."""
+    if raw:
+        return
+
+    change = BookingChange(instance, created, update_fields)
+    if not change.changed and not created:
+        return
+
+    for handler, fields in _handlers:
+        if change.touches(fields):
+            handler(change)
+
+    instance.snapshot_tracked_fields(change.current)
+
+
+# =============================================================================
+# BULK STATUS TRANSITIONS
+# =============================================================================
+
+def on_bulk_status_change(handler):
+    """Register a handler run once per bulk_transition() with a BulkStatusChange."""
+    _bulk_handlers.append(handler)
+    return handler
+
+
+class BulkStatusChange:
+    """Every BookingChange of one bulk_transition(), plus a shared cache."""
+
+    def __init__(self, status, changes):
+        self.status = status
+        self.changes = changes
+        self._cache = {}
+
+    def by_user(self):
+        """{user_id: [BookingChange, ...]} in booking order."""
+        grouped = defaultdict(list)
+        for change in self.changes:
+            grouped[change.booking.user_id].append(change)
+        return dict(grouped)
+
+    def cached(self, key, factory):
+        if key not in self._cache:
+            self._cache[key] = factory()
+        return self._cache[key]
+
+
+def bulk_transition(bookings, status, from_statuses):
+    """
+    Move the bookings of queryset `bookings` currently in `from_statuses`
+    to `status`, in one transaction: the rows are locked, updated with one
+    UPDATE, then the bulk handlers run. Returns the bookings changed.
+    """
+    with transaction.atomic():
+        locked = list(
+            bookings
+            .filter(status__in=from_statuses)
+            .exclude(status=status)
+            .select_for_update()
+            .order_by("pk")
+        )
+        if not locked:
+            return []
+
+        # auto_now doesn't apply to update(): calendar feeds need updated_at
+        Booking.objects.filter(pk__in=[booking.pk for booking in locked]).update(
+            status=status, updated_at=timezone.now()
+        )
+
+        changes = []
+        for booking in locked:
+            booking.status = status
+            changes.append(BookingChange(booking, False, ["status"]))
+
+        batch = BulkStatusChange(status, changes)
+        for handler in _bulk_handlers:
+            handler(batch)
+
+    for change in changes:
+        change.booking.snapshot_tracked_fields(change.current)
+    return locked
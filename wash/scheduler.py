@@ -4,43 +4,54 @@
 AUTOMATIC EMAIL REMINDER SCHEDULER
 =============================================================================
 
-This module handles the automatic scheduling and sending of reminder emails
-for car wash bookings using APScheduler (Advanced Python Scheduler).
+This module handles the automatic sending of reminder emails for car wash
+bookings using APScheduler (Advanced Python Scheduler).
 
 HOW IT WORKS:
 -------------
-1. When Django starts, this scheduler starts automatically (see wash/apps.py)
-2. When a booking is created, a signal triggers (see wash/signals.py)
-3. The signal calls schedule_booking_reminder() to create a scheduled job
-4. The job is stored in the database (django_apscheduler tables)
-5. At the scheduled time, send_booking_reminder() runs automatically
-6. The reminder email is sent to the user
+1. The scheduler runs in ONE dedicated process:
+       python manage.py run_scheduler
+   (web workers and other manage.py commands don't start it, see
+   wash/apps.py). Extra run_scheduler processes wait on a PostgreSQL
+   advisory lock and take over if the leader dies.
+2. Every REMINDER_SWEEP_INTERVAL_SECONDS, sweep_reminders_job() runs
+3. It queues a reminder in the email outbox for every booking that starts
+   within REMINDER_HOURS_BEFORE and has none yet
+   (wash.outbox.enqueue_due_reminders, batched, on an index)
+4. Every OUTBOX_DRAIN_INTERVAL_SECONDS, drain_outbox_job() sends the
+   queued emails and marks the bookings reminder_state = 'sent'
+
+There is no job per booking: creating, moving or cancelling a booking only
+updates its row, and the scheduler's job store holds two jobs whatever the
+number of bookings.
 
 EXAMPLE:
 --------
 - Booking created for: Tomorrow at 14:00 (2 PM)
 - Reminder setting: 6 hours before
-- Job scheduled for: Tomorrow at 08:00 (8 AM)
-- At 08:00 tomorrow: Email is sent automatically
+- Tomorrow at 08:00, the booking enters the window: the next sweep
+  (within a minute) queues its reminder, the next drain sends it
 
 COMPONENTS:
 -----------
-- scheduler: Background scheduler that runs 24/7 with Django
-- send_booking_reminder(): Function that runs at scheduled time to send email
-- schedule_booking_reminder(): Function to create a new scheduled job
-- start_scheduler(): Starts the scheduler when Django starts
-- stop_scheduler(): Stops the scheduler when Django shuts down
+- scheduler: Background scheduler hosted by the run_scheduler command
+- sweep_reminders_job(): Periodic job queueing the due reminders
+- drain_outbox_job(): Periodic job delivering the email outbox
+- acquire_leadership() / release_leadership(): Leader election lock
+- start_scheduler(): Starts the scheduler (called by run_scheduler)
+- stop_scheduler(): Stops the scheduler when run_scheduler exits
 
 DEPENDENCIES:
 -------------
 - APScheduler: Python scheduling library
 - django-apscheduler: Django integration for APScheduler
-- wash.utils.send_reminder_email: Function that sends the actual email
+- wash.outbox: Reminder sweep and email outbox
 
 CONFIGURATION:
 --------------
 In settings.py:
     REMINDER_HOURS_BEFORE = 6  # How many hours before booking to send reminder
+    REMINDER_SWEEP_INTERVAL_SECONDS = 60
 
 In .env:
     REMINDER_HOURS_BEFORE=6
@@ -49,15 +60,12 @@ In .env:
 """
 
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from django_apscheduler.jobstores import DjangoJobStore
-from django.utils import timezone
 from django.conf import settings
+from django.db import connection
 import logging
 
-from wash.models import Booking
-from wash.utils import send_reminder_email
-
 logger = logging.getLogger(__name__)
 
 # =============================================================================
@@ -73,187 +81,98 @@ scheduler = BackgroundScheduler()
 scheduler.add_jobstore(DjangoJobStore(), "default")
 
 
+# first key of pg_try_advisory_lock(int, int), next to capacity's 7301
+SCHEDULER_LOCK_NAMESPACE = 7302
+SCHEDULER_LOCK_KEY = 1
+
+
 # =============================================================================
-# JOB FUNCTION (Runs at scheduled time)
+# LEADER ELECTION
 # =============================================================================
 
-def send_booking_reminder(booking_id):
+def acquire_leadership():
     """
-    Send a reminder email for a specific booking.
+    Try to become the scheduler host; True if this process holds the lock.
 
-    This function is called by APScheduler at the scheduled time.
-    It runs automatically without any manual intervention.
+    The lock is a session-level advisory lock: it belongs to this thread's
+    database connection and PostgreSQL releases it when the connection
+    closes, so a leader that crashes or loses its connection lets a
+    standby run_scheduler take over.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_try_advisory_lock(%s, %s)",
+            [SCHEDULER_LOCK_NAMESPACE, SCHEDULER_LOCK_KEY],
+        )
+        return cursor.fetchone()[0]
 
-    PROCESS:
-    --------
-    1. Fetch the booking from database by ID
-    2. Check if reminder was already sent (safety check)
-    3. Check if booking was cancelled (don't send if cancelled)
-    4. Call send_reminder_email() to send the actual email
-    5. Mark booking.reminder_sent = True
-    6. Log success or failure
 
-    Args:
-        booking_id (int): The ID of the Booking object to send reminder for
+def release_leadership():
+    """Release the lock taken by acquire_leadership() on this connection."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_unlock(%s, %s)",
+            [SCHEDULER_LOCK_NAMESPACE, SCHEDULER_LOCK_KEY],
+        )
+        return cursor.fetchone()[0]
 
-    Returns:
-        None (logs results instead)
 
-    Example:
-        When this runs at 08:00 for booking #123:
-        - Fetches Booking #123 from database
-        - Sends email to user's email address
-        - Sets booking.reminder_sent = True
-        - Logs: "[OK] Sent reminder for booking #123"
+def still_leader():
+    """
+    False if the connection holding the lock is gone (the lock with it).
     """
     try:
-        # Fetch the booking from database
-        booking = Booking.objects.get(pk=booking_id)
-
-        # Safety check: Skip if reminder already sent
-        if booking.reminder_sent:
-            logger.info(f"Skipping booking #{booking_id} - reminder already sent")
-            return
-
-        # Safety check: Skip if booking is cancelled
-        if booking.status == 'cancelled':
-            logger.info(f"Skipping booking #{booking_id} - booking is cancelled")
-            return
-
-        # Send the reminder email
-        # send_reminder_email() is defined in wash/utils.py
-        # It handles email construction, SMTP sending, attachments, etc.
-        ok, error = send_reminder_email(booking, dry_run=False)
-
-        if ok:
-            # Email sent successfully
-            # Mark reminder as sent so we don't send again
-            booking.reminder_sent = True
-            booking.save(update_fields=['reminder_sent'])
-            logger.info(f"[OK] Sent reminder for booking #{booking_id}")
-        else:
-            # Email failed to send
-            logger.error(f"[ERROR] Failed to send reminder for booking #{booking_id}: {error}")
-
-    except Booking.DoesNotExist:
-        # Booking was deleted before reminder was sent
-        logger.error(f"Booking #{booking_id} not found - may have been deleted")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_locks WHERE locktype = 'advisory'"
+                " AND classid = %s AND objid = %s AND pid = pg_backend_pid()"
+                " AND granted",
+                [SCHEDULER_LOCK_NAMESPACE, SCHEDULER_LOCK_KEY],
+            )
+            return cursor.fetchone() is not None
     except Exception as e:
-        # Any other unexpected error
-        logger.error(f"Error sending reminder for booking #{booking_id}: {str(e)}")
+        logger.error(f"Scheduler lock check failed: {str(e)}")
+        return False
 
 
 # =============================================================================
-# SCHEDULING FUNCTION (Creates jobs)
+# JOB FUNCTIONS (Run periodically)
 # =============================================================================
 
-def schedule_booking_reminder(booking, hours_before=6):
+def sweep_reminders_job():
     """
-    Schedule a reminder email to be sent X hours before the booking time.
-
-    This is called by the Django signal when a booking is created/updated.
-    It creates a scheduled job that will run at the calculated time.
-
-    PROCESS:
-    --------
-    1. Calculate when to send reminder: booking_time - hours_before
-    2. Check if reminder time is in the future (can't schedule past times)
-    3. Create a unique job ID based on booking ID
-    4. Remove any existing job for this booking (in case of updates)
-    5. Create new APScheduler job with DateTrigger
-    6. Job is saved to database automatically
-    7. At the scheduled time, send_booking_reminder() will run
-
-    Args:
-        booking (Booking): The Booking object to schedule reminder for
-        hours_before (int): How many hours before booking to send (default: 6)
-
-    Returns:
-        bool: True if successfully scheduled, False if failed
-
-    Example 1 (Future booking):
-        booking.scheduled_at = "2026-01-05 14:00"
-        hours_before = 6
-        → reminder_time = "2026-01-05 08:00"
-        → Job created to run at 08:00 tomorrow
-        → Returns True
-
-    Example 2 (Past reminder time):
-        Current time = "2026-01-04 13:00"
-        booking.scheduled_at = "2026-01-04 14:00"
-        hours_before = 6
-        → reminder_time = "2026-01-04 08:00" (already passed!)
-        → Cannot schedule
-        → Returns False
-    """
-
-    # Check if booking has a scheduled time
-    if not booking.scheduled_at:
-        logger.warning(f"Booking #{booking.pk} has no scheduled_at time - cannot schedule reminder")
-        return False
-
-    # Calculate when to send the reminder
-    # scheduled_at is a timezone-aware datetime
-    # timedelta(hours=6) subtracts 6 hours
-    reminder_time = booking.scheduled_at - timezone.timedelta(hours=hours_before)
-
-    # Get current time (timezone-aware)
-    now = timezone.now()
-
-    # Check if reminder time is in the past
-    # We can't schedule jobs for past times!
-    if reminder_time <= now:
-        logger.warning(
-            f"Booking #{booking.pk} reminder time ({reminder_time}) is in the past, "
-            f"cannot schedule (current time: {now})"
-        )
-        return False
+    Queue the reminders of the bookings entering the reminder window.
 
-    # Create a unique job ID based on booking ID
-    # Format: "booking_reminder_123"
-    # This allows us to find and update/delete the job later
-    job_id = f"booking_reminder_{booking.pk}"
-
-    # Remove existing job if it exists
-    # This happens when a booking is updated and needs rescheduling
-    try:
-        scheduler.remove_job(job_id)
-        logger.info(f"Removed existing job for booking #{booking.pk}")
-    except:
-        # No existing job, that's fine
-        pass
+    Runs every REMINDER_SWEEP_INTERVAL_SECONDS. Bookings already queued,
+    reminded or cancelled are skipped by the query itself, so a sweep with
+    nothing due is a single indexed SELECT.
+    """
+    from wash.outbox import enqueue_due_reminders
 
-    # Schedule the job
     try:
-        scheduler.add_job(
-            # Function to call at scheduled time
-            send_booking_reminder,
-
-            # Use DateTrigger to run once at specific time
-            trigger=DateTrigger(run_date=reminder_time),
-
-            # Arguments to pass to send_booking_reminder()
-            args=[booking.pk],
-
-            # Unique ID for this job
-            id=job_id,
+        queued = enqueue_due_reminders()
+        if queued:
+            logger.info(f"[OK] Reminder sweep: {queued} reminder(s) queued")
+    except Exception as e:
+        logger.error(f"Error sweeping reminders: {str(e)}")
 
-            # Replace if job with same ID exists
-            replace_existing=True,
 
-            # Human-readable name (for debugging)
-            name=f"Reminder for Booking #{booking.pk}"
-        )
+def drain_outbox_job():
+    """
+    Deliver queued emails from the outbox (see wash/outbox.py).
 
-        logger.info(
-            f"[OK] Scheduled reminder for Booking #{booking.pk} "
-            f"at {reminder_time.strftime('%Y-%m-%d %H:%M:%S')}"
-        )
-        return True
+    Runs every OUTBOX_DRAIN_INTERVAL_SECONDS. Reminders queued by the sweep
+    (or by the signal, for a booking made less than REMINDER_HOURS_BEFORE
+    ahead) are sent here, outside the user's request.
+    """
+    from wash.outbox import drain_outbox
 
+    try:
+        processed = drain_outbox()
+        if processed:
+            logger.info(f"[OK] Outbox drained: {processed} email(s) processed")
     except Exception as e:
-        logger.error(f"Error scheduling reminder for booking #{booking.pk}: {str(e)}")
-        return False
+        logger.error(f"Error draining outbox: {str(e)}")
 
 
 # =============================================================================
@@ -264,21 +183,21 @@ def start_scheduler():
     """
     Start the APScheduler if it's not already running.
 
-    This is called automatically when Django starts (see wash/apps.py).
-    The scheduler runs in a background thread and checks for jobs to execute.
+    Called by `python manage.py run_scheduler` once it holds the leader
+    lock. The scheduler runs in a background thread and checks for jobs
+    to execute.
 
     IMPORTANT:
     ----------
     The scheduler must be running for jobs to execute!
-    If Django is stopped, scheduled jobs won't run.
+    If run_scheduler is stopped, scheduled jobs won't run.
     For production, use a process manager (systemd, supervisor, etc.)
-    to keep Django running 24/7.
+    to keep run_scheduler running 24/7, next to the web workers.
 
     Example:
-        Django starts → apps.py calls start_scheduler()
+        run_scheduler acquires the lock → start_scheduler()
         → Scheduler starts in background thread
-        → Watches for jobs to execute
-        → Runs send_booking_reminder() at scheduled times
+        → Runs the reminder sweep and the outbox drain periodically
     """
     if not scheduler.running:
         scheduler.start()
@@ -286,16 +205,49 @@ def start_scheduler():
     else:
         logger.info("APScheduler is already running")
 
+    # Periodic job queueing the reminders of the bookings now due
+    try:
+        scheduler.add_job(
+            sweep_reminders_job,
+            trigger=IntervalTrigger(
+                seconds=getattr(settings, "REMINDER_SWEEP_INTERVAL_SECONDS", 60)
+            ),
+            id="sweep_reminders",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            name="Sweep due reminders",
+        )
+    except Exception as e:
+        logger.error(f"Error scheduling reminder sweep job: {str(e)}")
+
+    # Periodic job delivering the email outbox
+    try:
+        scheduler.add_job(
+            drain_outbox_job,
+            trigger=IntervalTrigger(
+                seconds=getattr(settings, "OUTBOX_DRAIN_INTERVAL_SECONDS", 30)
+            ),
+            id="drain_outbox",
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            name="Drain email outbox",
+        )
+    except Exception as e:
+        logger.error(f"Error scheduling outbox drain job: {str(e)}")
+
 
 def stop_scheduler():
     """
     Stop the APScheduler gracefully.
 
-    This is called when Django shuts down.
+    This is called when run_scheduler exits (Ctrl+C, SIGTERM, lost lock).
     It ensures all running jobs complete before stopping.
 
-    Note: Scheduled jobs remain in database and will resume
-    when scheduler starts again.
+    Note: The periodic jobs remain in database and resume when the
+    scheduler starts again; reminders missed meanwhile are picked up by
+    the first sweep.
     """
     if scheduler.running:
         scheduler.shutdown()
@@ -4,8 +4,9 @@
 DJANGO SIGNALS FOR AUTOMATIC REMINDER SCHEDULING
 =============================================================================
 
-This module uses Django signals to automatically schedule reminder emails
-when bookings are created or updated.
+This module uses Django signals to queue reminder emails right away for
+bookings created or moved close to their start time. All other reminders
+are queued by the scheduler's periodic sweep (wash/scheduler.py).
 
 WHAT ARE DJANGO SIGNALS?
 -------------------------
@@ -14,18 +15,20 @@ Think of them like "triggers" in a database.
 
 In our case:
 - EVENT: A Booking is saved (created or updated)
-- TRIGGER: auto_schedule_reminder() function runs
+- TRIGGER: auto_schedule_reminder() function runs (through the Booking
+  save pipeline, wash/pipeline.py)
 - ACTION: Email reminder is scheduled automatically
 
 HOW IT WORKS:
 -------------
 1. User creates a booking through the website
 2. Django saves the Booking to database
-3. post_save signal fires automatically
-4. auto_schedule_reminder() function is called
+3. post_save signal fires automatically (wash.pipeline dispatcher)
+4. auto_schedule_reminder() function is called if status/date/time changed
 5. Function checks the booking details
-6. Decides whether to send immediately or schedule for later
-7. Either sends email now OR schedules it via APScheduler
+6. Decides whether the reminder is already due
+7. Queues the email in the outbox if it is; otherwise the reminder sweep
+   queues it when the booking enters the reminder window
 
 TWO SCENARIOS:
 --------------
@@ -34,15 +37,17 @@ Scenario A: Booking is SOON (< 6 hours away)
 --------------------------------------------
 Example: Current time 13:00, booking at 14:00 (1 hour away)
 - Cannot schedule for "6 hours before" (would be 08:00, already passed)
-- SOLUTION: Send email IMMEDIATELY when booking is created
-- User gets instant confirmation
+- SOLUTION: Queue the email in the outbox (wash/outbox.py) when the
+  booking is committed; a worker delivers it within seconds
+- The HTTP request never waits on the SMTP server
 
 Scenario B: Booking is FAR (> 6 hours away)
 --------------------------------------------
 Example: Current time 13:00, booking tomorrow at 14:00
-- Can schedule for "6 hours before" (tomorrow at 08:00)
-- SOLUTION: Create APScheduler job for tomorrow 08:00
-- Email will be sent automatically at that time
+- Nothing to do now: no job is created for the booking
+- Tomorrow at 08:00 the booking enters the window; the scheduler's
+  reminder sweep queues its email in the outbox within a minute
+- Moving the booking later is just a field update
 
 SIGNAL REGISTRATION:
 --------------------
@@ -51,8 +56,7 @@ See wash/apps.py for the import that activates it.
 
 DEPENDENCIES:
 -------------
-- wash.scheduler: Contains scheduling functions
-- wash.utils: Contains email sending functions
+- wash.outbox: Email outbox (immediate reminders)
 - wash.models: Booking model
 
 CONFIGURATION:
@@ -63,42 +67,176 @@ In settings.py or .env:
 =============================================================================
 """
 
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.conf import settings
 from django.utils import timezone
 import logging
 
-from wash.models import Booking
+from wash.models import Booking, Service, Vehicle
+from wash import availability, catalogue, dashboard, stats
+from wash.pipeline import on_booking_change, on_bulk_status_change
 
 logger = logging.getLogger(__name__)
 
 
+# =============================================================================
+# BOOKING AGGREGATES (BookingDailyStats, UserBookingStats)
+# =============================================================================
+# Booking saves go through the single dispatcher of wash/pipeline.py; these
+# handlers are registered first so the aggregates are current before the
+# loyalty and badge handlers read them.
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_values(sender, instance, raw=False, **kwargs):
+    """
+    Bookings loaded from the database already carry their previous values
+    (see Booking.from_db). For an instance built by hand with an existing pk,
+    fetch them once so the rollup can subtract the old contribution.
+    """
+    if raw or instance.pk is None or instance.loaded_values is not None:
+        return
+
+    previous = (
+        Booking.objects
+        .filter(pk=instance.pk)
+        .values(*Booking.TRACKED_FIELDS)
+        .first()
+    )
+    if previous is not None:
+        instance._loaded_values = previous
+
+
+@on_booking_change("status", "service_id", "scheduled_date", "total_price")
+def update_daily_stats(change):
+    """Apply the booking's change to the dashboard rollup."""
+    stats.record_booking_save(change.booking, change.previous, change.current)
+
+
+@on_booking_change("status", "total_price", "user_id")
+def update_user_booking_stats(change):
+    """
+    Keep the user's UserBookingStats counters in step (read by badges). A
+    booking moved to another user moves its contribution with it.
+    """
+    stats.record_user_booking_save(change.booking.user_id, change.previous, change.current)
+
+
+@on_bulk_status_change
+def update_aggregates_in_bulk(batch):
+    """Same as the two handlers above for a bulk status transition."""
+    stats.record_booking_changes(batch.changes)
+
+
+@receiver(post_delete, sender=Booking)
+def remove_from_daily_stats(sender, instance, **kwargs):
+    """Remove a deleted booking from the dashboard rollup and user counters."""
+    stats.record_booking_delete(instance)
+    stats.record_user_booking_delete(instance)
+
+
+# =============================================================================
+# AVAILABILITY CACHE (wash/availability.py)
+# =============================================================================
+
+def _booking_days(change):
+    days = {change.current["scheduled_date"]}
+    if change.previous is not None:
+        days.add(change.previous["scheduled_date"])
+    return days
+
+
+@on_booking_change("status", "service_id", "scheduled_date", "scheduled_time")
+def invalidate_availability(change):
+    """Drop the cached occupancy of the day(s) this booking occupied/occupies."""
+    availability.invalidate_days(_booking_days(change))
+
+
+@on_bulk_status_change
+def invalidate_availability_in_bulk(batch):
+    days = set()
+    for change in batch.changes:
+        days |= _booking_days(change)
+    availability.invalidate_days(days)
+
+
+@receiver(post_delete, sender=Booking)
+def invalidate_deleted_booking_availability(sender, instance, **kwargs):
+    availability.invalidate_days([instance.scheduled_date])
+
+
+# =============================================================================
+# CUSTOMER DASHBOARD CACHE (wash/dashboard.py)
+# =============================================================================
+
+@on_booking_change(
+    "status", "service_id", "scheduled_date", "scheduled_time", "total_price", "user_id",
+)
+def invalidate_home_dashboard(change):
+    user_ids = [change.booking.user_id]
+    if change.previous is not None:
+        # booking moved to another user: the previous owner's page changes too
+        user_ids.append(change.previous["user_id"])
+    dashboard.bump_versions(user_ids)
+
+
+@on_bulk_status_change
+def invalidate_home_dashboards_in_bulk(batch):
+    dashboard.bump_versions(batch.by_user())
+
+
+@receiver(post_delete, sender=Booking)
+def invalidate_deleted_booking_home_dashboard(sender, instance, **kwargs):
+    dashboard.bump_versions([instance.user_id])
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_vehicle_owner_home_dashboard(sender, instance, **kwargs):
+    dashboard.bump_versions([instance.owner_id])
+
+
+# =============================================================================
+# SERVICE CATALOGUE CACHE (wash/catalogue.py)
+# =============================================================================
+
+@receiver(post_save, sender=Service)
+@receiver(post_delete, sender=Service)
+def invalidate_service_catalogue(sender, **kwargs):
+    catalogue.services.invalidate()
+
+
+@receiver(pre_delete, sender=Service)
+def fold_deleted_service_stats(sender, instance, **kwargs):
+    """Keep a deleted service's bookings counted under "no service"."""
+    stats.fold_service_stats(instance)
+
+
 # =============================================================================
 # MAIN SIGNAL HANDLER
 # =============================================================================
 
-@receiver(post_save, sender=Booking)
-def auto_schedule_reminder(sender, instance, created, **kwargs):
+@on_booking_change("status", "scheduled_date", "scheduled_time")
+def auto_schedule_reminder(change):
     """
     Automatically schedule or send reminder email when a booking is saved.
 
-    This function is a Django signal receiver. It runs AUTOMATICALLY every time
-    a Booking object is saved to the database (created or updated).
+    This function is a Booking save handler. It runs AUTOMATICALLY every time
+    a Booking is created, or saved with a new status/date/time.
 
     DECORATOR EXPLANATION:
     ----------------------
-    @receiver(post_save, sender=Booking)
-    - post_save: Signal fires AFTER a model instance is saved
-    - sender=Booking: Only fire for Booking model (not other models)
-    - This registers the function with Django's signal system
+    @on_booking_change("status", "scheduled_date", "scheduled_time")
+    - Registers the function with the single Booking post_save dispatcher
+      (see wash/pipeline.py)
+    - Saves that change none of these fields skip this handler, e.g.
+      save(update_fields=['reminder_state'])
 
     FUNCTION PARAMETERS:
     --------------------
-    - sender: The model class (Booking)
-    - instance: The actual Booking object that was saved
-    - created: Boolean - True if new booking, False if update
-    - **kwargs: Other signal arguments (we don't use them)
+    - change: BookingChange for this save
+      - change.booking: The actual Booking object that was saved
+      - change.created: Boolean - True if new booking, False if update
 
     LOGIC FLOW:
     -----------
@@ -108,18 +246,19 @@ def auto_schedule_reminder(sender, instance, created, **kwargs):
        - Has scheduled date/time
 
     2. Calculate time until booking:
-       - If < 6 hours: Send email IMMEDIATELY
-       - If >= 6 hours: Schedule email for later
+       - If < 6 hours: Queue email in the outbox NOW
+       - If >= 6 hours: Nothing to do, the reminder sweep will queue it
 
     3. For immediate emails:
-       - Call send_reminder_email() directly
-       - Mark reminder_sent = True
+       - Call enqueue_reminder(): one OutboundEmail INSERT on commit
+       - The outbox worker claims the booking, sends it and marks
+         reminder_state = 'sent'
        - Log result
 
-    4. For scheduled emails:
-       - Call schedule_booking_reminder()
-       - Creates APScheduler job in database
-       - Job will run at calculated time
+    4. For later bookings:
+       - No job is created: wash.outbox.enqueue_due_reminders() (the
+         scheduler's sweep) queues the email once the booking is less
+         than 6 hours away
 
     EXAMPLES:
     ---------
@@ -127,13 +266,13 @@ def auto_schedule_reminder(sender, instance, created, **kwargs):
         Time: 13:00
         Create booking for: 14:00 (1 hour away)
         Setting: REMINDER_HOURS_BEFORE = 6
-        Result: Email sent NOW (cannot send 6 hours before)
+        Result: Email queued NOW (cannot send 6 hours before)
 
-    Example 2: Scheduled email
+    Example 2: Later email
         Time: 13:00 Monday
         Create booking for: 14:00 Tuesday
         Setting: REMINDER_HOURS_BEFORE = 6
-        Result: Email scheduled for Tuesday 08:00
+        Result: Email queued by the sweep on Tuesday, shortly after 08:00
 
     Example 3: Cancelled booking
         Create booking, then cancel it
@@ -141,16 +280,16 @@ def auto_schedule_reminder(sender, instance, created, **kwargs):
 
     Example 4: Update booking
         Update booking time from 14:00 to 15:00
-        Result: Old scheduled job removed, new job created for new time
+        Result: Nothing to reschedule: the sweep reads the new time
     """
 
-    # Import scheduler functions here to avoid circular imports
-    # (scheduler.py imports models, signals.py imports scheduler)
-    from wash.scheduler import schedule_booking_reminder
-    from wash.utils import send_reminder_email
+    # Imported here to avoid circular imports
+    # (outbox.py imports models and utils)
+    from wash.outbox import enqueue_reminder
 
     # Get the booking object that was just saved
-    booking = instance
+    booking = change.booking
+    created = change.created
 
     # ==========================================================================
     # VALIDATION CHECKS - Skip if booking shouldn't have reminder
@@ -163,8 +302,9 @@ def auto_schedule_reminder(sender, instance, created, **kwargs):
         return
 
     # Check 2: Skip if reminder already sent
-    # Prevents duplicate emails when booking is updated
-    if booking.reminder_sent:
+    # Prevents duplicate emails when booking is updated (a reminder being
+    # sent is left to its sender: the outbox would skip a second one anyway)
+    if booking.reminder_state == 'sent':
         logger.info(f"Booking #{booking.pk} reminder already sent - not rescheduling")
         return
 
@@ -183,7 +323,7 @@ def auto_schedule_reminder(sender, instance, created, **kwargs):
     hours_before = getattr(settings, 'REMINDER_HOURS_BEFORE', 6)
 
     # ==========================================================================
-    # DECISION LOGIC - Send now or schedule for later?
+    # DECISION LOGIC - Queue now or leave to the sweep?
     # ==========================================================================
 
     # Calculate how many hours until the booking
@@ -191,55 +331,41 @@ def auto_schedule_reminder(sender, instance, created, **kwargs):
     time_until_booking = (booking.scheduled_at - now).total_seconds() / 3600  # Convert to hours
 
     # ==========================================================================
-    # SCENARIO A: Booking is SOON - Send email IMMEDIATELY
+    # SCENARIO A: Booking is SOON - Queue email IMMEDIATELY
     # ==========================================================================
 
     # If booking is less than "hours_before" away, we can't schedule
     # for that time (it would be in the past).
-    # Solution: Send the reminder email RIGHT NOW!
+    # Solution: Queue the reminder in the outbox RIGHT NOW! The insert
+    # happens on commit and the SMTP work is done by the outbox worker,
+    # never inside the user's request.
 
     if time_until_booking < hours_before and time_until_booking > 0:
         logger.info(
             f"[AUTO] Booking #{booking.pk} is in {time_until_booking:.1f} hours "
-            f"(< {hours_before} hours) - sending reminder NOW"
+            f"(< {hours_before} hours) - queueing reminder NOW"
         )
 
-        # Send the email immediately
-        ok, error = send_reminder_email(booking, dry_run=False)
-
-        if ok:
-            # Email sent successfully!
-            # Mark as sent so we don't send again
-            booking.reminder_sent = True
-            booking.save(update_fields=['reminder_sent'])
-            logger.info(f"[AUTO] Sent IMMEDIATE reminder for booking #{booking.pk}")
-        else:
-            # Email failed to send
-            logger.error(f"[AUTO] Failed to send immediate reminder: {error}")
+        enqueue_reminder(booking)
 
-        # We're done - email was sent immediately
+        # We're done - the outbox worker sends it and sets reminder_state
         return
 
     # ==========================================================================
-    # SCENARIO B: Booking is FAR - Schedule email for later
+    # SCENARIO B: Booking is FAR - Left to the reminder sweep
     # ==========================================================================
 
-    # Booking is far enough in the future that we can schedule
-    # a reminder for "hours_before" before it.
-    # Example: Booking tomorrow at 14:00, schedule email for tomorrow at 08:00
+    # Booking is far enough in the future: nothing is stored for it. The
+    # scheduler's sweep (wash.outbox.enqueue_due_reminders) queues the
+    # reminder once the booking is less than "hours_before" away, reading
+    # whatever date/time the booking has by then.
+    # Example: Booking tomorrow at 14:00, queued by the sweep tomorrow ~08:00
 
-    success = schedule_booking_reminder(booking, hours_before=hours_before)
-
-    if success:
-        # Job was successfully created and saved to database
-        if created:
-            logger.info(f"[AUTO] Scheduled reminder for NEW booking #{booking.pk}")
-        else:
-            logger.info(f"[AUTO] Rescheduled reminder for UPDATED booking #{booking.pk}")
-    else:
-        # Failed to create scheduled job
-        # This might happen if booking time is in the past
-        logger.warning(f"[AUTO] Failed to schedule reminder for booking #{booking.pk}")
+    if time_until_booking > 0:
+        logger.info(
+            f"[AUTO] Reminder for {'NEW' if created else 'UPDATED'} booking #{booking.pk} "
+            f"left to the sweep (due in {time_until_booking - hours_before:.1f} hours)"
+        )
 
 
 # =============================================================================
@@ -251,13 +377,15 @@ DATABASE TABLES:
 ----------------
 This signal doesn't create tables itself, but uses these tables:
 - wash_booking: Where bookings are stored
-- django_apscheduler_djangojob: Where scheduled jobs are stored
+- wash_outboundemail: Outbox of reminders to send now
+- django_apscheduler_djangojob: The periodic sweep / outbox jobs
 - django_apscheduler_djangojobexecution: Job execution history
 
 TESTING:
 --------
 To test this signal:
 1. Start Django: python manage.py runserver
+   and the scheduler: python manage.py run_scheduler
 2. Create a booking through the website
 3. Watch Django console for log messages
 4. Check scheduled jobs: python check_jobs.py
@@ -272,7 +400,7 @@ If emails aren't being sent:
 5. Run: python manage.py shell
    >>> from wash.models import Booking
    >>> b = Booking.objects.latest('id')
-   >>> print(b.scheduled_at, b.reminder_sent, b.status)
+   >>> print(b.scheduled_at, b.reminder_state, b.status)
 
 SIGNAL REGISTRATION:
 --------------------
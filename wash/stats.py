@@ -0,0 +1,314 @@
+# wash/stats.py
+"""
+Maintenance des agrégats de réservations :
+- BookingDailyStats (rollup jour × service × statut du dashboard admin)
+- UserBookingStats (compteurs par utilisateur : home, badges, liste users)
+
+BookingDailyStats
+-----------------
+
+Chaque réservation contribue à (au plus) deux lignes du rollup :
+- (jour de création, service, statut) : +1 created_count, +total_price revenue
+- (jour programmé, service, statut)   : +1 scheduled_count
+
+Les handlers de wash/signals.py appliquent la différence entre l'ancienne et
+la nouvelle contribution à chaque save/delete ; rebuild_daily_stats() recalcule
+tout depuis la table Booking (commande `rebuild_booking_stats`).
+
+UserBookingStats
+----------------
+record_user_booking_save() applique un delta (+/-1, +/-total_price) avec
+des F() quand le statut ou le prix change ; une réservation réattribuée à
+un autre utilisateur (user_id modifié) retire sa contribution à l'ancien
+et l'ajoute au nouveau. Les badges du nouvel utilisateur ne sont pas
+réévalués à ce moment-là : ils le seront à son prochain franchissement
+de seuil. reconcile_user_booking_stats() recalcule tout (commande
+`reconcile_booking_stats`).
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from wash.models import Booking, BookingDailyStats, UserBookingStats
+
+
+def _empty_row():
+    return {"created_count": 0, "scheduled_count": 0, "revenue": Decimal("0")}
+
+
+def _add_contribution(rows, created_day, values, sign):
+    """Ajoute (sign=1) ou retire (sign=-1) la contribution d'une réservation."""
+    service_id = values["service_id"]
+    status = values["status"]
+
+    row = rows[(created_day, service_id, status)]
+    row["created_count"] += sign
+    row["revenue"] += sign * Decimal(str(values["total_price"] or 0))
+
+    if values["scheduled_date"]:
+        rows[(values["scheduled_date"], service_id, status)]["scheduled_count"] += sign
+
+
+def _current_values(booking):
+    return {name: getattr(booking, name) for name in Booking.TRACKED_FIELDS}
+
+
+def _bump(day, service_id, status, created_count=0, scheduled_count=0, revenue=0):
+    """Incrémente une ligne du rollup (créée si besoin) avec des F()."""
+    rows = BookingDailyStats.objects.filter(day=day, service_id=service_id, status=status)
+    changes = {
+        "created_count": F("created_count") + created_count,
+        "scheduled_count": F("scheduled_count") + scheduled_count,
+        "revenue": F("revenue") + revenue,
+    }
+    if rows.update(**changes):
+        return
+
+    try:
+        with transaction.atomic():
+            BookingDailyStats.objects.create(
+                day=day,
+                service_id=service_id,
+                status=status,
+                created_count=created_count,
+                scheduled_count=scheduled_count,
+                revenue=revenue,
+            )
+    except IntegrityError:
+        # Une requête concurrente vient de créer la ligne
+        rows.update(**changes)
+
+
+def _apply(rows):
+    for (day, service_id, status), delta in rows.items():
+        if any(delta.values()):
+            _bump(day, service_id, status, **delta)
+
+
+def record_booking_save(booking, previous, current):
+    """
+    Répercute un save de Booking sur le rollup : retire la contribution
+    `previous` (None pour une création) et ajoute `current`.
+    """
+    if booking.created_at is None:
+        return
+
+    created_day = timezone.localdate(booking.created_at)
+    rows = defaultdict(_empty_row)
+
+    if previous is not None:
+        _add_contribution(rows, created_day, previous, -1)
+    _add_contribution(rows, created_day, current, 1)
+
+    _apply(rows)
+
+
+def record_booking_delete(booking):
+    """Retire une réservation supprimée du rollup."""
+    if booking.created_at is None:
+        return
+
+    rows = defaultdict(_empty_row)
+    values = booking.loaded_values or _current_values(booking)
+    _add_contribution(rows, timezone.localdate(booking.created_at), values, -1)
+    _apply(rows)
+
+
+def record_booking_changes(changes):
+    """
+    Version groupée de record_booking_save() + record_user_booking_save()
+    pour une transition en masse (wash.pipeline.bulk_transition) : une
+    écriture par ligne du rollup et par utilisateur, pas par réservation.
+    """
+    rows = defaultdict(_empty_row)
+    users = defaultdict(lambda: [0, 0, Decimal("0")])
+
+    for change in changes:
+        booking = change.booking
+        if booking.created_at is not None:
+            created_day = timezone.localdate(booking.created_at)
+            _add_contribution(rows, created_day, change.previous, -1)
+            _add_contribution(rows, created_day, change.current, 1)
+
+        totals = users[booking.user_id]
+        for i, delta in enumerate(user_counters_delta(change.previous, change.current)):
+            totals[i] += delta
+
+    _apply(rows)
+    for user_id, delta in users.items():
+        if any(delta):
+            _bump_user(user_id, *delta)
+
+
+def fold_service_stats(service):
+    """
+    Reporte les stats d'un service sur les lignes « sans service » avant sa
+    suppression (les réservations passent alors à service=NULL).
+    """
+    for row in BookingDailyStats.objects.filter(service=service):
+        _bump(
+            row.day, None, row.status,
+            created_count=row.created_count,
+            scheduled_count=row.scheduled_count,
+            revenue=row.revenue,
+        )
+
+
+def rebuild_daily_stats():
+    """
+    Recalcule entièrement le rollup depuis la table Booking.
+    Retourne le nombre de lignes écrites.
+    """
+    rows = defaultdict(_empty_row)
+
+    created = (
+        Booking.objects
+        .annotate(day=TruncDate("created_at"))
+        .values("day", "service_id", "status")
+        .annotate(count=Count("id"), revenue=Sum("total_price"))
+        .order_by()
+    )
+    for item in created:
+        row = rows[(item["day"], item["service_id"], item["status"])]
+        row["created_count"] += item["count"]
+        row["revenue"] += item["revenue"] or 0
+
+    scheduled = (
+        Booking.objects
+        .filter(scheduled_date__isnull=False)
+        .values("scheduled_date", "service_id", "status")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    for item in scheduled:
+        row = rows[(item["scheduled_date"], item["service_id"], item["status"])]
+        row["scheduled_count"] += item["count"]
+
+    with transaction.atomic():
+        BookingDailyStats.objects.all().delete()
+        BookingDailyStats.objects.bulk_create(
+            [
+                BookingDailyStats(day=day, service_id=service_id, status=status, **values)
+                for (day, service_id, status), values in rows.items()
+            ],
+            batch_size=1000,
+        )
+
+    return len(rows)
+
+
+# =============================================================================
+# PER-USER COUNTERS (UserBookingStats)
+# =============================================================================
+
+def _user_contribution(values):
+    """(total_bookings, completed_bookings, total_spent) d'une réservation."""
+    if values is None or values["status"] == "cancelled":
+        return 0, 0, Decimal("0")
+    if values["status"] == "done":
+        return 1, 1, Decimal(str(values["total_price"] or 0))
+    return 1, 0, Decimal("0")
+
+
+def user_counters_delta(previous, current):
+    """
+    Variation (total_bookings, completed_bookings, total_spent) des compteurs
+    quand une réservation passe de `previous` (None : création) à `current`.
+    """
+    new = _user_contribution(current)
+    old = _user_contribution(previous)
+    return [n - o for n, o in zip(new, old)]
+
+
+def _bump_user(user_id, total_bookings, completed_bookings, total_spent, create=True):
+    rows = UserBookingStats.objects.filter(user_id=user_id)
+    changes = {
+        "total_bookings": F("total_bookings") + total_bookings,
+        "completed_bookings": F("completed_bookings") + completed_bookings,
+        "total_spent": F("total_spent") + total_spent,
+    }
+    if rows.update(**changes) or not create:
+        return
+
+    try:
+        with transaction.atomic():
+            UserBookingStats.objects.create(
+                user_id=user_id,
+                total_bookings=total_bookings,
+                completed_bookings=completed_bookings,
+                total_spent=total_spent,
+            )
+    except IntegrityError:
+        # Une requête concurrente vient de créer la ligne
+        rows.update(**changes)
+
+
+def record_user_booking_save(user_id, previous, current):
+    """
+    Applique aux compteurs de l'utilisateur la différence entre `previous`
+    (None pour une création) et `current`. Si la réservation a changé
+    d'utilisateur, sa contribution passe de l'ancien au nouveau. Retourne
+    True si une écriture a eu lieu.
+    """
+    previous_user_id = previous.get("user_id", user_id) if previous else user_id
+    if previous_user_id != user_id:
+        old = _user_contribution(previous)
+        new = _user_contribution(current)
+        if any(old):
+            _bump_user(previous_user_id, *[-n for n in old])
+        if any(new):
+            _bump_user(user_id, *new)
+        return any(old) or any(new)
+
+    delta = user_counters_delta(previous, current)
+    if not any(delta):
+        return False
+    _bump_user(user_id, *delta)
+    return True
+
+
+def record_user_booking_delete(booking):
+    """Retire une réservation supprimée des compteurs de son utilisateur."""
+    values = booking.loaded_values or _current_values(booking)
+    delta = [-n for n in _user_contribution(values)]
+    if any(delta):
+        # pas de création : lors de la suppression d'un user, sa ligne de
+        # compteurs peut déjà avoir été supprimée par le CASCADE
+        _bump_user(booking.user_id, *delta, create=False)
+
+
+def reconcile_user_booking_stats():
+    """
+    Recalcule tous les compteurs depuis la table Booking.
+    Retourne le nombre d'utilisateurs écrits.
+    """
+    totals = (
+        Booking.objects
+        .values("user_id")
+        .annotate(
+            total_bookings=Count("id", filter=~Q(status="cancelled")),
+            completed_bookings=Count("id", filter=Q(status="done")),
+            total_spent=Sum("total_price", filter=Q(status="done")),
+        )
+        .order_by()
+    )
+
+    rows = [
+        UserBookingStats(
+            user_id=item["user_id"],
+            total_bookings=item["total_bookings"],
+            completed_bookings=item["completed_bookings"],
+            total_spent=item["total_spent"] or 0,
+        )
+        for item in totals
+    ]
+
+    with transaction.atomic():
+        UserBookingStats.objects.all().delete()
+        UserBookingStats.objects.bulk_create(rows, batch_size=1000)
+
+    return len(rows)
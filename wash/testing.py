@@ -0,0 +1,53 @@
+# wash/testing.py
+"""
+Outils de test partagés entre les apps.
+
+QueryBudgetMixin vérifie qu'une page a un budget de requêtes constant :
+elle est rendue avec de plus en plus de lignes (créées par `add_rows`) et
+le nombre de requêtes SQL doit rester le même. Une requête par ligne
+(N+1 : un FK lu dans une boucle du template sans select_related, un
+__str__ qui suit une relation...) fait échouer le test.
+
+    class PagesTests(QueryBudgetMixin, TestCase):
+        def test_bookings_list(self):
+            self.client.force_login(self.user)
+            self.assertConstantQueries(reverse("bookings-list"), self.add_bookings)
+"""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    # nombre total de lignes ajoutées avant chaque mesure
+    budget_sizes = (1, 3, 8, 15)
+
+    def count_page_queries(self, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200, url)
+        return ctx.captured_queries
+
+    def assertConstantQueries(self, url, add_rows, data=None, sizes=None):
+        """
+        `add_rows(n)` crée n lignes de plus pour la page ; le nombre de
+        requêtes de `url` doit être le même pour chaque taille.
+        """
+        sizes = sizes or self.budget_sizes
+
+        # 1er rendu : caches de process (ContentType, index des badges...)
+        add_rows(sizes[0])
+        self.count_page_queries(url, data)
+
+        # chaque mesure suit un ajout de lignes, pour que les caches
+        # invalidés par ces écritures coûtent la même chose à chaque taille
+        counts = {}
+        created = sizes[0]
+        for size in sizes[1:]:
+            add_rows(size - created)
+            created = size
+            queries = self.count_page_queries(url, data)
+            counts[size] = len(queries)
+
+        if len(set(counts.values())) > 1:
+            sql = "\n".join(query["sql"] for query in queries)
+            self.fail(f"{url}: requêtes selon le nombre de lignes {counts}\n{sql}")
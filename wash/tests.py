@@ -1,3 +1,1764 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time as time_module
+from datetime import datetime, time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from io import StringIO
+from smtplib import SMTPDataError, SMTPRecipientsRefused, SMTPServerDisconnected
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.template import engines
+from django.template.loader import render_to_string
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from badges.models import Badge, UserBadge
+from badges.signals import get_badge_index, invalidate_badge_index
+from django_apscheduler.models import DjangoJob
+from loyalty.models import LoyaltyProfile
+
+from .management.commands.send_reminders import reminder_window_q
+from .availability import free_slots
+from .capacity import peak_occupancy, reserve
+from .catalogue import get_service, get_services
+from .dashboard import context_key, current_version
+from .dispatch import DispatchStats, HostRateLimiter
+from .forms import BookingForm
+from .models import (
+    Booking, BookingDailyStats, CalendarFeedKey, OutboundEmail, Service, UserBookingStats, Vehicle,
+)
+from .outbox import (
+    claim_batch, claim_reminders, drain_once, drain_outbox, enqueue_due_reminders,
+    enqueue_reminder, reminder_claimable_q,
+)
+from .pagination import keyset_paginate
+from .pipeline import bulk_transition
+from .scheduler import acquire_leadership, release_leadership, scheduler, still_leader
+from .stats import rebuild_daily_stats, reconcile_user_booking_stats
+from . import ics, utils
+from .utils import build_reminder_message, iter_reminder_messages, send_reminder_emails
+from .signals import invalidate_service_catalogue
+from .testing import QueryBudgetMixin
+from .views import booking_search_q
+from .views_calendar import feed_token, feed_window
+
+
+# ============================================================
+#                 BOOKING INDEXES (EXPLAIN)
+# ============================================================
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN checks target PostgreSQL")
+class BookingIndexTests(TestCase):
+    """The hot Booking query shapes must be answerable from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("client", "client@example.com", "pwd")
+        service = Service.objects.create(name="Lavage", price=30)
+        today = timezone.localdate()
+        for i in range(5):
+            Booking.objects.create(
+                user=cls.user,
+                service=service,
+                total_price=30,
+                scheduled_date=today + timezone.timedelta(days=30 + i),
+                scheduled_time=timezone.datetime(2000, 1, 1, 10).time(),
+                status="done" if i % 2 else "pending",
+            )
+
+    def setUp(self):
+        # Tiny test tables are always cheaper to scan: make the planner
+        # show which index it *can* use (reset when the test rolls back).
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, plan)
+
+    def test_dashboard_latest_bookings(self):
+        qs = Booking.objects.exclude(status="cancelled").order_by("-created_at", "-id")[:20]
+        self.assertUsesIndex(qs, "booking_active_created_idx")
+
+    def test_user_bookings_page(self):
+        qs = Booking.objects.filter(user=self.user).order_by("-created_at", "-id")[:21]
+        self.assertUsesIndex(qs, "booking_user_created_idx")
+
+    def test_plate_prefix_search(self):
+        qs = Vehicle.objects.filter(plate_normalized__startswith="123TU")
+        self.assertUsesIndex(qs, "vehicle_plate_prefix_idx")
+
+    def test_status_ordered_by_creation(self):
+        qs = Booking.objects.filter(status="pending").order_by("-created_at")[:20]
+        self.assertUsesIndex(qs, "booking_status_created_idx")
+
+    def test_scheduled_date_filter(self):
+        qs = Booking.objects.filter(scheduled_date=timezone.localdate())
+        self.assertUsesIndex(qs, "booking_schedule_idx")
+
+    def test_pending_reminders(self):
+        now = timezone.localtime()
+        qs = (
+            Booking.objects
+            .filter(reminder_claimable_q(now))
+            .exclude(status="cancelled")
+            .filter(reminder_window_q(now, now + timezone.timedelta(hours=6)))
+            .order_by("scheduled_at")
+        )
+        self.assertUsesIndex(qs, "booking_pending_reminder_idx")
+
+    def test_next_booking_of_user(self):
+        qs = (
+            Booking.objects
+            .filter(user=self.user, scheduled_at__gte=timezone.now())
+            .exclude(status="cancelled")
+            .order_by("scheduled_at")[:1]
+        )
+        self.assertUsesIndex(qs, "booking_user_scheduled_idx")
+
+    def test_calendar_range(self):
+        now = timezone.now()
+        qs = Booking.objects.filter(
+            scheduled_at__gte=now, scheduled_at__lt=now + timezone.timedelta(days=7)
+        )
+        self.assertUsesIndex(qs, "booking_scheduled_at_idx")
+
+    def test_badge_totals_per_user(self):
+        qs = (
+            Booking.objects
+            .filter(user=self.user, status="done")
+            .values("user")
+            .annotate(total=Sum("total_price"))
+        )
+        plan = qs.explain()
+        self.assertIn("booking_user_status_idx", plan, plan)
+        self.assertIn("Index Only Scan", plan, plan)
+
+
+# ============================================================
+#            STORED scheduled_at
+# ============================================================
+class BookingScheduledAtTests(TestCase):
+    """scheduled_at follows scheduled_date / scheduled_time on every save."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("agenda", "agenda@example.com", "pwd")
+
+    def test_synced_on_save(self):
+        day = timezone.localdate() + timezone.timedelta(days=3)
+        booking = Booking.objects.create(
+            user=self.user, scheduled_date=day, scheduled_time=time(9, 30)
+        )
+        self.assertEqual(
+            Booking.objects.get(pk=booking.pk).scheduled_at,
+            timezone.make_aware(datetime.combine(day, time(9, 30))),
+        )
+
+        booking.scheduled_time = time(14, 0)
+        booking.save(update_fields=["scheduled_time"])
+        self.assertEqual(
+            Booking.objects.get(pk=booking.pk).scheduled_at,
+            timezone.make_aware(datetime.combine(day, time(14, 0))),
+        )
+
+        booking.scheduled_time = None
+        booking.save()
+        self.assertIsNone(Booking.objects.get(pk=booking.pk).scheduled_at)
+
+
+# ============================================================
+#            BOOKING SAVE PIPELINE (QUERY COUNTS)
+# ============================================================
+class BookingSavePipelineTests(TestCase):
+    """Each kind of Booking save only pays for the handlers it concerns."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("client", "client@example.com", "pwd")
+        cls.service = Service.objects.create(name="Lavage", price=120)
+
+    def setUp(self):
+        get_badge_index()
+        self.booking = Booking.objects.create(
+            user=self.user, service=self.service, total_price=120
+        )
+        # fresh instance, as loaded by a view
+        self.booking = Booking.objects.get(pk=self.booking.pk)
+
+    def test_create(self):
+        # INSERT + rollup row bump + user counters bump + counters read
+        # (no badge threshold crossed: no badge query)
+        with self.assertNumQueries(4):
+            Booking.objects.create(user=self.user, service=self.service, total_price=120)
+
+    def test_reminder_state_update_runs_no_handler(self):
+        self.booking.reminder_state = "sent"
+        with self.assertNumQueries(1):
+            self.booking.save(update_fields=["reminder_state"])
+
+    def test_unchanged_save_runs_no_handler(self):
+        with self.assertNumQueries(1):
+            self.booking.save()
+
+    def test_untracked_field_runs_no_handler(self):
+        self.booking.ia_message = "Pensez à vider le coffre"
+        with self.assertNumQueries(1):
+            self.booking.save()
+
+    def test_mark_done(self):
+        self.booking.status = "done"
+        # UPDATE + rollup (old row + new row created: 5) + user counters bump
+        # + loyalty (profile + savepoint, UPDATE, reload, ledger, release)
+        # + counters read
+        with self.assertNumQueries(14):
+            self.booking.save(update_fields=["status"])
+
+    def test_points_awarded_once(self):
+        self.booking.status = "done"
+        self.booking.save(update_fields=["status"])
+
+        again = Booking.objects.get(pk=self.booking.pk)
+        with self.assertNumQueries(1):
+            again.save()
+        self.assertEqual(LoyaltyProfile.objects.get(user=self.user).points, 12)
+
+
+# ============================================================
+#            PER-USER COUNTERS (UserBookingStats)
+# ============================================================
+class BookingDailyStatsTests(TestCase):
+    """The dashboard rollup always matches a full rebuild and the live aggregates."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("gerant", "gerant@example.com", "pwd", is_staff=True)
+        cls.user = User.objects.create_user("journal", "journal@example.com", "pwd")
+        cls.wash = Service.objects.create(name="Lavage", price=30)
+        cls.polish = Service.objects.create(name="Lustrage", price=50)
+        cls.today = timezone.localdate()
+        cls.tomorrow = cls.today + timezone.timedelta(days=1)
+
+    def tearDown(self):
+        invalidate_service_catalogue(sender=Service)
+
+    def book(self, service, price, day, status="pending"):
+        return Booking.objects.create(
+            user=self.user, service=service, total_price=price, status=status,
+            scheduled_date=day, scheduled_time=time(10, 0),
+        )
+
+    def rollup(self):
+        # rows brought back to zero stay in place; a rebuild doesn't write them
+        return {
+            (row.day, row.service_id, row.status): (row.created_count, row.scheduled_count, row.revenue)
+            for row in BookingDailyStats.objects.all()
+            if row.created_count or row.scheduled_count or row.revenue
+        }
+
+    def baseline(self):
+        """The dashboard figures as computed from Booking before the rollup."""
+        active = Booking.objects.exclude(status="cancelled")
+        return {
+            "total_bookings": active.count(),
+            "created_today": active.filter(created_at__date=self.today).count(),
+            "scheduled_today": active.filter(scheduled_date=self.today).count(),
+            "total_revenue": Booking.objects.filter(status="done").aggregate(
+                total=Sum("total_price"))["total"] or 0,
+            "service_counts": dict(
+                active.filter(service__isnull=False)
+                .values_list("service__name")
+                .annotate(count=Count("id"))
+            ),
+        }
+
+    def assertMatchesRebuildAndBaseline(self):
+        incremental = self.rollup()
+        rebuild_daily_stats()
+        self.assertEqual(incremental, self.rollup())
+
+        self.client.force_login(self.staff)
+        context = self.client.get(reverse("admin-dashboard")).context
+        dashboard = {
+            name: context[name]
+            for name in ("total_bookings", "created_today", "scheduled_today", "total_revenue")
+        }
+        dashboard["service_counts"] = dict(zip(context["service_labels"], context["service_counts"]))
+        self.assertEqual(dashboard, self.baseline())
+
+    def test_create(self):
+        self.book(self.wash, 30, self.today)
+        self.book(self.wash, 30, self.tomorrow, status="done")
+        self.book(self.polish, 50, self.today, status="cancelled")
+        self.assertEqual(self.rollup()[(self.today, self.wash.pk, "pending")], (1, 1, 30))
+        self.assertMatchesRebuildAndBaseline()
+
+    def test_status_change(self):
+        booking = self.book(self.wash, 30, self.today)
+        booking.status = "done"
+        booking.save()
+        self.assertMatchesRebuildAndBaseline()
+
+        booking.status = "cancelled"
+        booking.save(update_fields=["status"])
+        self.assertMatchesRebuildAndBaseline()
+
+    def test_service_price_and_date_change(self):
+        booking = self.book(self.wash, 30, self.today, status="done")
+        booking.service = self.polish
+        booking.total_price = 55
+        booking.save()
+        self.assertMatchesRebuildAndBaseline()
+
+        booking.scheduled_date = self.tomorrow
+        booking.save()
+        self.assertMatchesRebuildAndBaseline()
+
+        # instance built by hand: previous values read from the database
+        Booking(
+            pk=booking.pk, user=self.user, service=self.wash, total_price=40, status="done",
+            created_at=booking.created_at, scheduled_date=self.today, scheduled_time=time(11, 0),
+        ).save()
+        self.assertMatchesRebuildAndBaseline()
+
+    def test_delete(self):
+        keep = self.book(self.wash, 30, self.today, status="done")
+        self.book(self.polish, 50, self.tomorrow, status="done").delete()
+        self.assertMatchesRebuildAndBaseline()
+        keep.delete()
+        self.assertEqual(self.rollup(), {})
+        self.assertMatchesRebuildAndBaseline()
+
+    def test_service_delete(self):
+        self.book(self.polish, 50, self.today, status="done")
+        self.book(self.wash, 30, self.today)
+        self.polish.delete()
+        self.assertIn((self.today, None, "done"), self.rollup())
+        self.assertMatchesRebuildAndBaseline()
+
+
+class UserBookingStatsTests(TestCase):
+    """Incremental counters always match a full recount."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("compteur", "compteur@example.com", "pwd")
+        cls.service = Service.objects.create(name="Lavage", price=50)
+
+    def counters(self):
+        stats = UserBookingStats.objects.get(user=self.user)
+        return stats.total_bookings, stats.completed_bookings, stats.total_spent
+
+    def test_counters_follow_status_changes(self):
+        first = Booking.objects.create(user=self.user, service=self.service, total_price=50)
+        second = Booking.objects.create(user=self.user, service=self.service, total_price=80)
+        self.assertEqual(self.counters(), (2, 0, 0))
+
+        first.status = "done"
+        first.save()
+        self.assertEqual(self.counters(), (2, 1, 50))
+
+        first.total_price = 60
+        first.save(update_fields=["total_price"])
+        second.status = "cancelled"
+        second.save()
+        self.assertEqual(self.counters(), (1, 1, 60))
+
+        first.delete()
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_matches_reconcile(self):
+        for status in ("pending", "confirmed", "done", "done", "cancelled"):
+            Booking.objects.create(
+                user=self.user, service=self.service, total_price=30, status=status
+            )
+        incremental = self.counters()
+
+        reconcile_user_booking_stats()
+        self.assertEqual(self.counters(), incremental)
+        self.assertEqual(incremental, (4, 2, 60))
+
+    def test_reassigned_booking_moves_its_counters(self):
+        other = User.objects.create_user("repreneur", "repreneur@example.com", "pwd")
+        done = Booking.objects.create(user=self.user, service=self.service, total_price=50, status="done")
+        pending = Booking.objects.create(user=self.user, service=self.service, total_price=30)
+
+        done.user = other
+        done.save()
+        pending = Booking.objects.get(pk=pending.pk)
+        pending.user_id = other.pk
+        pending.save(update_fields=["user"])
+
+        self.assertEqual(self.counters(), (0, 0, 0))
+        moved = UserBookingStats.objects.get(user=other)
+        self.assertEqual((moved.total_bookings, moved.completed_bookings, moved.total_spent), (2, 1, 50))
+
+        # same as a full recount (which keeps no row for users without bookings)
+        reconcile_user_booking_stats()
+        self.assertFalse(UserBookingStats.objects.filter(user=self.user).exists())
+        self.assertEqual(UserBookingStats.objects.get(user=other).total_bookings, 2)
+
+
+    def test_users_list_counts_active_bookings(self):
+        staff = User.objects.create_user("admin-liste", "admin-liste@example.com", "pwd", is_staff=True)
+        for status in ("pending", "done", "cancelled"):
+            Booking.objects.create(user=self.user, service=self.service, total_price=50, status=status)
+
+        self.client.force_login(staff)
+        response = self.client.get(reverse("users-list"), {"search": "compteur"})
+        self.assertContains(response, "Réservations (hors annulées)")
+        [listed] = response.context["users"]
+        # cancelled bookings are not counted
+        self.assertEqual(listed.active_bookings, 2)
+        self.assertContains(response, "<td>2</td>", html=True)
+
+# ============================================================
+#            BULK STATUS TRANSITIONS (STAFF)
+# ============================================================
+class BulkStatusTransitionTests(TestCase):
+    """Closing a shift's bookings costs one request and per-user work."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", "staff@example.com", "pwd", is_staff=True)
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "pwd")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "pwd")
+        cls.service = Service.objects.create(name="Lavage", price=100)
+
+    def setUp(self):
+        get_badge_index()
+
+    def book(self, user, count, status="pending"):
+        return [
+            Booking.objects.create(
+                user=user, service=self.service, total_price=100, status=status
+            ).pk
+            for _ in range(count)
+        ]
+
+    def post(self, booking_ids, **extra):
+        self.client.force_login(self.staff)
+        return self.client.post(
+            reverse("bookings-bulk-status"),
+            {"booking_ids": booking_ids, **extra},
+            HTTP_ACCEPT="application/json",
+        )
+
+    def tearDown(self):
+        invalidate_badge_index(sender=Badge)
+
+    def test_marks_done_and_aggregates_per_user(self):
+        badge = Badge.objects.create(
+            name="Champion", description="", condition_type="completed_bookings", condition_value=3
+        )
+        ids = self.book(self.alice, 3) + self.book(self.bob, 2, status="confirmed")
+        cancelled = self.book(self.bob, 1, status="cancelled")
+
+        response = self.post(ids + cancelled)
+        self.assertEqual(response.json()["updated"], sorted(ids))
+        self.assertEqual(response.json()["skipped"], cancelled)
+        self.assertEqual(Booking.objects.filter(status="done").count(), 5)
+
+        # one ledger entry per user
+        alice = LoyaltyProfile.objects.get(user=self.alice)
+        self.assertEqual(alice.points, 30)
+        self.assertEqual(alice.transactions.count(), 1)
+        self.assertEqual(LoyaltyProfile.objects.get(user=self.bob).points, 20)
+
+        self.assertEqual(
+            list(UserBadge.objects.filter(badge=badge).values_list("user_id", flat=True)),
+            [self.alice.pk],
+        )
+
+        # aggregates match a full recount
+        stats = UserBookingStats.objects.get(user=self.alice)
+        self.assertEqual((stats.completed_bookings, stats.total_spent), (3, 300))
+        incremental = list(UserBookingStats.objects.order_by("user_id").values_list())
+        reconcile_user_booking_stats()
+        self.assertEqual(list(UserBookingStats.objects.order_by("user_id").values_list()), incremental)
+
+    def test_already_done_is_skipped(self):
+        ids = self.book(self.alice, 2)
+        self.post(ids)
+        response = self.post(ids)
+        self.assertEqual(response.json()["updated"], [])
+        self.assertEqual(LoyaltyProfile.objects.get(user=self.alice).points, 20)
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        # first "done" rollup row created beforehand
+        self.post(self.book(self.alice, 1))
+        few = self.book(self.alice, 1) + self.book(self.bob, 1)
+
+        with CaptureQueriesContext(connection) as few_queries:
+            self.post(few)
+        many = self.book(self.alice, 20) + self.book(self.bob, 20)
+        with CaptureQueriesContext(connection) as many_queries:
+            self.post(many)
+
+        self.assertEqual(len(many_queries), len(few_queries))
+
+    def test_staff_only(self):
+        ids = self.book(self.alice, 1)
+        self.client.force_login(self.alice)
+        response = self.client.post(reverse("bookings-bulk-status"), {"booking_ids": ids})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.get(pk=ids[0]).status, "pending")
+
+
+# ============================================================
+#            WASH BAY CAPACITY
+# ============================================================
+def next_weekday(weekday):
+    """A date at least a week ahead falling on `weekday` (0 = Monday)."""
+    day = timezone.localdate() + timezone.timedelta(days=7)
+    return day + timezone.timedelta(days=(weekday - day.weekday()) % 7)
+
+
+@override_settings(WASH_BAYS=2, WASH_OPENING_HOURS={0: ("08:00", "19:00")})
+class BayCapacityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("rush", "rush@example.com", "pwd")
+        cls.vehicle = Vehicle.objects.create(owner=cls.user, license_plate="123 TU 1")
+        cls.service = Service.objects.create(name="Complet", price=40, duration_minutes=60)
+        cls.monday = next_weekday(0)
+
+    def booking(self, hour, minute=0, day=None):
+        return Booking(
+            user=self.user, service=self.service,
+            scheduled_date=day or self.monday, scheduled_time=time(hour, minute),
+        )
+
+    def assertRejected(self, booking, code):
+        with self.assertRaises(ValidationError) as ctx:
+            reserve(booking)
+        self.assertEqual(ctx.exception.code, code)
+
+    def test_peak_occupancy(self):
+        at = lambda h, m=0: datetime(2030, 1, 7, h, m)
+        intervals = [(at(9), at(10)), (at(10), at(11)), (at(9, 30), at(10, 30))]
+        self.assertEqual(peak_occupancy(intervals, at(9), at(11)), 2)
+        self.assertEqual(peak_occupancy(intervals, at(10, 30), at(11)), 1)
+        self.assertEqual(peak_occupancy([], at(9), at(10)), 0)
+
+    def test_bays_fill_up(self):
+        reserve(self.booking(10))
+        reserve(self.booking(10, 30))
+        self.assertRejected(self.booking(10, 15), "full")
+
+        # back-to-back and non-overlapping slots are still free
+        reserve(self.booking(11))
+        reserve(self.booking(9))
+
+    def test_cancelled_bookings_free_their_bay(self):
+        reserve(self.booking(10))
+        second = reserve(self.booking(10))
+        second.status = "cancelled"
+        second.save()
+        reserve(self.booking(10))
+
+    def test_opening_hours(self):
+        self.assertRejected(self.booking(7, 30), "outside_hours")
+        self.assertRejected(self.booking(18, 30), "outside_hours")
+        self.assertRejected(self.booking(10, day=next_weekday(6)), "closed")
+
+    def test_create_view_reports_full_slot(self):
+        reserve(self.booking(10))
+        reserve(self.booking(10))
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("bookings-create"), {
+            "vehicle": self.vehicle.pk,
+            "service": self.service.pk,
+            "scheduled_date": self.monday.isoformat(),
+            "scheduled_time": "10:00",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("baie", str(response.context["form"].non_field_errors()))
+        self.assertEqual(Booking.objects.filter(user=self.user).count(), 2)
+
+
+@override_settings(WASH_BAYS=2, WASH_OPENING_HOURS={0: ("08:00", "19:00")})
+class BayCapacityConcurrencyTests(TransactionTestCase):
+    """Concurrent requests for the last bays: exactly WASH_BAYS succeed."""
+
+    def test_parallel_reservations(self):
+        user = User.objects.create_user("samedi", "samedi@example.com", "pwd")
+        service = Service.objects.create(name="Express", price=20, duration_minutes=30)
+        monday = next_weekday(0)
+
+        attempts = 12
+        barrier = threading.Barrier(attempts)
+        outcomes = []
+
+        def worker():
+            try:
+                booking = Booking(
+                    user=user, service=service,
+                    scheduled_date=monday, scheduled_time=time(10, 0),
+                )
+                barrier.wait()
+                reserve(booking)
+                outcomes.append("ok")
+            except ValidationError as error:
+                outcomes.append(error.code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(attempts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count("ok"), 2)
+        self.assertEqual(outcomes.count("full"), attempts - 2)
+        self.assertEqual(Booking.objects.filter(scheduled_date=monday).count(), 2)
+
+
+# ============================================================
+#            AVAILABILITY API
+# ============================================================
+@override_settings(
+    WASH_BAYS=1,
+    WASH_SLOT_MINUTES=30,
+    WASH_OPENING_HOURS={0: ("08:00", "10:00")},
+)
+class AvailabilityTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("dispo", "dispo@example.com", "pwd")
+        cls.short = Service.objects.create(name="Express", price=20, duration_minutes=30)
+        cls.long = Service.objects.create(name="Complet", price=40, duration_minutes=60)
+        cls.monday = next_weekday(0)
+
+    def setUp(self):
+        cache.clear()
+
+    def book(self, hour, minute=0):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(
+                user=self.user, service=self.short,
+                scheduled_date=self.monday, scheduled_time=time(hour, minute),
+            )
+
+    def test_free_slots(self):
+        self.book(8, 30)
+        self.assertEqual(free_slots(self.short, [self.monday])[self.monday], ["08:00", "09:00", "09:30"])
+        self.assertEqual(free_slots(self.long, [self.monday])[self.monday], ["09:00"])
+
+    def test_occupancy_is_cached_and_invalidated(self):
+        with self.assertNumQueries(1):
+            free_slots(self.short, [self.monday])
+        with self.assertNumQueries(0):
+            free_slots(self.short, [self.monday])
+
+        booking = self.book(9)
+        self.assertNotIn("09:00", free_slots(self.short, [self.monday])[self.monday])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = "cancelled"
+            booking.save()
+        self.assertIn("09:00", free_slots(self.short, [self.monday])[self.monday])
+
+    def test_month_is_one_query(self):
+        days = [self.monday + timezone.timedelta(days=i) for i in range(31)]
+        with self.assertNumQueries(1):
+            slots = free_slots(self.short, days)
+        self.assertEqual(len(slots), 31)
+        # only Mondays are open
+        self.assertEqual(sum(1 for times in slots.values() if times), 5)
+
+    def test_view(self):
+        self.client.force_login(self.user)
+        url = reverse("bookings-availability")
+
+        data = self.client.get(url, {"service": self.short.pk, "start": self.monday.isoformat()}).json()
+        self.assertEqual(data["days"], {self.monday.isoformat(): ["08:00", "08:30", "09:00", "09:30"]})
+
+        month = self.client.get(url, {"service": self.short.pk, "month": self.monday.strftime("%Y-%m")}).json()
+        self.assertIn(self.monday.isoformat(), month["days"])
+
+        self.assertEqual(self.client.get(url, {"service": 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {"service": self.short.pk, "days": 500}).status_code, 400)
+
+        # near date.max: 400, not an OverflowError
+        response = self.client.get(url, {"service": self.short.pk, "start": "9999-12-31", "days": 2})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {"service": self.short.pk, "start": "9999-12-31"})
+        self.assertEqual(list(response.json()["days"]), ["9999-12-31"])
+
+
+# ============================================================
+#            KEYSET PAGINATION & SEARCH
+# ============================================================
+class KeysetPaginationTests(TestCase):
+    """Cursor pages: every booking exactly once, constant cost per page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", "staff@example.com", "pwd", is_staff=True)
+        cls.user = User.objects.create_user("martin", "martin@example.com", "pwd")
+        cls.service = Service.objects.create(name="Lavage", price=30)
+        cls.vehicle = Vehicle.objects.create(
+            owner=cls.user, make="Renault", model="Clio", license_plate="123 TU 4567"
+        )
+        for _ in range(25):
+            Booking.objects.create(user=cls.user, service=cls.service, total_price=30)
+        # same created_at for a run of bookings: the id breaks the tie
+        ties = list(Booking.objects.order_by("id").values_list("id", flat=True)[5:15])
+        Booking.objects.filter(id__in=ties).update(created_at=timezone.now() - timezone.timedelta(days=1))
+
+    def test_pages_cover_every_booking_once(self):
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_paginate(Booking.objects.all(), cursor, per_page=4)
+            seen.extend(b.pk for b in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = list(Booking.objects.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_deep_page_costs_the_same(self):
+        first = keyset_paginate(Booking.objects.all(), per_page=4)
+        cursor = first.next_cursor
+        for _ in range(4):
+            cursor = keyset_paginate(Booking.objects.all(), cursor, per_page=4).next_cursor
+        with CaptureQueriesContext(connection) as ctx:
+            keyset_paginate(Booking.objects.all(), cursor, per_page=4)
+        self.assertEqual(len(ctx), 1)
+        self.assertNotIn("OFFSET", ctx.captured_queries[0]["sql"])
+
+    def test_invalid_cursor_is_first_page(self):
+        page = keyset_paginate(Booking.objects.all(), "not-a-cursor", per_page=4)
+        self.assertTrue(page.is_first)
+        self.assertEqual(len(page), 4)
+
+    def test_search(self):
+        booking = Booking.objects.order_by("id").first()
+        Booking.objects.filter(pk=booking.pk).update(vehicle=self.vehicle)
+
+        by_id = Booking.objects.filter(booking_search_q(str(booking.pk)))
+        self.assertIn(booking, by_id)
+        self.assertEqual(list(Booking.objects.filter(booking_search_q("123tu 4567"))), [booking])
+        self.assertEqual(Booking.objects.filter(booking_search_q("mart")).count(), 25)
+        self.assertEqual(Booking.objects.filter(booking_search_q("lav")).count(), 25)
+        self.assertFalse(Booking.objects.filter(booking_search_q("zzz")).exists())
+        self.assertEqual(Booking.objects.filter(booking_search_q("MART")).count(), 25)
+        # digits int() refuses: no id lookup, no error
+        for query in ("²", "1²", "①"):
+            self.assertFalse(Booking.objects.filter(booking_search_q(query)).exists())
+
+    def test_views(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("bookings-list"))
+        self.assertEqual(len(response.context["object_list"]), 20)
+        response = self.client.get(reverse("bookings-list") + "?" + response.context["next_page_query"])
+        self.assertEqual(len(response.context["object_list"]), 5)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("admin-dashboard"), {"search": "mart"})
+        self.assertTrue(response.context["bookings_page"].has_next)
+        self.assertIn("search=mart", response.context["next_page_query"])
+
+
+# ============================================================
+#            QUERY BUDGET PER PAGE (N+1)
+# ============================================================
+class PageQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Listed pages: the number of queries must not grow with the rows shown."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("client", "client@example.com", "pwd")
+        cls.admin = User.objects.create_superuser("admin", "admin@example.com", "pwd")
+
+    def setUp(self):
+        self.created = 0
+
+    def add_bookings(self, count, user=None):
+        """`count` bookings, each with its own user, service and vehicle."""
+        for _ in range(count):
+            self.created += 1
+            owner = user or User.objects.create_user(f"user{self.created}")
+            service = Service.objects.create(name=f"Service {self.created}", price=20)
+            vehicle = Vehicle.objects.create(owner=owner, license_plate=f"{self.created} TU 100")
+            Booking.objects.create(user=owner, service=service, vehicle=vehicle, total_price=20)
+
+    def add_own_bookings(self, count):
+        self.add_bookings(count, user=self.user)
+
+    def test_bookings_list(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(reverse("bookings-list"), self.add_own_bookings)
+
+    def test_home(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(reverse("home"), self.add_own_bookings)
+
+    def test_user_detail(self):
+        self.client.force_login(self.admin)
+        url = reverse("user-detail", args=[self.user.pk])
+        self.assertConstantQueries(url, self.add_own_bookings)
+
+    def test_users_list(self):
+        self.client.force_login(self.admin)
+        self.assertConstantQueries(reverse("users-list"), self.add_bookings)
+
+    def test_admin_dashboard(self):
+        self.client.force_login(self.admin)
+        self.assertConstantQueries(reverse("admin-dashboard"), self.add_bookings)
+        self.assertConstantQueries(reverse("admin-dashboard"), self.add_bookings, data={"search": "user"})
+
+    def test_services_list(self):
+        self.client.force_login(self.user)
+        self.assertConstantQueries(reverse("services-list"), self.add_bookings)
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        self.assertConstantQueries(reverse("admin:wash_booking_changelist"), self.add_bookings)
+        self.assertConstantQueries(reverse("admin:wash_vehicle_changelist"), self.add_bookings)
+
+
+# ============================================================
+#            CUSTOMER DASHBOARD CACHE
+# ============================================================
+@override_settings(CACHES={
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "home-tests"}
+})
+class HomeDashboardCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("accueil", "accueil@example.com", "pwd")
+        cls.service = Service.objects.create(name="Lavage", price=30)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def visit(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("home"))
+        tables = [
+            table for table in ("wash_booking", "wash_vehicle", "wash_userbookingstats")
+            if any(table in query["sql"] for query in ctx.captured_queries)
+        ]
+        return response.context, tables
+
+    def book(self, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(user=self.user, service=self.service, total_price=30, **extra)
+
+    def test_repeat_visit_is_served_from_cache(self):
+        self.book()
+        context, tables = self.visit()
+        self.assertEqual(context["bookings_count"], 1)
+        self.assertTrue(tables)
+
+        context, tables = self.visit()
+        self.assertEqual(context["bookings_count"], 1)
+        self.assertEqual(tables, [])
+
+    def test_booking_and_vehicle_writes_bump_the_version(self):
+        self.visit()
+        booking = self.book()
+        context, tables = self.visit()
+        self.assertEqual(context["bookings_count"], 1)
+        self.assertTrue(tables)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = "cancelled"
+            booking.save()
+        self.assertEqual(self.visit()[0]["bookings_count"], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Vehicle.objects.create(owner=self.user, license_plate="1 TU 1")
+        self.assertEqual(self.visit()[0]["vehicles_count"], 1)
+
+    def test_other_users_are_not_invalidated(self):
+        other = User.objects.create_user("voisin")
+        self.visit()
+        version = current_version(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Booking.objects.create(user=other, service=self.service, total_price=30)
+        self.assertEqual(current_version(self.user.pk), version)
+        self.assertIsNotNone(cache.get(context_key(self.user.pk, version)))
+
+    def test_reassigned_booking_bumps_both_users(self):
+        other = User.objects.create_user("repreneur")
+        booking = self.book()
+        self.assertEqual(self.visit()[0]["bookings_count"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.user = other
+            booking.save()
+        context, tables = self.visit()
+        self.assertTrue(tables)
+        self.assertEqual(context["bookings_count"], 0)
+
+        self.client.force_login(other)
+        self.assertEqual(self.visit()[0]["bookings_count"], 1)
+
+
+# ============================================================
+#            SERVICE CATALOGUE CACHE
+# ============================================================
+class ServiceCatalogueTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("catalogue", "catalogue@example.com", "pwd")
+        cls.wash = Service.objects.create(name="Lavage", price=30)
+        cls.polish = Service.objects.create(name="Lustrage", price=50)
+
+    def setUp(self):
+        get_services()
+
+    def tearDown(self):
+        # the services are rolled back after the class: don't keep them
+        invalidate_service_catalogue(sender=Service)
+
+    def assertNoServiceQuery(self, ctx):
+        self.assertFalse(any("wash_service" in query["sql"] for query in ctx.captured_queries))
+
+    def test_booking_form_does_not_query_services(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("bookings-create"))
+        self.assertContains(response, "Lustrage (50.00 TND)")
+        self.assertNoServiceQuery(ctx)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse("services-list"))
+        self.assertNoServiceQuery(ctx)
+
+    def test_form_validates_against_the_catalogue(self):
+        form = BookingForm(data={"service": self.polish.pk}, user=self.user)
+        form.is_valid()
+        self.assertNotIn("service", form.errors)
+        self.assertEqual(form.cleaned_data["service"], self.polish)
+
+        form = BookingForm(data={"service": 0}, user=self.user)
+        self.assertIn("service", form.errors)
+
+    def test_save_and_delete_reload_the_catalogue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Service.objects.create(name="Aspiration", price=10)
+        self.assertEqual(get_services()[0], added)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Service.objects.filter(pk=self.wash.pk).update(name="Lavage complet")
+            self.wash.refresh_from_db()
+            self.wash.save()
+        self.assertIn("Lavage complet", [service.name for service in get_services()])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            added.delete()
+        self.assertNotIn(added, get_services())
+
+    def test_reminder_reads_the_catalogue(self):
+        booking = Booking.objects.create(user=self.user, service=self.wash, total_price=30)
+        booking = Booking.objects.get(pk=booking.pk)
+        with CaptureQueriesContext(connection) as ctx:
+            message, _ = build_reminder_message(booking)
+        self.assertIn("Lavage", message.subject)
+        self.assertNoServiceQuery(ctx)
+
+    def test_copy_reloaded_after_max_age(self):
+        # another process's change: the row moves, the local version doesn't
+        Service.objects.filter(pk=self.polish.pk).update(price=55)
+        self.assertEqual(get_service(self.polish.pk).price, 50)
+
+        loaded_at = time_module.monotonic()
+        with mock.patch("wash.catalogue.time.monotonic", return_value=loaded_at + 61):
+            self.assertEqual(get_service(self.polish.pk).price, 55)
+
+
+class FakeSMTPConnection:
+    """Connection stand-in: counts opens/closes, raises the queued errors."""
+
+    def __init__(self, open_errors=(), send_errors=()):
+        self.open_errors = list(open_errors)
+        self.send_errors = list(send_errors)
+        self.opened = 0
+        self.closed = 0
+        self.sent = []
+        self.is_open = False
+
+    def open(self):
+        if self.open_errors:
+            raise self.open_errors.pop(0)
+        if not self.is_open:
+            self.is_open = True
+            self.opened += 1
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.closed += 1
+
+    def send_messages(self, messages):
+        if self.send_errors:
+            raise self.send_errors.pop(0)
+        self.sent.extend(message.to[0] for message in messages)
+        return len(messages)
+
+
+class ReminderSMTPConnectionTests(TestCase):
+    """send_reminder_emails: reconnects every N sends, retries only lost connections."""
+
+    @classmethod
+    def setUpTestData(cls):
+        service = Service.objects.create(name="Lavage", price=30)
+        cls.bookings = [
+            Booking.objects.create(
+                user=User.objects.create_user(f"smtp{i}", f"smtp{i}@example.com", "pwd"),
+                service=service, total_price=30,
+            )
+            for i in range(5)
+        ]
+
+    def tearDown(self):
+        invalidate_service_catalogue(sender=Service)
+
+    def send(self, smtp, reconnect_every=0):
+        return [
+            (ok, error)
+            for _, ok, error in send_reminder_emails(
+                self.bookings, connection=smtp, reconnect_every=reconnect_every
+            )
+        ]
+
+    def test_reconnect_every_n_messages(self):
+        smtp = FakeSMTPConnection()
+        self.assertEqual(self.send(smtp, reconnect_every=2), [(True, None)] * 5)
+        self.assertEqual(len(smtp.sent), 5)
+        self.assertEqual((smtp.opened, smtp.closed), (3, 2))
+
+    def test_lost_connection_is_retried(self):
+        smtp = FakeSMTPConnection(send_errors=[SMTPServerDisconnected("gone")])
+        self.assertEqual(self.send(smtp), [(True, None)] * 5)
+        self.assertEqual(smtp.sent, [f"smtp{i}@example.com" for i in range(5)])
+        self.assertEqual(smtp.opened, 2)
+
+    def test_connection_refused_is_retried(self):
+        smtp = FakeSMTPConnection(open_errors=[ConnectionRefusedError()])
+        self.assertEqual(self.send(smtp), [(True, None)] * 5)
+
+    def test_second_failure_is_reported(self):
+        smtp = FakeSMTPConnection(send_errors=[SMTPServerDisconnected("gone")] * 2)
+        results = self.send(smtp)
+        self.assertEqual(results[0], (False, "gone"))
+        self.assertEqual(results[1:], [(True, None)] * 4)
+
+    def test_refusal_is_not_retried(self):
+        # the server may have accepted part of it: a retry could duplicate
+        for error in (
+            SMTPRecipientsRefused({"smtp0@example.com": (550, b"unknown")}),
+            SMTPDataError(451, b"try later"),
+            ConnectionResetError("reset during DATA"),
+        ):
+            with self.subTest(error=type(error).__name__):
+                smtp = FakeSMTPConnection(send_errors=[error])
+                results = self.send(smtp)
+                self.assertFalse(results[0][0])
+                self.assertEqual(results[1:], [(True, None)] * 4)
+                self.assertNotIn("smtp0@example.com", smtp.sent)
+
+
+class ReminderRenderTests(TestCase):
+    """Batch rendering: compiled templates fetched once, same output."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(name="Lavage", price=30, duration_minutes=45)
+        start = timezone.localtime() + timezone.timedelta(days=1)
+        cls.bookings = []
+        for i in range(5):
+            user = User.objects.create_user(f"rendu{i}", f"rendu{i}@example.com", "pwd", first_name=f"Client <{i}>")
+            vehicle = Vehicle.objects.create(owner=user, license_plate=f"{i} TU 100")
+            cls.bookings.append(Booking.objects.create(
+                user=user, service=cls.service, vehicle=vehicle, total_price=30,
+                scheduled_date=start.date(), scheduled_time=time(10, 0),
+            ))
+
+    def tearDown(self):
+        invalidate_service_catalogue(sender=Service)
+
+    def test_cached_loader(self):
+        loader = engines["django"].engine.template_loaders[0]
+        self.assertEqual(type(loader).__module__, "django.template.loaders.cached")
+
+    def test_templates_fetched_once_per_batch(self):
+        with mock.patch.object(utils, "get_template", wraps=utils.get_template) as get_template:
+            messages = list(iter_reminder_messages(self.bookings))
+        self.assertEqual(get_template.call_count, 2)
+        self.assertEqual(len(messages), 5)
+
+    def test_same_bodies_as_render_to_string(self):
+        for booking, message, error in iter_reminder_messages(self.bookings):
+            self.assertIsNone(error)
+            context = {
+                "user": booking.user,
+                "booking": booking,
+                "detail_url": f"http://127.0.0.1:8000/bookings/{booking.pk}/",
+                "cancel_url": f"http://127.0.0.1:8000/bookings/{booking.pk}/cancel/",
+                "support_email": "carwashnotifications2@gmail.com",
+            }
+            self.assertEqual(message.body, render_to_string("emails/reminder.txt", context))
+            self.assertEqual(message.alternatives[0][0], render_to_string("emails/reminder.html", context))
+            # one user's variables never leak into the next message
+            self.assertIn(booking.vehicle.license_plate, message.body)
+            self.assertIn("Client &lt;", message.body)
+
+    def test_ics_attached(self):
+        _, message, _ = next(iter_reminder_messages(self.bookings[:1]))
+        name, content, mimetype = message.attachments[0]
+        self.assertEqual(name, f"reservation-{self.bookings[0].pk}.ics")
+        self.assertEqual(mimetype, "text/calendar")
+        self.assertIn("SUMMARY:Carwash - Lavage", content)
+
+
+# ============================================================
+#            EMAIL OUTBOX
+# ============================================================
+@override_settings(OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BASE_SECONDS=60, OUTBOX_STALE_SECONDS=600)
+class OutboxTests(TestCase):
+    """Queueing on commit, claiming, retries with backoff, stale rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("outbox", "outbox@example.com", "pwd")
+        cls.service = Service.objects.create(name="Lavage", price=30)
+
+    def tearDown(self):
+        invalidate_service_catalogue(sender=Service)
+
+    def booking(self, hours=None, **extra):
+        if hours is not None:
+            start = timezone.localtime() + timezone.timedelta(hours=hours)
+            extra.update(
+                scheduled_date=start.date(),
+                scheduled_time=start.time().replace(microsecond=0),
+            )
+        return Booking.objects.create(user=self.user, service=self.service, total_price=30, **extra)
+
+    def queue(self, booking=None, **fields):
+        return OutboundEmail.objects.create(booking=booking or self.booking(), **fields)
+
+    def test_enqueue_reminder_inserts_on_commit(self):
+        booking = self.booking()
+        with self.captureOnCommitCallbacks() as callbacks:
+            enqueue_reminder(booking)
+        self.assertFalse(OutboundEmail.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(OutboundEmail.objects.get().booking_id, booking.pk)
+
+        # a reminder already waiting is left alone
+        with self.captureOnCommitCallbacks(execute=True):
+            enqueue_reminder(booking)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_one_extra_insert_per_booking_save(self):
+        def save_queries(hours_before):
+            with override_settings(REMINDER_HOURS_BEFORE=hours_before):
+                with CaptureQueriesContext(connection) as ctx:
+                    with self.captureOnCommitCallbacks(execute=True):
+                        self.booking(2)
+            return [query["sql"] for query in ctx.captured_queries]
+
+        save_queries(1)  # first save of the day: stats rows created
+        left_to_sweep = save_queries(1)
+        queued_now = save_queries(6)
+        extra = [sql for sql in queued_now if "wash_outboundemail" in sql]
+        self.assertEqual(len(queued_now), len(left_to_sweep) + 1, queued_now)
+        self.assertEqual(len(extra), 1)
+        self.assertTrue(extra[0].startswith("INSERT"))
+
+    def test_claim_batch(self):
+        due = self.queue()
+        self.queue(next_attempt_at=timezone.now() + timezone.timedelta(minutes=5))
+        self.queue(status="sent")
+
+        with CaptureQueriesContext(connection) as ctx:
+            claimed = claim_batch()
+        self.assertEqual(claimed, [due])
+        self.assertTrue(any("SKIP LOCKED" in query["sql"] for query in ctx.captured_queries))
+
+        due.refresh_from_db()
+        self.assertEqual((due.status, due.attempts), ("sending", 1))
+        self.assertIsNotNone(due.locked_at)
+        self.assertEqual(claim_batch(), [])
+
+    def test_stale_sending_rows_are_reclaimed(self):
+        now = timezone.now()
+        stale = self.queue(status="sending", attempts=1, locked_at=now - timezone.timedelta(minutes=11))
+        self.queue(status="sending", attempts=1, locked_at=now - timezone.timedelta(minutes=5))
+
+        self.assertEqual(claim_batch(), [stale])
+        stale.refresh_from_db()
+        self.assertEqual(stale.attempts, 2)
+
+    def test_retry_with_backoff_then_failed(self):
+        email = self.queue()
+        failing = mock.patch(
+            "wash.outbox.send_reminder_emails",
+            side_effect=lambda bookings, **kwargs: [(b, False, "smtp down") for b in bookings],
+        )
+        delays = []
+        with failing:
+            for attempt in (1, 2, 3):
+                before = timezone.now()
+                self.assertEqual(drain_once(), 1)
+                email.refresh_from_db()
+                self.assertEqual((email.attempts, email.last_error), (attempt, "smtp down"))
+                if email.status == "pending":
+                    delays.append(round((email.next_attempt_at - before).total_seconds() / 60))
+                    # not due yet
+                    self.assertEqual(drain_once(), 0)
+                    OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=before)
+
+        self.assertEqual(delays, [1, 2])
+        self.assertEqual(email.status, "failed")
+        self.assertEqual(drain_once(), 0)
+        # the booking can be reminded again by another sender
+        self.assertEqual(Booking.objects.get(pk=email.booking_id).reminder_state, "pending")
+
+    def test_missing_address_fails_at_once(self):
+        user = User.objects.create_user("sans-email", "", "pwd")
+        email = self.queue(Booking.objects.create(user=user, service=self.service, total_price=30))
+        drain_once()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), ("failed", 1, "no-email"))
+
+    def test_sent(self):
+        email = self.queue()
+        self.assertEqual(drain_outbox(), 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, "sent")
+        self.assertIsNotNone(email.sent_at)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Booking.objects.get(pk=email.booking_id).reminder_state, "sent")
+
+    def test_mixed_batch(self):
+        ok, failing = self.queue(), self.queue()
+
+        def send(bookings, **kwargs):
+            return [(b, b.pk != failing.booking_id, "smtp down") for b in bookings]
+
+        with mock.patch("wash.outbox.send_reminder_emails", side_effect=send):
+            self.assertEqual(drain_once(), 2)
+        statuses = dict(OutboundEmail.objects.values_list("pk", "status"))
+        self.assertEqual(statuses, {ok.pk: "sent", failing.pk: "pending"})
+        self.assertEqual(
+            dict(Booking.objects.filter(pk__in=[ok.booking_id, failing.booking_id])
+                 .values_list("pk", "reminder_state")),
+            {ok.booking_id: "sent", failing.booking_id: "pending"},
+        )
+
+    def test_drain_outbox_command(self):
+        for _ in range(3):
+            self.queue()
+        out = StringIO()
+        # one worker: other threads would not see this test's transaction
+        call_command("drain_outbox", workers=1, batch_size=2, stdout=out)
+        self.assertIn("Outbox : 3 email(s) traité(s)", out.getvalue())
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_cancelled_booking_is_skipped(self):
+        email = self.queue(self.booking(status="cancelled"))
+        self.assertEqual(drain_outbox(), 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, "skipped")
+        self.assertEqual(mail.outbox, [])
+
+
+class OutboxSkipLockedTests(TransactionTestCase):
+    """A row locked by another worker is skipped, not waited for."""
+
+    def test_claim_skips_locked_rows(self):
+        user = User.objects.create_user("verrou", "verrou@example.com", "pwd")
+        locked, free = [
+            OutboundEmail.objects.create(
+                booking=Booking.objects.create(user=user, total_price=30)
+            )
+            for _ in range(2)
+        ]
+        holding = threading.Event()
+        release = threading.Event()
+
+        def other_worker():
+            try:
+                with transaction.atomic():
+                    list(OutboundEmail.objects.select_for_update().filter(pk=locked.pk))
+                    holding.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        try:
+            self.assertTrue(holding.wait(10))
+            self.assertEqual([email.pk for email in claim_batch()], [free.pk])
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual([email.pk for email in claim_batch()], [locked.pk])
+
+
+# ============================================================
+#            REMINDER SWEEP
+# ============================================================
+@override_settings(REMINDER_HOURS_BEFORE=6)
+class ReminderSweepTests(TestCase):
+    """One periodic sweep queues the due reminders; no job per booking."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("rappel", "rappel@example.com", "pwd")
+        cls.service = Service.objects.create(name="Lavage", price=30)
+
+    def book(self, hours, **extra):
+        start = timezone.localtime() + timezone.timedelta(hours=hours)
+        return Booking.objects.create(
+            user=self.user, service=self.service, total_price=30,
+            scheduled_date=start.date(), scheduled_time=start.time().replace(microsecond=0),
+            **extra,
+        )
+
+    def queued(self):
+        return set(OutboundEmail.objects.filter(kind="reminder").values_list("booking_id", flat=True))
+
+    def test_sweep_queues_due_bookings_once(self):
+        due = self.book(2)
+        later = self.book(30)
+        self.book(3, status="cancelled")
+        self.book(4, reminder_state="sent")
+        self.book(-1)
+
+        self.assertEqual(enqueue_due_reminders(), 1)
+        self.assertEqual(self.queued(), {due.pk})
+        self.assertEqual(enqueue_due_reminders(), 0)
+
+        # a day later, the other booking has entered the window
+        self.assertEqual(enqueue_due_reminders(now=timezone.now() + timezone.timedelta(hours=26)), 1)
+        self.assertEqual(self.queued(), {due.pk, later.pk})
+
+    def test_moving_a_booking_is_a_field_update(self):
+        jobs = DjangoJob.objects.count()
+        booking = self.book(30)
+        self.assertEqual(enqueue_due_reminders(), 0)
+
+        start = timezone.localtime() + timezone.timedelta(hours=3)
+        booking.scheduled_date, booking.scheduled_time = start.date(), start.time()
+        booking.save()
+        self.assertEqual(DjangoJob.objects.count(), jobs)
+
+        self.assertEqual(enqueue_due_reminders(), 1)
+        self.assertEqual(self.queued(), {booking.pk})
+
+    def test_batches(self):
+        for hours in range(1, 6):
+            self.book(hours)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(enqueue_due_reminders(batch_size=2), 5)
+        # (SELECT + INSERT) x 3 batches
+        self.assertEqual(len(ctx), 6)
+        self.assertEqual(len(self.queued()), 5)
+
+
+class SendRemindersCommandTests(TestCase):
+    """send_reminders: window bounds, skipped bookings, output."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = Service.objects.create(name="Lavage", price=30)
+
+    def tearDown(self):
+        invalidate_service_catalogue(sender=Service)
+
+    def book(self, name, minutes, **extra):
+        start = timezone.localtime() + timezone.timedelta(minutes=minutes)
+        return Booking.objects.create(
+            user=User.objects.create_user(name, f"{name}@example.com", "pwd"),
+            service=self.service, total_price=30,
+            scheduled_date=start.date(), scheduled_time=start.time(),
+            **extra,
+        )
+
+    def run_command(self, **options):
+        out = StringIO()
+        call_command("send_reminders", hours=2, stdout=out, stderr=StringIO(), **options)
+        return out.getvalue().splitlines()
+
+    def test_window_and_skipped_bookings(self):
+        inside = self.book("dedans", 115)
+        self.book("dehors", 125)
+        self.book("passe", -5)
+        self.book("annule", 60, status="cancelled")
+        self.book("deja", 60, reminder_state="sent")
+
+        output = self.run_command(chunk_size=1)
+        self.assertEqual([message.to for message in mail.outbox], [["dedans@example.com"]])
+        self.assertEqual(Booking.objects.get(pk=inside.pk).reminder_state, "sent")
+        self.assertIn("Checked: 1; Rappels envoyés : 1; déjà pris ailleurs : 0", output[-1])
+
+        # already sent: nothing left in the window
+        self.run_command()
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_verbose_prints_one_line_per_booking(self):
+        bookings = [self.book(f"bavard{i}", 30 + i) for i in range(3)]
+        output = self.run_command(verbose=True)
+        sent_lines = [line for line in output if line.startswith("Sent reminder")]
+        self.assertEqual(
+            sent_lines,
+            [f"Sent reminder for booking {b.pk} -> bavard{i}@example.com" for i, b in enumerate(bookings)],
+        )
+
+        Booking.objects.update(reminder_state="pending")
+        output = self.run_command()
+        # the window line and the summary only
+        self.assertEqual(len(output), 2)
+        self.assertTrue(output[-1].startswith("Checked: 3;"))
+
+
+class ReminderClaimTests(TestCase):
+    """A booking's reminder is claimed by one sender at a time."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("claim", "claim@example.com", "pwd")
+        service = Service.objects.create(name="Lavage", price=30)
+        cls.booking = Booking.objects.create(user=user, service=service, total_price=30)
+
+    def test_claim_once(self):
+        self.assertEqual(claim_reminders([self.booking.pk]), {self.booking.pk})
+        self.assertEqual(claim_reminders([self.booking.pk]), set())
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.reminder_state, "sending")
+
+    @override_settings(REMINDER_CLAIM_STALE_SECONDS=60)
+    def test_stale_claim_is_claimable_again(self):
+        Booking.objects.filter(pk=self.booking.pk).update(
+            reminder_state="sending",
+            reminder_claimed_at=timezone.now() - timezone.timedelta(minutes=2),
+        )
+        self.assertEqual(claim_reminders([self.booking.pk]), {self.booking.pk})
+
+    def test_sent_is_never_claimed(self):
+        Booking.objects.filter(pk=self.booking.pk).update(reminder_state="sent")
+        self.assertEqual(claim_reminders([self.booking.pk]), set())
+
+
+# stale outbox rows reclaimed at once: the booking claim alone must hold
+@override_settings(OUTBOX_STALE_SECONDS=0, REMINDER_HOURS_BEFORE=6)
+class ReminderConcurrencyTests(TransactionTestCase):
+    """Outbox workers and send_reminders racing: one email per booking."""
+
+    def tearDown(self):
+        invalidate_service_catalogue(sender=Service)
+
+    def test_concurrent_senders(self):
+        service = Service.objects.create(name="Lavage", price=30)
+        start = timezone.localtime() + timezone.timedelta(hours=2)
+        bookings = 20
+        for i in range(bookings):
+            user = User.objects.create_user(f"client{i}", f"client{i}@example.com", "pwd")
+            # created within the window: queued in the outbox by the signal
+            Booking.objects.create(
+                user=user, service=service, total_price=30,
+                scheduled_date=start.date(), scheduled_time=start.time().replace(microsecond=0),
+            )
+        self.assertEqual(OutboundEmail.objects.count(), bookings)
+
+        senders = 8
+        barrier = threading.Barrier(senders)
+        errors = []
+
+        def sender(i):
+            try:
+                barrier.wait()
+                if i % 2:
+                    drain_outbox(batch_size=3)
+                else:
+                    call_command("send_reminders", hours=6, chunk_size=3, stdout=StringIO())
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=sender, args=(i,)) for i in range(senders)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        recipients = sorted(message.to[0] for message in mail.outbox)
+        self.assertEqual(recipients, sorted(f"client{i}@example.com" for i in range(bookings)))
+        self.assertEqual(Booking.objects.filter(reminder_state="sent").count(), bookings)
+        self.assertFalse(OutboundEmail.objects.filter(status__in=["pending", "sending"]).exists())
+
+
+class ReminderDispatcherTests(TransactionTestCase):
+    """dispatch_reminders: pooled concurrent sends, one email per booking."""
+
+    def tearDown(self):
+        invalidate_service_catalogue(sender=Service)
+
+    def test_dispatch_due_reminders(self):
+        service = Service.objects.create(name="Lavage", price=30)
+        start = timezone.localtime() + timezone.timedelta(hours=3)
+        for i in range(12):
+            user = User.objects.create_user(f"matin{i}", f"matin{i}@site{i % 3}.test", "pwd")
+            Booking.objects.create(
+                user=user, service=service, total_price=30,
+                scheduled_date=start.date(), scheduled_time=start.time().replace(microsecond=0),
+            )
+        # already queued by the signal: the sweep finds nothing more
+        out = StringIO()
+        call_command("dispatch_reminders", concurrency=4, batch_size=5, stdout=out)
+
+        self.assertEqual(len(mail.outbox), 12)
+        self.assertEqual(len({message.to[0] for message in mail.outbox}), 12)
+        self.assertEqual(Booking.objects.filter(reminder_state="sent").count(), 12)
+        self.assertEqual(OutboundEmail.objects.filter(status="sent").count(), 12)
+        self.assertIn("Envoyés : 12 ; échecs : 0", out.getvalue())
+        self.assertIn("Latence : p50", out.getvalue())
+
+
+class DispatchHelpersTests(SimpleTestCase):
+    """Rate limiter and stats of the dispatcher: no database, no real clock."""
+
+    def test_host_rate_limit(self):
+        async def sleeps(hosts):
+            # frozen loop clock, recorded sleeps
+            loop = asyncio.get_running_loop()
+            limiter = HostRateLimiter(20)
+            with mock.patch.object(loop, "time", return_value=100.0), \
+                    mock.patch("wash.dispatch.asyncio.sleep", new_callable=mock.AsyncMock) as sleep:
+                await asyncio.gather(*(limiter.wait(host) for host in hosts))
+            return [call.args[0] for call in sleep.await_args_list]
+
+        same_host = asyncio.run(sleeps(["a.test"] * 5))
+        self.assertEqual([round(delay, 6) for delay in same_host], [0.05, 0.1, 0.15, 0.2])
+        self.assertEqual(asyncio.run(sleeps([f"{i}.test" for i in range(5)])), [])
+
+    def test_stats_report(self):
+        stats = DispatchStats()
+        for ms in (5, 5, 20, 300, 6000):
+            stats.record(ms / 1000, ok=ms < 6000)
+        stats.stop()
+        self.assertEqual((stats.sent, stats.failed), (4, 1))
+        self.assertEqual(stats.percentile(50), 0.02)
+        histogram = dict(stats.histogram())
+        self.assertEqual(histogram["<= 10 ms"], 2)
+        self.assertEqual(histogram["<= 500 ms"], 1)
+        self.assertEqual(histogram["> 5000 ms"], 1)
+
+
+class SchedulerLeaderTests(TestCase):
+    """Only the run_scheduler process holding the advisory lock runs the jobs."""
+
+    def in_other_process(self, func):
+        # another thread = another database connection, like another process
+        result = []
+
+        def worker():
+            try:
+                result.append(func())
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        return result[0]
+
+    def test_ready_does_not_start_the_scheduler(self):
+        self.assertFalse(scheduler.running)
+
+    def test_one_leader_at_a_time(self):
+        self.assertTrue(acquire_leadership())
+        try:
+            self.assertTrue(still_leader())
+            self.assertFalse(self.in_other_process(acquire_leadership))
+            self.assertFalse(self.in_other_process(still_leader))
+        finally:
+            self.assertTrue(release_leadership())
+        self.assertFalse(still_leader())
+
+        # the lock goes with the connection: a standby can take over
+        self.assertTrue(self.in_other_process(acquire_leadership))
+        # (the server drops the lock when its backend exits, just after close)
+        for _ in range(50):
+            if acquire_leadership():
+                break
+            time_module.sleep(0.1)
+        else:
+            self.fail("lock still held after the leader's connection closed")
+        release_leadership()
+
+
+# ============================================================
+#            CALENDAR FEEDS (.ics)
+# ============================================================
+class CalendarFeedTests(TestCase):
+    """Streamed iCalendar feeds, 304 for an unchanged feed after one query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("agenda", "agenda@example.com", "pwd")
+        cls.other = User.objects.create_user("voisin", "voisin@example.com", "pwd")
+        cls.staff = User.objects.create_user("atelier", "atelier@example.com", "pwd", is_staff=True)
+        cls.service = Service.objects.create(name="Lavage, cire; intérieur", price=30, duration_minutes=45)
+        cls.day = timezone.localdate() + timezone.timedelta(days=2)
+        cls.bookings = [
+            Booking.objects.create(
+                user=user, service=cls.service, total_price=30,
+                scheduled_date=cls.day, scheduled_time=time(hour, 0), status=status,
+            )
+            for user, hour, status in [
+                (cls.user, 9, "confirmed"),
+                (cls.user, 11, "pending"),
+                (cls.user, 14, "cancelled"),
+                (cls.other, 10, "confirmed"),
+            ]
+        ]
+
+    def tearDown(self):
+        invalidate_service_catalogue(sender=Service)
+
+    def user_feed_url(self, user=None):
+        return reverse("calendar-user-feed", args=[feed_token(user or self.user)])
+
+    def get_feed(self, url, **headers):
+        response = self.client.get(url, **headers)
+        if response.status_code == 200:
+            self.assertTrue(response.streaming)
+            response.body = b"".join(response.streaming_content)
+        return response
+
+    def test_user_feed(self):
+        response = self.get_feed(self.user_feed_url())
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        self.assertTrue(response.has_header("ETag"))
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        body = response.body
+        self.assertEqual(body.count(b"BEGIN:VEVENT"), 2)
+        self.assertIn(b"STATUS:TENTATIVE", body)
+        self.assertIn("SUMMARY:Carwash - Lavage\\, cire\\; intérieur".encode(), body)
+        self.assertTrue(body.endswith(b"END:VCALENDAR\r\n"))
+        for line in body.split(b"\r\n"):
+            self.assertNotIn(b"\n", line)
+            self.assertLessEqual(len(line), 75)
+
+    def test_unchanged_feed_is_one_query_and_304(self):
+        url = self.user_feed_url()
+        etag = self.get_feed(url)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_etag_ignores_the_catalogue_version(self):
+        # the version key is per process with the local-memory cache
+        url = self.user_feed_url()
+        etag = self.get_feed(url)["ETag"]
+        cache.delete("wash:services:version")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_move_the_etag(self):
+        url = self.user_feed_url()
+        etags = [self.get_feed(url)["ETag"]]
+
+        booking = self.bookings[0]
+        booking.scheduled_time = time(8, 0)
+        booking.save(update_fields=["scheduled_time"])
+        etags.append(self.get_feed(url)["ETag"])
+
+        bulk_transition(Booking.objects.filter(pk=self.bookings[1].pk), "confirmed", ["pending"])
+        etags.append(self.get_feed(url)["ETag"])
+
+        booking.delete()
+        response = self.get_feed(url, HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(response.status_code, 200)
+        etags.append(response["ETag"])
+
+        self.assertEqual(len(set(etags)), 4)
+        self.assertEqual(response.body.count(b"BEGIN:VEVENT"), 1)
+
+    def test_invalid_token(self):
+        url = reverse("calendar-user-feed", args=[f"{self.user.pk}:forged"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_rotated_token_is_revoked(self):
+        old_user_url = self.user_feed_url()
+        old_staff_url = reverse("calendar-staff-feed", args=[feed_token(self.staff), "day"])
+        self.assertEqual(self.get_feed(old_user_url).status_code, 200)
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("calendar-rotate"))
+        self.assertRedirects(response, reverse("bookings-list"))
+        CalendarFeedKey.objects.get(user=self.staff).rotate()
+
+        self.assertEqual(self.client.get(old_user_url).status_code, 404)
+        self.assertEqual(self.client.get(old_staff_url).status_code, 404)
+
+        new_url = self.user_feed_url()
+        self.assertNotEqual(new_url, old_user_url)
+        self.assertEqual(self.get_feed(new_url).body.count(b"BEGIN:VEVENT"), 2)
+        # the bookings page shows the new link
+        self.assertContains(self.client.get(reverse("bookings-list")), new_url)
+
+    def test_staff_feeds(self):
+        url = reverse("calendar-staff-feed", args=[feed_token(self.staff), "day"])
+        body = self.get_feed(url, data={"date": self.day.isoformat()}).body
+        self.assertEqual(body.count(b"BEGIN:VEVENT"), 3)
+        self.assertIn(b"voisin", body)
+
+        url = reverse("calendar-staff-feed", args=[feed_token(self.staff), "week"])
+        body = self.get_feed(url, data={"date": self.day.isoformat()}).body
+        self.assertEqual(body.count(b"BEGIN:VEVENT"), 3)
+
+        # unusable dates fall back to today
+        today = timezone.localdate()
+        for period in ("day", "week"):
+            url = reverse("calendar-staff-feed", args=[feed_token(self.staff), period])
+            for value in ("9999-12-31", "31/12/2026"):
+                response = self.get_feed(url, data={"date": value})
+                self.assertEqual(response.status_code, 200)
+                start = feed_window(period, today)[0].date()
+                self.assertIn(f"{period}-{start.isoformat()}-", response["ETag"])
+
+        # a customer's token gives an empty staff calendar
+        url = reverse("calendar-staff-feed", args=[feed_token(self.user), "day"])
+        body = self.get_feed(url, data={"date": self.day.isoformat()}).body
+        self.assertNotIn(b"BEGIN:VEVENT", body)
+
+    def test_fold_keeps_utf8_characters_whole(self):
+        line = "DESCRIPTION:" + "é" * 100
+        folded = ics.fold(line)
+        parts = folded[:-2].split(b"\r\n ")
+        self.assertTrue(all(len(part) <= 75 for part in parts))
+        self.assertEqual(b"".join(parts).decode("utf-8"), line)
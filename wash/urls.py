@@ -3,7 +3,7 @@
 # ===============================
 from django.urls import path
 
-from wash import views_users
+from wash import views_calendar, views_users
 
 # Views imported 
 from .views import (
@@ -35,6 +35,9 @@ urlpatterns = [
     # Create booking
     path('bookings/new/', BookingCreateView.as_view(), name='bookings-create'),
 
+    # Free slots per day for a service (JSON, booking form)
+    path('bookings/availability/', views.booking_availability, name='bookings-availability'),
+
     # List bookings
     path('bookings/', BookingListView.as_view(), name='bookings-list'),
 
@@ -56,6 +59,14 @@ urlpatterns = [
     path("vehicle/add/", vehicle_create, name="vehicle-create"),  # Duplicate kept intentionally
 
 
+    # ============================
+    #    CALENDAR FEEDS (.ics)
+    # ============================
+    path("calendar/rotate/", views_calendar.rotate_feed_key, name="calendar-rotate"),
+    path("calendar/<str:token>.ics", views_calendar.user_feed, name="calendar-user-feed"),
+    path("calendar/staff/<str:token>/<str:period>.ics", views_calendar.staff_feed, name="calendar-staff-feed"),
+
+
     # ============================
     #    CUSTOM ADMIN DASHBOARD
     # ============================
@@ -88,6 +99,7 @@ urlpatterns = [
     #    BOOKING MANAGEMENT
     # ============================
     path("admin/booking/<int:pk>/done/", views.booking_mark_done, name="booking-done"),
+    path("admin/bookings/bulk-status/", views.booking_bulk_status, name="bookings-bulk-status"),
 
     
 
@@ -1,11 +1,16 @@
 # wash/utils.py
 import os
 import uuid
-from datetime import timezone, timedelta
+from datetime import datetime, timezone
+from smtplib import SMTPServerDisconnected
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template import Context
+from django.template.loader import get_template
+
+from wash import ics
+from wash.catalogue import attach_services
 
 
 OPENAI_KEY = os.environ.get("OPENAI_API_KEY", "")
@@ -32,98 +37,192 @@ def make_cancel_token(booking):
     return uuid.uuid4().hex
 
 
-def _build_ics(booking):
+def _build_ics(booking, stamp=None, domain=None):
     """
     Fichier .ics pour ajouter la réservation au calendrier.
-    Suppose que booking.scheduled_at existe (propriété ou champ).
+    Suppose que booking.scheduled_at est renseigné.
     """
-    start = booking.scheduled_at.astimezone(timezone.utc)
-    end = (booking.scheduled_at + timedelta(
-        minutes=getattr(booking.service, "duration_minutes", 30)
-    )).astimezone(timezone.utc)
-
-    uid = f"booking-{booking.pk}@{settings.DEFAULT_FROM_EMAIL.split('@')[-1]}"
-
-    ics = (
-        "BEGIN:VCALENDAR\n"
-        "VERSION:2.0\n"
-        "PRODID:-//Carwash//EN\n"
-        "BEGIN:VEVENT\n"
-        f"UID:{uid}\n"
-        f"DTSTAMP:{timezone.now().strftime('%Y%m%dT%H%M%SZ')}\n"
-        f"DTSTART:{start.strftime('%Y%m%dT%H%M%SZ')}\n"
-        f"DTEND:{end.strftime('%Y%m%dT%H%M%SZ')}\n"
-        f"SUMMARY:Carwash - {booking.service.name if booking.service else 'Réservation'}\n"
-        f"DESCRIPTION:{booking.service.name if booking.service else ''} — "
-        f"Véhicule: {getattr(booking.vehicle, 'license_plate', '')}\n"
-        "END:VEVENT\n"
-        "END:VCALENDAR\n"
+    stamp = stamp or ics.format_utc(datetime.now(timezone.utc))
+    return (
+        ics.calendar_start()
+        + ics.event(booking, domain or ics.uid_domain(), stamp)
+        + ics.CALENDAR_END
     )
-    return ics.encode("utf-8")
 
 
-def send_reminder_email(booking, dry_run=False):
+REMINDER_TEMPLATES = ("emails/reminder.txt", "emails/reminder.html")
+
+
+def reminder_templates():
+    """
+    Templates compilés (texte, html) du rappel. Le loader « cached » (voir
+    settings.TEMPLATES) les garde par process : pas de relecture disque.
+    """
+    return [get_template(name) for name in REMINDER_TEMPLATES]
+
+
+def iter_reminder_messages(bookings):
+    """
+    Construit les emails de rappel d'un lot : yield (booking, msg, None)
+    ou (booking, None, "no-email"), dans l'ordre.
+
+    Les templates sont récupérés une fois pour tout le lot et rendus avec
+    un seul Context : seules les variables propres à chaque réservation
+    sont empilées (context.push) avant chaque rendu.
+    """
+    bookings = list(bookings)
+    # service lu dans le catalogue en cache (sujet, templates, .ics)
+    attach_services(bookings)
+
+    text_template, html_template = reminder_templates()
+
+    site = getattr(settings, "SITE_URL", "http://127.0.0.1:8000").rstrip("/")
+    support_email = getattr(settings, "SUPPORT_EMAIL", "carwashnotifications2@gmail.com")
+    default_from = getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@carwash.test")
+    from_email = f"CarWash <{default_from}>"
+    reply_to = getattr(settings, "SUPPORT_EMAIL", None)
+    stamp = ics.format_utc(datetime.now(timezone.utc))
+    domain = ics.uid_domain()
+
+    # même contexte que render_to_string(name, dict) : Context simple,
+    # autoescape du moteur
+    context = Context(
+        {"support_email": support_email},
+        autoescape=text_template.backend.engine.autoescape,
+    )
+
+    for booking in bookings:
+        user = booking.user
+        to_email = get_user_email(user)
+        if not to_email:
+            yield booking, None, "no-email"
+            continue
+
+        with context.push(
+            user=user,
+            booking=booking,
+            detail_url=f"{site}/bookings/{booking.pk}/",
+            cancel_url=f"{site}/bookings/{booking.pk}/cancel/",
+        ):
+            text_body = text_template.template.render(context)
+            html_body = html_template.template.render(context)
+
+        subject = f"Rappel : Réservation #{booking.pk} — {booking.service.name if booking.service else ''}"
+        msg = EmailMultiAlternatives(subject, text_body, from_email, [to_email])
+
+        if reply_to:
+            msg.reply_to = [reply_to]
+
+        msg.extra_headers = {
+            "List-Unsubscribe": f"<{site}/unsubscribe/>",
+            "X-Entity-Ref-ID": f"booking-{booking.pk}",
+        }
+
+        msg.attach_alternative(html_body, "text/html")
+
+        # attacher .ics uniquement si booking.scheduled_at est renseigné
+        if booking.scheduled_at:
+            try:
+                msg.attach(
+                    f"reservation-{booking.pk}.ics",
+                    _build_ics(booking, stamp, domain),
+                    "text/calendar",
+                )
+            except Exception:
+                # en dev, on ignore gentiment si ça casse
+                pass
+
+        yield booking, msg, None
+
+
+def build_reminder_message(booking):
     """
-    Envoie un email de rappel stylé (HTML + texte + .ics).
+    Construit l'email de rappel stylé (HTML + texte + .ics).
     Utilise les templates:
       - templates/emails/reminder.txt
       - templates/emails/reminder.html
+    Retourne (msg, None) ou (None, "no-email").
     """
-    user = booking.user
-    to_email = get_user_email(user)
-    if not to_email:
-        return False, "no-email"
+    _, msg, error = next(iter_reminder_messages([booking]))
+    return msg, error
 
-    site = getattr(settings, "SITE_URL", "http://127.0.0.1:8000").rstrip("/")
-    detail_url = f"{site}/bookings/{booking.pk}/"
-    cancel_url = f"{site}/bookings/{booking.pk}/cancel/"
 
-    ctx = {
-        "user": user,
-        "booking": booking,
-        "detail_url": detail_url,
-        "cancel_url": cancel_url,
-        "support_email": getattr(settings, "SUPPORT_EMAIL", "carwashnotifications2@gmail.com"),
-    }
+def send_reminder_emails(bookings, dry_run=False, connection=None, reconnect_every=None):
+    """
+    Envoie les rappels d'un lot de réservations sur une seule connexion SMTP.
 
-    subject = f"Rappel : Réservation #{booking.pk} — {booking.service.name if booking.service else ''}"
-    text_body = render_to_string("emails/reminder.txt", ctx)
-    html_body = render_to_string("emails/reminder.html", ctx)
+    - la connexion est réouverte tous les `reconnect_every` envois
+      (settings.REMINDER_SMTP_MESSAGES_PER_CONNECTION par défaut)
+      et après une erreur ; le message est retenté une fois sur la
+      nouvelle connexion si l'erreur est une connexion impossible ou
+      coupée (SMTPServerDisconnected), jamais après un refus du serveur
+    - si `connection` est fourni, l'appelant le garde ouvert/le ferme
 
-    default_from = getattr(settings, "DEFAULT_FROM_EMAIL", "no-reply@carwash.test")
-    from_email = f"CarWash <{default_from}>"
+    Retourne une liste [(booking, ok, error), ...] dans l'ordre d'entrée.
+    """
+    if reconnect_every is None:
+        reconnect_every = getattr(settings, "REMINDER_SMTP_MESSAGES_PER_CONNECTION", 100)
 
-    msg = EmailMultiAlternatives(subject, text_body, from_email, [to_email])
+    owns_connection = connection is None
+    if owns_connection and not dry_run:
+        connection = get_connection(fail_silently=False)
 
-    reply_to = getattr(settings, "SUPPORT_EMAIL", None)
-    if reply_to:
-        msg.reply_to = [reply_to]
-
-    msg.extra_headers = {
-        "List-Unsubscribe": f"<{site}/unsubscribe/>",
-        "X-Entity-Ref-ID": f"booking-{booking.pk}",
-    }
-
-    msg.attach_alternative(html_body, "text/html")
-
-    # attacher .ics uniquement si booking.scheduled_at existe
-    if hasattr(booking, "scheduled_at"):
-        try:
-            msg.attach(
-                f"reservation-{booking.pk}.ics",
-                _build_ics(booking),
-                "text/calendar",
-            )
-        except Exception:
-            # en dev, on ignore gentiment si ça casse
-            pass
-
-    if dry_run:
-        print("[dry-run] would send to", to_email, "subject:", subject)
-        return True, "dry-run"
+    results = []
+    sent_on_connection = 0
 
     try:
-        sent = msg.send(fail_silently=False)
-        return bool(sent), None
-    except Exception as e:
-        return False, str(e)
+        for booking, msg, error in iter_reminder_messages(bookings):
+            if msg is None:
+                results.append((booking, False, error))
+                continue
+
+            if dry_run:
+                print("[dry-run] would send to", msg.to[0], "subject:", msg.subject)
+                results.append((booking, True, "dry-run"))
+                continue
+
+            if reconnect_every and sent_on_connection >= reconnect_every:
+                connection.close()
+                sent_on_connection = 0
+
+            msg.connection = connection
+            for attempt in (1, 2):
+                # ouverture explicite : sinon le backend SMTP ouvre et
+                # ferme une connexion pour chaque message
+                try:
+                    connection.open()
+                except OSError as e:
+                    # pas de connexion : rien n'est parti
+                    error, retry = e, True
+                else:
+                    try:
+                        sent = msg.send(fail_silently=False)
+                        sent_on_connection += 1
+                        results.append((booking, bool(sent), None))
+                        break
+                    except Exception as e:
+                        # seule une connexion coupée justifie un second
+                        # essai ; un refus (destinataire, contenu...) ou une
+                        # erreur en cours de DATA risquerait un doublon
+                        error, retry = e, isinstance(e, SMTPServerDisconnected)
+
+                # état de la connexion inconnu : on repart d'une neuve
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+                sent_on_connection = 0
+                if not retry or attempt == 2:
+                    results.append((booking, False, str(error)))
+                    break
+    finally:
+        if owns_connection and connection is not None:
+            connection.close()
+
+    return results
+
+
+def send_reminder_email(booking, dry_run=False):
+    """Envoie le rappel d'une seule réservation ; retourne (ok, error)."""
+    _, ok, error = send_reminder_emails([booking], dry_run=dry_run)[0]
+    return ok, error
@@ -1,20 +1,30 @@
 # wash/views.py
+import calendar
+from datetime import date
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views import View
 from django.views.generic import ListView, CreateView, DetailView, UpdateView
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.utils import timezone
 from django.views.decorators.http import require_POST
-from django.http import HttpResponseForbidden
+from django.http import HttpResponseForbidden, JsonResponse
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.db.models import Sum, Count, Q
+from django.core.exceptions import ValidationError
+from django.db.models import Sum, Q
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
-from django.db.models.functions import TruncDate
 
-from .models import Service, Booking, Vehicle
+from .models import Service, Booking, Vehicle, BookingDailyStats, UserBookingStats, normalize_plate
 from .forms import BookingForm, VehicleForm
+from .availability import free_slots, slot_minutes
+from .capacity import reserve
+from .catalogue import get_service, get_services
+from .dashboard import home_context
+from .pagination import keyset_paginate, page_query
+from .views_calendar import feed_urls
+from .pipeline import bulk_transition
 
 from django.views.generic import UpdateView
 
@@ -23,49 +33,85 @@ from django.contrib.auth.decorators import user_passes_test
 from django.views.decorators.http import require_POST
 
 
-@user_passes_test(lambda u: u.is_staff)
-def admin_dashboard(request):
+# recherche : au plus ce nombre d'utilisateurs / véhicules / services retenus
+SEARCH_MATCH_LIMIT = 500
 
-    # -------------------------------
-    #      GLOBAL STATISTICS
-    # -------------------------------
 
+def booking_search_q(query):
+    """
+    Filtre de recherche du dashboard, servi par des index :
+    - nombre : id exact (clé primaire)
+    - username : préfixe, insensible à la casse (index sur
+      UPPER(auth_user.username), migration 0023)
+    - plaque : préfixe de la plaque normalisée (vehicle_plate_prefix_idx)
+    - service : préfixe, insensible à la casse (petite table)
+
+    Les ids correspondants sont résolus d'abord, puis la réservation est
+    filtrée sur ses clés étrangères indexées (BitmapOr côté PostgreSQL).
+    """
+    query = query.strip()
+    q = Q(pk__in=[])
 
-    # Total bookings except cancelled ones
-    total_bookings = Booking.objects.exclude(
-        status="cancelled"
-    ).count()
+    # isdigit() accepte aussi des chiffres non ASCII ("²", "①") que int() refuse
+    if query.isascii() and query.isdigit():
+        q |= Q(pk=int(query))
 
-    #  Bookings CREATED today
-    created_today = (
-        Booking.objects
-        .filter(created_at__date=timezone.now().date())
-        .exclude(status="cancelled")
-        .count()
+    user_ids = list(
+        User.objects.filter(username__istartswith=query)
+        .values_list("id", flat=True)[:SEARCH_MATCH_LIMIT]
     )
+    if user_ids:
+        q |= Q(user_id__in=user_ids)
+
+    plate = normalize_plate(query)
+    if plate:
+        vehicle_ids = list(
+            Vehicle.objects.filter(plate_normalized__startswith=plate)
+            .values_list("id", flat=True)[:SEARCH_MATCH_LIMIT]
+        )
+        if vehicle_ids:
+            q |= Q(vehicle_id__in=vehicle_ids)
 
-    #  Bookings SCHEDULED for today
-    scheduled_today = (
-        Booking.objects
-        .filter(scheduled_date=timezone.now().date())
-        .exclude(status="cancelled")
-        .count()
+    service_ids = list(
+        Service.objects.filter(name__istartswith=query)
+        .values_list("id", flat=True)[:SEARCH_MATCH_LIMIT]
     )
+    if service_ids:
+        q |= Q(service_id__in=service_ids)
 
+    return q
 
-    # Total registered users
-    total_users = User.objects.count()
 
-    #  TOTAL REVENUE
-    # We sum total_price ONLY for confirmed or done bookings
-    # Cancelled bookings are ignored automatically
-    total_revenue = (
-        Booking.objects
-        .filter(status="done")
-        .aggregate(total=Sum("total_price"))["total"]
-        or 0
+@user_passes_test(lambda u: u.is_staff)
+def admin_dashboard(request):
+
+    # -------------------------------
+    #      GLOBAL STATISTICS
+    # -------------------------------
+    # Every booking figure comes from the BookingDailyStats rollup
+    # (wash/stats.py) so the cost stays flat as history grows.
+    today = timezone.localdate()
+    active_stats = BookingDailyStats.objects.exclude(status="cancelled")
+
+    totals = BookingDailyStats.objects.aggregate(
+        # Total bookings except cancelled ones
+        total_bookings=Sum("created_count", filter=~Q(status="cancelled")),
+        #  Bookings CREATED today
+        created_today=Sum("created_count", filter=Q(day=today) & ~Q(status="cancelled")),
+        #  Bookings SCHEDULED for today
+        scheduled_today=Sum("scheduled_count", filter=Q(day=today) & ~Q(status="cancelled")),
+        #  TOTAL REVENUE — done bookings only
+        total_revenue=Sum("revenue", filter=Q(status="done")),
     )
 
+    total_bookings = totals["total_bookings"] or 0
+    created_today = totals["created_today"] or 0
+    scheduled_today = totals["scheduled_today"] or 0
+    total_revenue = totals["total_revenue"] or 0
+
+    # Total registered users
+    total_users = User.objects.count()
+
 
     # -------------------------------
     #           FILTERS
@@ -80,16 +126,13 @@ def admin_dashboard(request):
     search_query = request.GET.get("search", "")
 
     # Base queryset: all non-cancelled bookings
-    latest_bookings = Booking.objects.exclude(status="cancelled")
+    latest_bookings = Booking.objects.exclude(status="cancelled").select_related(
+        "user", "service", "vehicle"
+    )
 
     # Apply search if provided
     if search_query:
-        latest_bookings = latest_bookings.filter(
-            Q(id__icontains=search_query) |
-            Q(user__username__icontains=search_query) |
-            Q(service__name__istartswith=search_query) |
-            Q(vehicle__license_plate__icontains=search_query)
-        )
+        latest_bookings = latest_bookings.filter(booking_search_q(search_query))
 
     # Apply status filter
     if status_filter:
@@ -103,25 +146,22 @@ def admin_dashboard(request):
     if date_filter:
         latest_bookings = latest_bookings.filter(scheduled_date=date_filter)
 
-    # Limit results for performance
-    latest_bookings = latest_bookings.order_by("-created_at")[:20]
+    # One keyset page (?cursor=...) — deep pages cost the same as the first
+    bookings_page = keyset_paginate(latest_bookings, request.GET.get("cursor"))
+    latest_bookings = bookings_page.object_list
 
-    # All services (for dropdown filters)
-    services = Service.objects.all()
+    # All services (for dropdown filters), from the cached catalogue
+    services = get_services()
 
     # -------------------------------
     #     📊 CHART — BOOKINGS PER DAY
     # -------------------------------
     last_days = (
-        Booking.objects
-        .exclude(status="cancelled")
-        .filter(
-            created_at__date__gte=timezone.now().date()
-            - timezone.timedelta(days=7)
-        )
-        .annotate(day=TruncDate("created_at"))
+        active_stats
+        .filter(day__gte=today - timezone.timedelta(days=7), day__lte=today)
         .values("day")
-        .annotate(count=Count("id"))
+        .annotate(count=Sum("created_count"))
+        .filter(count__gt=0)
         .order_by("day")
     )
 
@@ -132,11 +172,11 @@ def admin_dashboard(request):
     #     📊 CHART — SERVICES USAGE
     # -------------------------------
     service_stats = (
-        Booking.objects
-        .exclude(status="cancelled")
+        active_stats
         .filter(service__isnull=False)
         .values("service__name")
-        .annotate(count=Count("id"))
+        .annotate(count=Sum("created_count"))
+        .filter(count__gt=0)
         .order_by("-count")
     )
 
@@ -147,16 +187,14 @@ def admin_dashboard(request):
     #     📊 CHART — TOP CLIENTS
     # -------------------------------
     top_clients = (
-        Booking.objects
-        .exclude(status="cancelled")
-        .filter(user__isnull=False)
-        .values("user__username")
-        .annotate(total=Count("id"))
-        .order_by("-total")[:5]
+        UserBookingStats.objects
+        .filter(total_bookings__gt=0)
+        .order_by("-total_bookings")
+        .values("user__username", "total_bookings")[:5]
     )
 
     top_client_names = [c["user__username"] for c in top_clients]
-    top_client_counts = [c["total"] for c in top_clients]
+    top_client_counts = [c["total_bookings"] for c in top_clients]
 
     # -------------------------------
     #     SEND DATA TO TEMPLATE
@@ -169,6 +207,9 @@ def admin_dashboard(request):
         "total_revenue": total_revenue,
 
         "latest_bookings": latest_bookings,
+        "bookings_page": bookings_page,
+        "next_page_query": page_query(request, bookings_page.next_cursor),
+        "first_page_query": page_query(request, None),
 
         "days": days,
         "reservations_count": reservations_count,
@@ -184,6 +225,8 @@ def admin_dashboard(request):
 
         "top_client_names": top_client_names,
         "top_client_counts": top_client_counts,
+
+        "calendar_urls": feed_urls(request, request.user),
     })
 
 # ============================================================
@@ -199,6 +242,54 @@ def booking_mark_done(request, pk):
     booking.save(update_fields=["status"])
     messages.success(request, "Réservation marquée comme terminée ✅")
     return redirect("admin-dashboard")
+
+
+# statut cible -> statuts de départ autorisés
+BULK_TRANSITIONS = {
+    "done": ["pending", "confirmed"],
+    "confirmed": ["pending"],
+    "cancelled": ["pending", "confirmed"],
+}
+
+
+@user_passes_test(lambda u: u.is_staff)
+@require_POST
+def booking_bulk_status(request):
+    """
+    Change le statut de plusieurs réservations en une seule transaction
+    (fin de service : « tout marquer comme terminé »).
+
+    POST booking_ids=1&booking_ids=2... (ou "1,2,3") et status (défaut : done).
+    Répond en JSON si le client le demande, sinon redirige vers le dashboard.
+    """
+    status = request.POST.get("status", "done")
+    if status not in BULK_TRANSITIONS:
+        return JsonResponse({"error": f"Statut invalide : {status}"}, status=400)
+
+    try:
+        booking_ids = {
+            int(value)
+            for raw in request.POST.getlist("booking_ids")
+            for value in raw.split(",")
+            if value.strip()
+        }
+    except ValueError:
+        return JsonResponse({"error": "booking_ids invalides"}, status=400)
+
+    changed = bulk_transition(
+        Booking.objects.filter(pk__in=booking_ids), status, BULK_TRANSITIONS[status]
+    ) if booking_ids else []
+    changed_ids = sorted(booking.pk for booking in changed)
+
+    if "application/json" in request.headers.get("Accept", ""):
+        return JsonResponse({
+            "status": status,
+            "updated": changed_ids,
+            "skipped": sorted(booking_ids - set(changed_ids)),
+        })
+
+    messages.success(request, f"{len(changed_ids)} réservation(s) passée(s) à « {status} » ✅")
+    return redirect("admin-dashboard")
 # ============================================================
 #                    HOME / USER DASHBOARD
 # ============================================================
@@ -208,44 +299,8 @@ def home(request):
     if request.user.is_staff:
         return admin_dashboard(request)
 
-    user = request.user
-    bookings = Booking.objects.filter(user=user)
-
-    bookings_count = bookings.exclude(status="cancelled").count()
-    vehicles_count = Vehicle.objects.filter(owner=user).count()
-
-    # ✅ user revenue
-    total_spent = (
-        Booking.objects
-        .filter(user=request.user, status="done")
-        .aggregate(total=Sum("total_price"))["total"]
-        or 0
-    )
-
-
-    next_booking = (
-        bookings
-        .exclude(status="cancelled")
-        .filter(scheduled_date__gte=timezone.now().date())
-        .order_by("scheduled_date")
-        .first()
-    )
-
-    service_usage = (
-        bookings
-        .exclude(status="cancelled")
-        .values("service__name")
-        .annotate(count=Count("id"))
-        .order_by("-count")
-    )
-
-    return render(request, "wash/home.html", {
-        "bookings_count": bookings_count,
-        "vehicles_count": vehicles_count,
-        "total_spent": total_spent,
-        "next_booking": next_booking,
-        "service_usage": service_usage,
-    })
+    # contexte mis en cache par utilisateur (wash/dashboard.py)
+    return render(request, "wash/home.html", home_context(request.user))
 
 
 # ============================================================
@@ -255,6 +310,9 @@ class ServiceListView(ListView):
     model = Service
     template_name = "wash/service_list.html"
 
+    def get_queryset(self):
+        return get_services()
+
 
 class ServiceCreateView(LoginRequiredMixin, CreateView):
     model = Service
@@ -294,13 +352,70 @@ class BookingCreateView(LoginRequiredMixin, CreateView):
         if booking.service and booking.service.price is not None:
             booking.total_price = booking.service.price
 
-        booking.save()
+        # créneau vérifié (heures d'ouverture, baies libres) et réservé
+        # atomiquement
+        try:
+            reserve(booking)
+        except ValidationError as error:
+            form.add_error(None, error)
+            return self.form_invalid(form)
         form.save_m2m()
 
+        self.object = booking
         messages.success(self.request, "Réservation créée.")
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
+
 
 
+# jours couverts au plus par une requête de disponibilités (vue mois)
+AVAILABILITY_MAX_DAYS = 62
+
+
+@login_required
+def booking_availability(request):
+    """
+    Créneaux libres par jour pour un service (JSON), pour le formulaire de
+    réservation.
+
+    GET ?service=<id>&start=YYYY-MM-DD&days=N   (défaut : aujourd'hui, 1 jour)
+    GET ?service=<id>&month=YYYY-MM
+    """
+    service = get_service(request.GET.get("service"))
+    if service is None:
+        return JsonResponse({"error": "Service inconnu"}, status=400)
+
+    try:
+        if request.GET.get("month"):
+            start = date.fromisoformat(request.GET["month"] + "-01")
+            days_count = calendar.monthrange(start.year, start.month)[1]
+        else:
+            start = (
+                date.fromisoformat(request.GET["start"]) if request.GET.get("start")
+                else timezone.localdate()
+            )
+            days_count = int(request.GET.get("days", 1))
+    except ValueError:
+        return JsonResponse({"error": "Date ou nombre de jours invalide"}, status=400)
+
+    if not 1 <= days_count <= AVAILABILITY_MAX_DAYS:
+        return JsonResponse(
+            {"error": f"days doit être entre 1 et {AVAILABILITY_MAX_DAYS}"}, status=400
+        )
+
+    try:
+        days = [start + timezone.timedelta(days=i) for i in range(days_count)]
+    except OverflowError:
+        # start proche de date.max : la période dépasse l'an 9999
+        return JsonResponse({"error": "Date ou nombre de jours invalide"}, status=400)
+    slots = free_slots(service, days)
+
+    return JsonResponse({
+        "service": service.pk,
+        "duration_minutes": service.duration_minutes,
+        "slot_minutes": slot_minutes(),
+        "days": {day.isoformat(): times for day, times in slots.items()},
+    })
+
 
 class BookingListView(LoginRequiredMixin, ListView):
     model = Booking
@@ -315,6 +430,15 @@ class BookingListView(LoginRequiredMixin, ListView):
             return qs.order_by('-created_at')
         return qs.order_by('-pk')
 
+    def get_context_data(self, **kwargs):
+        # keyset page (?cursor=...) on (created_at, id)
+        page = keyset_paginate(self.object_list, self.request.GET.get("cursor"))
+        context = super().get_context_data(object_list=page.object_list, **kwargs)
+        context["page"] = page
+        context["next_page_query"] = page_query(self.request, page.next_cursor)
+        context["calendar_urls"] = feed_urls(self.request, self.request.user)
+        return context
+
 
 class BookingDetailView(LoginRequiredMixin, DetailView):
     model = Booking
@@ -370,8 +494,14 @@ class BookingUpdateView(LoginRequiredMixin, UpdateView):
     def form_valid(self, form):
         obj = form.save(commit=False)
         obj.user = self.request.user
-        obj.save()
-        return super().form_valid(form)
+        try:
+            reserve(obj)
+        except ValidationError as error:
+            form.add_error(None, error)
+            return self.form_invalid(form)
+
+        self.object = obj
+        return redirect(self.get_success_url())
 
 
 # ============================================================
@@ -0,0 +1,223 @@
+# wash/views_calendar.py
+"""
+=============================================================================
+CALENDAR FEEDS (.ics subscriptions)
+=============================================================================
+
+Calendar apps (Google Agenda, Outlook, iPhone...) subscribe to a URL and
+poll it every few minutes, without a session: the URL carries a signed
+token (feed_token(user): the user id and the user's CalendarFeedKey,
+signed with SECRET_KEY).
+
+A leaked link is revoked by rotating the key ("Régénérer le lien" on the
+bookings page, rotate_feed_key): every token signed with the old key then
+answers 404, and feed_urls() gives the new links.
+
+    /calendar/<token>.ics                        a customer's bookings
+    /calendar/staff/<token>/day.ics[?date=...]   every booking of the day
+    /calendar/staff/<token>/week.ics[?date=...]  ... of the week (Mon-Sun)
+
+Cancelled bookings are left out. A token whose user was deactivated (or
+lost staff rights, for the staff feeds) gets an empty calendar: the check
+is part of the feed query.
+
+CONDITIONAL GET:
+----------------
+One query checks the token's key and gives the number of bookings in the
+feed and their latest updated_at. With the feed window they make the ETag; updated_at is
+the Last-Modified. Only database state goes into the ETag, so every worker
+gives the same one for the same feed. An unchanged feed answers 304 after
+that single query.
+
+The ETag only follows the bookings themselves. Renaming a service,
+changing a vehicle's plate or a customer's name (SUMMARY / DESCRIPTION)
+does not touch booking.updated_at: clients keep their copy until one of
+the feed's bookings changes.
+
+Otherwise the calendar is streamed (StreamingHttpResponse over
+.iterator()), one event at a time. Each event's DTSTAMP is its
+updated_at, so the same state always gives the same bytes.
+
+=============================================================================
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db.models import Exists, F, Func, Subquery
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_POST
+
+from . import ics
+from .models import Booking, CalendarFeedKey
+
+FEED_SALT = "wash.calendar"
+
+
+def feed_token(user):
+    """Token of `user`'s calendar URLs (valid until the key is rotated)."""
+    feed_key, _ = CalendarFeedKey.objects.get_or_create(user=user)
+    return signing.Signer(salt=FEED_SALT).sign(f"{user.pk}:{feed_key.key}")
+
+
+def token_identity(token):
+    """(user id, feed key) signed in `token`; Http404 if forged."""
+    try:
+        user_id, key = signing.Signer(salt=FEED_SALT).unsign(token).split(":")
+        return int(user_id), key
+    except (signing.BadSignature, ValueError):
+        raise Http404("Lien de calendrier invalide")
+
+
+def feed_state(identity, bookings):
+    """
+    (number of bookings, latest updated_at or None), in the same query as
+    the key check: Http404 if the token's key was rotated.
+    """
+    user_id, key = identity
+    bookings = bookings.order_by()
+    state = (
+        CalendarFeedKey.objects
+        .filter(user_id=user_id, key=key)
+        .values(
+            count=Subquery(bookings.annotate(n=Func(F("pk"), function="COUNT")).values("n")),
+            last=Subquery(bookings.annotate(m=Func(F("updated_at"), function="MAX")).values("m")),
+        )
+        .first()
+    )
+    if state is None:
+        raise Http404("Lien de calendrier révoqué")
+    return state["count"], state["last"]
+
+
+def stream_calendar(bookings, name, summary=None):
+    """The calendar as bytes chunks: header, one chunk per event, footer."""
+    domain = ics.uid_domain()
+    site = getattr(settings, "SITE_URL", "http://127.0.0.1:8000").rstrip("/")
+
+    yield ics.calendar_start(name)
+    for booking in bookings.order_by("scheduled_at", "pk").iterator(chunk_size=500):
+        yield ics.event(
+            booking,
+            domain,
+            stamp=ics.format_utc(booking.updated_at),
+            summary=summary(booking) if summary else None,
+            url=f"{site}/bookings/{booking.pk}/",
+            last_modified=booking.updated_at,
+        )
+    yield ics.CALENDAR_END
+
+
+def feed_response(request, identity, bookings, name, window="", summary=None):
+    """304 if the client's copy is current, else the streamed calendar."""
+    count, last = feed_state(identity, bookings)
+    version = int(last.timestamp() * 1_000_000) if last else 0
+    etag = quote_etag(f"{window}{count}-{version}")
+    last_modified = int(last.timestamp()) if last else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = StreamingHttpResponse(
+            stream_calendar(bookings, name, summary),
+            content_type="text/calendar; charset=utf-8",
+        )
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def feed_bookings():
+    return (
+        Booking.objects
+        .filter(scheduled_at__isnull=False)
+        .exclude(status="cancelled")
+        .select_related("service", "vehicle")
+    )
+
+
+# ================================
+#       CUSTOMER FEED
+# ================================
+def user_feed(request, token):
+    identity = token_identity(token)
+    bookings = feed_bookings().filter(user_id=identity[0], user__is_active=True)
+    return feed_response(request, identity, bookings, "Carwash - mes réservations")
+
+
+# ================================
+#       STAFF FEEDS
+# ================================
+def feed_window(period, day):
+    """(start, end) aware datetimes of the day, or of the week of `day`."""
+    if period == "week":
+        day -= timedelta(days=day.weekday())
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(
+        datetime.combine(day + timedelta(days=7 if period == "week" else 1), time.min)
+    )
+    return start, end
+
+
+def staff_feed(request, token, period):
+    if period not in ("day", "week"):
+        raise Http404
+    identity = token_identity(token)
+
+    try:
+        start, end = feed_window(period, date.fromisoformat(request.GET["date"]))
+    except (KeyError, ValueError, OverflowError):
+        # no date, not a date, or a window past date.max: today
+        start, end = feed_window(period, timezone.localdate())
+
+    staff = User.objects.filter(pk=identity[0], is_staff=True, is_active=True)
+    bookings = (
+        feed_bookings()
+        .filter(Exists(staff), scheduled_at__gte=start, scheduled_at__lt=end)
+        .select_related("user")
+    )
+    label = "semaine du" if period == "week" else "journée du"
+    return feed_response(
+        request,
+        identity,
+        bookings,
+        f"Carwash - {label} {start.strftime('%d/%m/%Y')}",
+        window=f"{period}-{start.date().isoformat()}-",
+        summary=lambda booking: (
+            f"{booking.service.name if booking.service else 'Réservation'}"
+            f" - {booking.user.get_full_name() or booking.user.username}"
+        ),
+    )
+
+
+def feed_urls(request, user):
+    """Absolute calendar URLs of `user`, for the subscription links."""
+    token = feed_token(user)
+    urls = {"mine": request.build_absolute_uri(reverse("calendar-user-feed", args=[token]))}
+    if user.is_staff:
+        for period in ("day", "week"):
+            urls[period] = request.build_absolute_uri(
+                reverse("calendar-staff-feed", args=[token, period])
+            )
+    return urls
+
+
+@login_required
+@require_POST
+def rotate_feed_key(request):
+    """New calendar key for the user: the links given so far stop working."""
+    feed_key, _ = CalendarFeedKey.objects.get_or_create(user=request.user)
+    feed_key.rotate()
+    messages.success(
+        request,
+        "Nouveau lien de calendrier : remplacez l'ancien dans votre agenda.",
+    )
+    return redirect("bookings-list")
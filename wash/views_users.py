@@ -3,8 +3,10 @@ from django.contrib.auth.models import User
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import user_passes_test, login_required
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Q, F, Value
+from django.db.models.functions import Coalesce
 from .models import Booking
+from .pagination import keyset_paginate, page_query
 
 
 # Only staff users can access user management
@@ -19,8 +21,10 @@ def admin_only(view):
 def users_list(request):
     search = request.GET.get("search", "")
 
+    # compteur maintenu dans UserBookingStats : réservations NON annulées
+    # (l'ancien Count("booking") comptait aussi les annulées)
     users = User.objects.annotate(
-        total_bookings=Count("booking")
+        active_bookings=Coalesce(F("booking_stats__total_bookings"), Value(0))
     )
 
     if search:
@@ -41,11 +45,16 @@ def users_list(request):
 @admin_only
 def user_detail(request, user_id):
     user = get_object_or_404(User, id=user_id)
-    bookings = Booking.objects.filter(user=user)
+    # une page à la fois (?cursor=...), index booking_user_created_idx
+    bookings = keyset_paginate(
+        Booking.objects.filter(user=user).select_related("service"),
+        request.GET.get("cursor"),
+    )
 
     return render(request, "wash/user_detail.html", {
         "user_obj": user,
-        "bookings": bookings
+        "bookings": bookings,
+        "next_page_query": page_query(request, bookings.next_cursor),
     })
 
 